@@ -7,13 +7,27 @@ import warnings
 warnings.filterwarnings('ignore', message='numpy.dtype size changed')
 warnings.filterwarnings('ignore', message='numpy.ufunc size changed')
 
-config      =   None
 logger      =   None
 
 __version__ =   '0.1.0'
 
-# Define global variables
-data        =   {}
+# Attributes of the default runtime formerly kept as module globals (see __getattr__())
+runtime_attributes  =   [ 'config', 'data', 'references' ]
+
+# Explicit dtypes of reference data files (nullable Int64 where values may be missing)
+datafile_dtypes     =   {   'providers':    {   'provider_id':              'int32',
+                                                'provider_name':            'category',
+                                                'symbolized_name':          'category',
+                                                'sim_operator_code':        'Int64'     },
+                            'handsets':     {   'provider_id':              'int32',
+                                                'device_id':                'int32',
+                                                'device_manufacturer':      'category',
+                                                'device_model':             'category',
+                                                'device_marketing_name':    'category',
+                                                'device_code':              'category'  }   }
+
+# Reference data columns with lowercased copies (suffixed '_lower') precomputed for lookups
+datafile_lowercase  =   {   'handsets':     [ 'device_model', 'device_marketing_name', 'device_code' ]  }
 
 
 def set_logging_level(verbose=False):
@@ -27,115 +41,63 @@ def set_logging_level(verbose=False):
     logger.info('set logging level (verbose:%s) -- %s', verbose, logger.getEffectiveLevel())
 
 
-def init_load_config(filename='conf/config.yml'):
-    import os, sys, logging
-    import yaml
-    from pkg_resources import resource_string, resource_exists, resource_stream
+def get_runtime():
+    """
+    Returns process-wide default Runtime owning configuration, logging and reference data
+    """
+    from mba2mfii.runtime import Runtime
+    return Runtime.get_default()
 
-    global config
-    logger = logging.getLogger(__name__)
 
-    if resource_exists(__name__, filename):
-        logger.info('initializing package configuration (file:%s)', filename)
-        config = yaml.safe_load(resource_string(__name__, filename))
-        logger.debug('initialized package configuration:%s', config)
-    else:
-        raise ValueError('missing config file:%s' % filename)
+def __getattr__(name):
+    """
+    Returns configuration and reference data of the default runtime as mba2mfii.config, mba2mfii.data and
+    mba2mfii.references (Python 3.7+), read from the runtime rather than copied into module globals
+    """
+    if name in runtime_attributes:
+        return getattr(get_runtime(), name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
 
 
-def init_load_logging(filename='conf/logging.yml', logpath='logs'):
-    import os, sys, logging
-    import logging.config
-    import yaml
-    from pkg_resources import resource_string, resource_exists, resource_stream, resource_filename
+def init_load_config(filename='conf/config.yml'):
+    get_runtime().load_config(filename, reload=True)
 
-    logger = logging.getLogger(__name__)
 
-    if resource_exists(__name__, filename):
-        logger.info('initializing logging configuration (file:%s)', filename)
-        logging_config = yaml.safe_load(resource_string(__name__, filename))
-        if resource_exists(__name__, logpath):
-            for handler, vdict in logging_config.get('handlers', {}).items():
-                logfile = vdict.get('filename')
-                if logfile:
-                    logging_config['handlers'][handler]['filename'] = os.path.join(resource_filename(__name__, logpath), logfile)
-        logging.config.dictConfig(logging_config)
-        logger.debug('initialized logging configuration:%s', logging_config)
-    else:
-        raise ValueError('missing config file:%s' % filename)
+def init_load_logging(filename='conf/logging.yml', logpath='logs'):
+    get_runtime().load_logging(filename, logpath, reload=True)
 
 
 def init_load_providers(filename=None):
-    data['providers']       =   _init_load_datafile('providers', filename)
+    get_runtime().load_data('providers', filename, reload=True)
 
 
 def init_load_handsets(filename=None):
-    data['handsets']        =   _init_load_datafile('handsets', filename)
+    get_runtime().load_data('handsets', filename, reload=True)
 
 
-def _init_load_datafile(label, filename=None, headers=None):
+def init_load_reference_dir(path):
     """
-    Helper method to load data files
+    Adds dated snapshots from reference data files in path named after their label, e.g. 'handsets-10oct2018.csv'
     """
-    import os, sys, logging
-    import pandas as pd
-    from pkg_resources import resource_string, resource_exists, resource_stream
+    get_runtime().load_reference_dir(path)
 
-    global config
-    logger = logging.getLogger(__name__)
-
-    if config is None:
-        init_load()
 
-    if filename is None:
-        filename = 'pkg_data/{0}'.format(config['data'][label])
-
-    if resource_exists(__name__, filename):
-        if isinstance(headers, list):
-            logger.info('initializing %s (file:%s headers:%s)', label, filename, headers)
-            return pd.read_csv(resource_stream(__name__, filename), header=0, names=headers)
-        else:
-            logger.info('initializing %s (file:%s)', label, filename)
-            return pd.read_csv(resource_stream(__name__, filename))
-    else:
-        raise ValueError('missing %s data file:%s' % (label, filename))
+def get_reference_data(label, timestamp=None):
+    """
+    Returns reference data for label from the snapshot effective at timestamp (epoch seconds), else default data
+    """
+    return get_runtime().get_reference_data(label, timestamp)
 
 
 def init_load(files=[]):
     """
-    Helper method to load all configuration and data
+    Helper method to load all configuration and data (once per process)
     """
-    import os, sys, logging
-
-    logger = logging.getLogger(__name__)
-    if not files:
-        files   =   [   'providers', 'handsets'  ]
-
-    init_load_config()
-    init_load_logging()
-    init_env()
-
-    for file in files:
-        func = getattr(sys.modules[__name__], '_'.join(['init_load', file]), None)
-        if callable(func):
-            func()
-        else:
-            logger.warning('cannot call init loader for file:%s', file)
+    get_runtime().load(files)
 
 
 def init_env(**kwargs):
-    import os, sys, logging
-
-    global config
-    logger = logging.getLogger(__name__)
-
-    if not kwargs:
-        pass
-
-    for var, value in config.get('env', {}).items():
-        if value is not None:
-            logger.info('setting OS environment variable:%s to value:%s', var, value)
-            os.environ[var] = value
+    get_runtime().load_env(reload=True)
 
 
 
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Typed column buffers for accumulated output, and spilling of sorted runs to disk under a memory budget
+"""
+
+import os, sys
+import json
+import logging
+import pickle
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from six import string_types
+
+
+# Compact dtypes of output columns, applied where values convert without changing CSV output
+compact_dtypes  =   {   'latitude':                     'float64',
+                        'longitude':                    'float64',
+                        'download_speed':               'float64',
+                        'provider_id':                  'Int32',
+                        'device_id':                    'Int32',
+                        'measurement_method_code':      'Int32',
+                        'provider_name':                'category',
+                        'measurement_app_name':         'category',
+                        'measurement_server_location':  'category',
+                        'device_imei':                  'category'  }
+
+# Low-cardinality string columns kept dictionary-encoded (pandas categorical) from extraction onwards
+dictionary_columns  =   [ column for column, dtype in sorted(compact_dtypes.items()) if dtype == 'category' ]
+
+# Shared copies of strings returned by intern_string(), and categorical dtypes by categories
+_interned           =   {}
+_dtypes             =   {}
+
+# Dtypes restored from portable block files by astype() -- other dtypes (e.g. strings) are inferred
+portable_dtypes =   [ 'bool', 'boolean', 'category', 'float64', 'int64', 'Int32', 'Int64' ]
+
+memory_units    =   {   '':     1,
+                        'K':    1024,
+                        'M':    1024 ** 2,
+                        'G':    1024 ** 3,
+                        'T':    1024 ** 4   }
+
+
+def parse_memory(value):
+    """
+    Returns number of bytes from memory size string, e.g. '512M' or '2G' (binary units), else ValueError
+    """
+    from re import match
+
+    mo = match(r'^\s*(?P<size>\d+(?:\.\d+)?)\s*(?P<unit>[KMGT]?)(?:I?B)?\s*$', str(value).upper())
+    if not mo:
+        raise ValueError('invalid memory size:%s (e.g. 512M or 2G)' % value)
+    return int(float(mo.group('size')) * memory_units[mo.group('unit')])
+
+
+def frame_memory(df):
+    """
+    Returns bytes used by pandas DataFrame, including Python objects held in object columns
+    """
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def _compact_column(series, dtype):
+    """
+    Returns series converted to dtype, else None if conversion would change its CSV output
+    """
+    if str(series.dtype) == dtype:
+        return None
+
+    if dtype == 'category':
+        values = encode_values(series.tolist())
+        return pd.Series(values, index=series.index) if values is not None else None
+
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+
+    if dtype == 'Int32':
+        if kind not in ('integer', 'empty'):
+            return None
+        values = pd.to_numeric(series, errors='coerce')
+        if values.notnull().any() and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+            return None
+        return values.astype('Int32')
+
+    if kind not in ('floating', 'decimal', 'mixed-integer-float', 'integer'):
+        return None
+    values  =   pd.to_numeric(series, errors='coerce').astype(dtype)
+    present =   series.notnull().values
+    if values.isnull().values[present].any() or \
+            (values[present].astype(str).values != series[present].astype(str).values).any():
+        return None
+    return values
+
+
+def intern_string(value):
+    """
+    Returns one shared copy of string value (other values unchanged), so records of many exports do not
+    each hold their own copy of repeated values
+    """
+    if isinstance(value, string_types):
+        return _interned.setdefault(value, value)
+    return value
+
+
+def encode_values(values):
+    """
+    Returns pandas Categorical of list of strings (None or NaN as missing values), else None if values
+    include other types
+
+    Categories are sorted and their dtype is shared by all lists with the same distinct values, so
+    encoding the few rows of one export is cheap.
+    """
+    distinct = set(value for value in values if value is not None and value == value)
+    if not all(isinstance(value, string_types) for value in distinct):
+        return None
+
+    categories  =   tuple(sorted(distinct))
+    dtype       =   _dtypes.get(categories)
+    if dtype is None:
+        if len(_dtypes) > 100000:
+            _dtypes.clear()
+        dtype = _dtypes[categories] = pd.CategoricalDtype(list(categories))
+
+    index   =   { value: i for i, value in enumerate(categories) }
+    codes   =   np.fromiter((index.get(value, -1) for value in values), dtype=np.int32, count=len(values))
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
+def encode_strings(df):
+    """
+    Returns pandas DataFrame with dictionary_columns holding only strings (or missing values) converted
+    to categoricals, expanded back to the same text when written to CSV
+    """
+    for column in dictionary_columns:
+        if column in df.columns:
+            values = _compact_column(df[column], 'category')
+            if values is not None:
+                df[column] = values
+    return df
+
+
+def encode_columns(data):
+    """
+    Returns dict of column values (e.g. for the pandas DataFrame constructor) with lists of strings in
+    dictionary_columns replaced by categoricals -- cheaper than encode_strings() on a built DataFrame
+    """
+    for column in dictionary_columns:
+        if column in data:
+            values = encode_values(list(data[column]))
+            if values is not None:
+                data[column] = values
+    return data
+
+
+def concat_categoricals(values):
+    """
+    Returns categorical concatenating categorical pandas Series with different categories, remapping
+    codes (once per distinct dtype) instead of comparing values
+    """
+    # Unordered categorical dtypes compare equal regardless of category order -- key by ordered categories
+    keys        =   [ tuple(series.cat.categories) for series in values ]
+    distinct    =   list(dict.fromkeys(keys))
+    categories  =   pd.Index(pd.unique(np.array([ value for key in distinct for value in key ], dtype=object)))
+
+    # Missing values (code -1) map to the appended -1
+    mappings    =   { key: np.append(categories.get_indexer(list(key)), -1).astype(np.int64) for key in distinct }
+    codes       =   [ mappings[key][series.cat.codes.values] for key, series in zip(keys, values) ]
+    return pd.Categorical.from_codes(np.concatenate(codes), categories=categories)
+
+
+def compact_frame(df):
+    """
+    Returns pandas DataFrame with columns converted to compact_dtypes where CSV output is unchanged
+    """
+    for column, dtype in compact_dtypes.items():
+        if column in df.columns:
+            values = _compact_column(df[column], dtype)
+            if values is not None:
+                df[column] = values
+    return df
+
+
+def concat_frames(frames):
+    """
+    Returns concatenation of pandas DataFrames, keeping categorical columns categorical across frames
+    with different categories
+    """
+    frames = [ df for df in frames if not df.empty ] or frames[:1]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    df = pd.concat(frames, ignore_index=True)
+    for column in df.columns:
+        if str(df[column].dtype) == 'category':
+            continue
+        if all(column in frame.columns and str(frame[column].dtype) == 'category' for frame in frames):
+            df[column] = concat_categoricals([ frame[column] for frame in frames ])
+    return df
+
+
+
+def write_blocks(df, keys, path, run=0, block=0, block_rows=100000, portable=False):
+    """
+    Writes rows of df (ordered by ascending int64 sort keys) with their keys to block files of run in
+    folder path, numbered from block, and returns list of block filenames -- pickled, else if portable
+    (e.g. shared with other processes), JSON files with keys in .npy files (see write_portable())
+    """
+    blocks = []
+    for start in range(0, len(df), block_rows):
+        filename = os.path.join(path, 'run-{0:06d}-{1:06d}'.format(run, block + len(blocks)))
+        if portable:
+            filename += '.json'
+            write_portable(df.iloc[start:start + block_rows], keys[start:start + block_rows], filename)
+        else:
+            filename += '.pkl'
+            with open(filename, 'wb') as fp:
+                pickle.dump((df.iloc[start:start + block_rows], keys[start:start + block_rows]),
+                            fp, protocol=pickle.HIGHEST_PROTOCOL)
+        blocks.append(filename)
+    return blocks
+
+
+def _encode_value(value):
+    """
+    Returns JSON serializable value of column value not handled by json, else TypeError
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Decimal):
+        return { '$decimal': str(value) }
+    if value is pd.NA or value is pd.NaT:
+        return None
+    raise TypeError('cannot write value:%r of type:%s to portable block file' % (value, type(value).__name__))
+
+
+def _decode_value(value):
+    """
+    Returns Decimal of value tagged by _encode_value(), else value
+    """
+    if list(value) == [ '$decimal' ]:
+        return Decimal(value['$decimal'])
+    return value
+
+
+def write_portable(df, keys, filename):
+    """
+    Writes rows of df with their column dtypes to JSON file filename, and their int64 sort keys to a .npy
+    file alongside, readable by any pandas version without unpickling (and so running) code
+    """
+    data = {    'columns':  [ str(column) for column in df.columns ],
+                'dtypes':   [ str(dtype) for dtype in df.dtypes ],
+                'values':   [ df[column].tolist() for column in df.columns ]    }
+
+    with open(filename, 'w') as fp:
+        json.dump(data, fp, default=_encode_value, separators=(',', ':'))
+    np.save(os.path.splitext(filename)[0] + '.npy', np.asarray(keys, dtype=np.int64), allow_pickle=False)
+
+
+def read_block(filename):
+    """
+    Returns tuple of (DataFrame, sort keys) from block file written by write_blocks()
+    """
+    if not filename.endswith('.json'):
+        with open(filename, 'rb') as fp:
+            return pickle.load(fp)
+
+    with open(filename, 'r') as fp:
+        data = json.load(fp, object_hook=_decode_value)
+
+    columns = {}
+    for column, dtype, values in zip(data['columns'], data['dtypes'], data['values']):
+        if dtype == 'object':
+            columns[column] = pd.Series(values, dtype=object)
+        elif dtype in portable_dtypes:
+            columns[column] = pd.Series(values, dtype=object).astype(dtype)
+        else:
+            columns[column] = pd.Series(values)
+
+    keys = np.load(os.path.splitext(filename)[0] + '.npy', allow_pickle=False)
+    return pd.DataFrame(columns, columns=data['columns']), keys
+
+
+
+class SpillStore(object):
+    """
+    Sorted runs of output rows spilled to block files once pending rows exceed a memory budget
+
+    Each run is written as blocks of block_rows rows with their int64 sort keys, so merging k runs
+    holds at most one block per run in memory.
+    """
+
+    def __init__(self, max_memory, path=None, block_rows=100000, ascending=False):
+        import atexit
+
+        self.logger     =   logging.getLogger(__name__)
+        self.max_memory =   int(max_memory) if max_memory else None
+        self.dir        =   path
+        self.path       =   None
+        self.block_rows =   int(block_rows)
+        self.ascending  =   ascending
+
+        self.memory     =   0
+        self.rows       =   0
+        self.runs       =   []
+
+        atexit.register(self.cleanup)
+
+
+    def add(self, df):
+        """
+        Adds memory used by pending df, returns True if pending rows exceed memory budget (if any)
+        """
+        if self.max_memory is None:
+            return False
+        self.memory += frame_memory(df)
+        return self.memory > self.max_memory
+
+
+    def spill(self, df, keys):
+        """
+        Writes rows of df (ordered by ascending int64 sort keys) to a new run of block files
+        """
+        self.spill_run([ (df, keys) ])
+        self.memory = 0
+
+
+    def spill_run(self, chunks):
+        """
+        Writes tuples of (DataFrame, sort keys) following on in order, e.g. yielded by iter_merged(), to
+        a new run of block files
+        """
+        import tempfile
+
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix='.mba2mfii-spill-', dir=self.dir)
+
+        blocks, rows = [], 0
+        for df, keys in chunks:
+            blocks  +=  write_blocks(df, keys, self.path, run=len(self.runs), block=len(blocks), block_rows=self.block_rows)
+            rows    +=  len(df)
+        self.runs.append(blocks)
+        self.rows   +=  rows
+        self.logger.info('spilled %s rows to %s blocks in folder:%s (run %s)', rows, len(blocks), self.path, len(self.runs))
+
+
+    def attach(self, path, rows=0):
+        """
+        Adds runs of portable block files in folder path written by write_blocks() (e.g. by another
+        process), which cleanup() leaves in place
+        """
+        from itertools import groupby
+
+        names = sorted(name for name in os.listdir(path) if name.startswith('run-') and name.endswith('.json'))
+        for _, group in groupby(names, key=lambda name: name.split('-')[1]):
+            self.runs.append([ os.path.join(path, name) for name in group ])
+        self.rows += rows
+
+
+    def iter_run(self, blocks):
+        """
+        Yields tuples of (DataFrame, sort keys) from block files of a run
+        """
+        for filename in blocks:
+            yield read_block(filename)
+
+
+    def iter_merged(self, df=None, keys=None):
+        """
+        Yields pandas DataFrames of spilled runs (and rows of df with sorted keys, after them) merged by
+        sort keys, stable in run order
+
+        Each step emits rows up to the smallest last key of the loaded blocks -- including ties only from
+        the earliest run holding it and runs before that, so ties keep run order across block boundaries.
+        """
+        from mba2mfii.tools.ordering import merge_runs
+
+        sources =   [ self.iter_run(blocks) for blocks in self.runs ]
+        if df is not None and len(df):
+            sources.append(iter([ (df, keys) ]))
+
+        current =   [ next(source, None) for source in sources ]
+        offsets =   [ 0 ] * len(sources)
+
+        while any(block is not None for block in current):
+            active          =   [ i for i, block in enumerate(current) if block is not None ]
+            cutoff, last    =   min((current[i][1][-1], i) for i in active)
+
+            frames, runs, rows = [], [], 0
+            for i in active:
+                block, block_keys   =   current[i]
+                start               =   offsets[i]
+                stop                =   start + int(np.searchsorted(block_keys[start:], cutoff, side='right' if i <= last else 'left'))
+                if stop > start:
+                    frames.append(block.iloc[start:stop])
+                    runs.append((block_keys[start:stop], np.arange(rows, rows + stop - start, dtype=np.int64)))
+                    rows += stop - start
+
+                offsets[i] = stop
+                if stop == len(block_keys):
+                    current[i], offsets[i] = next(sources[i], None), 0
+
+            if frames:
+                yield concat_frames(frames).take(merge_runs(runs)[1]).reset_index(drop=True)
+
+
+    def load(self):
+        """
+        Returns tuple of (DataFrame of all spilled rows, in run order, list of run sizes)
+        """
+        frames, sizes = [], []
+        for blocks in self.runs:
+            run = [ block for block, _ in self.iter_run(blocks) ]
+            frames.extend(run)
+            sizes.append(sum(len(block) for block in run))
+        return concat_frames(frames) if frames else pd.DataFrame(), sizes
+
+
+    def cleanup(self):
+        """
+        Removes spilled block files (except attached runs)
+        """
+        import shutil
+
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        self.runs   =   []
+        self.rows   =   0
+
+
+#
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+import os, sys
+import logging
+
+import warnings
+warnings.filterwarnings('ignore', message='numpy.dtype size changed')
+warnings.filterwarnings('ignore', message='numpy.ufunc size changed')
+
+import numpy as np
+import pandas as pd
+
+
+EARTH_RADIUS    =   6371008.8
+
+# Standard parallel of the equal-area projection used for binning (contiguous US)
+STANDARD_PARALLEL   =   37.5
+
+
+def parquet_available():
+    """
+    Returns True if a pandas Parquet engine (the optional pyarrow or fastparquet package) is installed
+    """
+    for engine in [ 'pyarrow', 'fastparquet' ]:
+        try:
+            __import__(engine)
+        except ImportError:
+            continue
+        return True
+    return False
+
+
+def project(lat, lon, parallel=STANDARD_PARALLEL):
+    """
+    Returns arrays of (x, y) meters from lat/lon degrees using a cylindrical equal-area projection,
+    so hex cells cover the same area everywhere
+    """
+    k   =   np.cos(np.radians(parallel))
+    x   =   EARTH_RADIUS * np.radians(lon) * k
+    y   =   EARTH_RADIUS * np.sin(np.radians(lat)) / k
+    return x, y
+
+
+def unproject(x, y, parallel=STANDARD_PARALLEL):
+    """
+    Returns arrays of (lat, lon) degrees from projected (x, y) meters
+    """
+    k   =   np.cos(np.radians(parallel))
+    lat =   np.degrees(np.arcsin(np.clip(y * k / EARTH_RADIUS, -1.0, 1.0)))
+    lon =   np.degrees(x / (EARTH_RADIUS * k))
+    return lat, lon
+
+
+def hex_cells(lat, lon, size=1000.0):
+    """
+    Returns arrays of axial (q, r) coordinates of pointy-top hexagons with circumradius size (meters)
+    containing each lat/lon
+    """
+    x, y    =   project(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    q       =   (np.sqrt(3.0) / 3.0 * x - y / 3.0) / size
+    r       =   (2.0 / 3.0 * y) / size
+
+    # Cube coordinate rounding
+    s       =   -q - r
+    rq, rr, rs  =   np.round(q), np.round(r), np.round(s)
+    dq, dr, ds  =   np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q   =   (dq > dr) & (dq > ds)
+    fix_r   =   ~fix_q & (dr > ds)
+    rq      =   np.where(fix_q, -rr - rs, rq)
+    rr      =   np.where(fix_r, -rq - rs, rr)
+    return rq.astype(np.int64), rr.astype(np.int64)
+
+
+def hex_centers(q, r, size=1000.0):
+    """
+    Returns arrays of (lat, lon) of the centers of axial hex cells
+    """
+    q, r    =   np.asarray(q, dtype=float), np.asarray(r, dtype=float)
+    x       =   size * np.sqrt(3.0) * (q + r / 2.0)
+    y       =   size * 1.5 * r
+    return unproject(x, y)
+
+
+
+class HexAggregator(object):
+    """
+    Streaming aggregation of converted rows into hex cells per provider, with per-cell percentile sketches
+
+    Each metric is summarized by a sparse log-bucketed histogram (relative accuracy alpha) per
+    (cell, provider), so memory is bounded by the number of cells and buckets rather than rows.
+    """
+
+    # Metrics summarized per cell as column: missing value sentinel
+    metrics         =   {   'download_speed':   None,
+                            'signal_strength':  0,
+                            'latency':          None    }
+
+    percentiles     =   [ 10, 50, 90 ]
+
+    keys            =   [ 'q', 'r', 'provider_id' ]
+
+    def __init__(self, size=1000.0, alpha=0.01, percentiles=None, metrics=None, **kwargs):
+        self.logger     =   logging.getLogger(__name__)
+        self.size       =   float(size)
+        self.alpha      =   float(alpha)
+        self.gamma      =   (1.0 + self.alpha) / (1.0 - self.alpha)
+        self.log_gamma  =   np.log(self.gamma)
+        self.rows       =   0
+
+        if percentiles is not None:
+            self.percentiles = list(percentiles)
+        if metrics is not None:
+            self.metrics = dict(metrics)
+
+        # Partial counts per chunk, compacted once more than compact_parts accumulate
+        self.compact_parts  =   int(kwargs.get('compact_parts', 8))
+        self.counts     =   [ ]
+        self.sketches   =   { metric: [ ] for metric in self.metrics }
+
+
+    def _compact(self, parts, force=False):
+        if len(parts) > 1 and (force or len(parts) > self.compact_parts):
+            merged = pd.concat(parts)
+            parts[:] = [ merged.groupby(level=list(range(merged.index.nlevels))).sum() ]
+        return parts
+
+
+    def update(self, df):
+        """
+        Adds rows of df (with latitude, longitude, provider_id and metric columns) to aggregation
+        """
+        lat     =   pd.to_numeric(df['latitude'], errors='coerce').values.astype(float)
+        lon     =   pd.to_numeric(df['longitude'], errors='coerce').values.astype(float)
+        mask    =   ~(np.isnan(lat) | np.isnan(lon))
+        if not mask.any():
+            return
+
+        q, r    =   hex_cells(lat[mask], lon[mask], size=self.size)
+        pid     =   pd.to_numeric(df['provider_id'], errors='coerce').values[mask]
+        cells   =   pd.DataFrame({ 'q': q, 'r': r, 'provider_id': np.nan_to_num(pid, nan=-1).astype(np.int64) })
+
+        self.rows   +=  len(cells)
+        self.counts.append(cells.groupby(self.keys).size())
+        self._compact(self.counts)
+
+        for metric, missing in self.metrics.items():
+            if metric not in df.columns:
+                continue
+            values  =   pd.to_numeric(df[metric], errors='coerce').values.astype(float)[mask]
+            present =   ~np.isnan(values)
+            if missing is not None:
+                present &=  (values != missing)
+            if not present.any():
+                continue
+
+            magnitude   =   np.abs(values[present])
+            with np.errstate(divide='ignore'):
+                index   =   np.where(magnitude > 0, np.ceil(np.log(magnitude) / self.log_gamma), np.iinfo(np.int32).min)
+
+            buckets     =   cells[present].assign(  sign=np.sign(values[present]).astype(np.int8),
+                                                    bucket=index.astype(np.int64)   )
+            counts      =   buckets.groupby(self.keys + [ 'sign', 'bucket' ]).size()
+            self.sketches[metric].append(counts)
+            self._compact(self.sketches[metric])
+
+
+    def update_csv(self, path, chunksize=1000000):
+        """
+        Adds rows of converted CSV file to aggregation, reading in chunks
+        """
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            self.update(chunk)
+
+
+    def _quantiles(self, sketch):
+        """
+        Returns DataFrame of percentile estimates per (cell, provider) from sketch counts
+        """
+        df          =   sketch.rename('count').reset_index()
+        bucket      =   df['bucket'].values.astype(float)
+        df['value'] =   np.where(df['bucket'].values == np.iinfo(np.int32).min, 0.0,
+                                 df['sign'].values * 2.0 * np.power(self.gamma, bucket) / (self.gamma + 1.0))
+        df          =   df.sort_values(self.keys + [ 'value' ])
+        grouped     =   df.groupby(self.keys, sort=False)['count']
+        df['rank']  =   grouped.cumsum()
+        df['total'] =   grouped.transform('sum')
+
+        result      =   None
+        for p in self.percentiles:
+            hit     =   df[df['rank'] >= df['total'] * (p / 100.0)]
+            column  =   hit.groupby(self.keys)['value'].first().rename('p{}'.format(p))
+            result  =   column.to_frame() if result is None else result.join(column)
+        return result
+
+
+    def result(self):
+        """
+        Returns DataFrame with one row per (cell, provider) including cell center, row count and metric percentiles
+        """
+        if not self.counts:
+            return pd.DataFrame(columns=self.keys + [ 'latitude', 'longitude', 'count' ])
+
+        result  =   self._compact(self.counts, force=True)[0].rename('count').astype(np.int64).to_frame()
+        for metric in sorted(self.metrics):
+            if self.sketches.get(metric):
+                quantiles = self._quantiles(self._compact(self.sketches[metric], force=True)[0])
+                quantiles.columns = [ '{0}_{1}'.format(metric, column) for column in quantiles.columns ]
+                result  =   result.join(quantiles)
+
+        result  =   result.reset_index()
+        lat, lon            =   hex_centers(result['q'].values, result['r'].values, size=self.size)
+        result.insert(2, 'latitude', np.round(lat, 6))
+        result.insert(3, 'longitude', np.round(lon, 6))
+        result['provider_id'] = result['provider_id'].astype(object).where(result['provider_id'] >= 0, None)
+        return result
+
+
+    @staticmethod
+    def get_output(output, compression=None):
+        """
+        Returns filename written by write() for output -- CSV output with compression extension appended
+        """
+        from mba2mfii.writers import get_compression
+
+        if output.endswith('.parquet'):
+            return output
+        return get_compression(output, compression)[1]
+
+
+    def write(self, output, **kwargs):
+        """
+        Writes aggregation result to CSV (optionally compressed) or Parquet, based upon output extension
+        """
+        from mba2mfii.writers import get_compression, write_csv
+
+        result = self.result()
+        self.logger.info('writing %s aggregated cells (%s rows, hex size:%sm) to file:%s', len(result), self.rows, self.size, output)
+
+        if output.endswith('.parquet'):
+            if not parquet_available():
+                raise ValueError('Parquet output requires the pyarrow or fastparquet package')
+            result.to_parquet(output, index=False)
+        else:
+            compression, output = get_compression(output, kwargs.get('compression'))
+            write_csv(result, output, compression=compression, level=kwargs.get('level'))
+        return result
+
+
+#
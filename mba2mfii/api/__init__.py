@@ -6,7 +6,7 @@ import json
 
 from six import integer_types, string_types, iteritems
 
-from mba2mfii.tools import json_decode
+from mba2mfii.tools import json_decode, json_coerce, json_coerce_fields, json_parse, json_parse_text, json_project, compile_paths
 
 from .legacy import SKLegacyExport
 from .modern import SKModernExport
@@ -23,6 +23,8 @@ class SKFileExport(object):
         'modern':   lambda ddict: ddict.get('device_environment') is not None
     }
 
+    _field_trees    =   {}
+
     def __init__(self, fp, **kwargs):
         """
         """
@@ -33,24 +35,34 @@ class SKFileExport(object):
 
         self.logger =   logging.getLogger(__name__)
 
-        if isinstance(fp, string_types):
-            if not os.path.isfile(fp):
+        # Text of file fp already read (e.g. by the read stage of mba2mfii.pipeline)
+        text        =   kwargs.pop('text', None)
+
+        if text is None:
+            if isinstance(fp, string_types):
+                if not os.path.isfile(fp):
+                    raise TypeError('invalid file pointer: {0!r}'.format(fp))
+                else:
+                    fp = open(fp, 'r')
+
+            if not hasattr(fp, 'read'):
                 raise TypeError('invalid file pointer: {0!r}'.format(fp))
-            else:
-                fp = open(fp, 'r')
 
-        if not hasattr(fp, 'read'):
-            raise TypeError('invalid file pointer: {0!r}'.format(fp))
+            if 'b' in fp.mode:
+                raise TypeError('invalid file pointer: {0!r} (binary mode detected)'.format(fp))
 
-        if 'b' in fp.mode:
-            raise TypeError('invalid file pointer: {0!r} (binary mode detected)'.format(fp))
+        project     =   kwargs.pop('project_fields', False)
+        backend     =   kwargs.pop('json_backend', None)
 
         #self.logger.debug('loading file: {0!r}'.format(fp))
-        json_data   =   json.load(fp, object_hook=json_decode)
+        if text is None:
+            json_data   =   json_parse(fp, backend=backend)
+        else:
+            json_data   =   json_parse_text(text, backend=backend)
 
         if isinstance(json_data, list):
             if len(json_data) > 1:
-                self.logger.warn('multiple submissions detected')
+                self.logger.warning('multiple submissions detected')
 
             json_data   =   next((data for data in json_data), dict())
 
@@ -60,13 +72,32 @@ class SKFileExport(object):
             self.logger.error('unexpected data type returned from json.load:%s', type(json_data))
             raise ValueError('json_data must be a list of dicts or dict')
 
+        # App version detection only inspects top-level keys, which are unaffected by conversion
         if self.is_legacy_app:
-            self.export = SKLegacyExport(data=self.data, **kwargs)
+            export_class    =   SKLegacyExport
         elif self.is_modern_app:
-            self.export = SKModernExport(data=self.data, **kwargs)
+            export_class    =   SKModernExport
         else:
             raise ValueError('cannot detect valid FCC Speed Test app export data')
 
+        # Only fields required by the export class are converted (and, if projecting, kept)
+        if project:
+            self.data   =   json_project(self.data, self.get_field_tree(export_class))
+        else:
+            self.data   =   json_coerce_fields(self.data, self.get_field_tree(export_class))
+
+        self.export = export_class(data=self.data, **kwargs)
+
+
+    @classmethod
+    def get_field_tree(cls, export_class):
+        """
+        Returns compiled tree of field paths required by export class (cached per class)
+        """
+        if export_class not in cls._field_trees:
+            cls._field_trees[export_class] = compile_paths(export_class.field_paths)
+        return cls._field_trees[export_class]
+
 
     def check_app_version(self):
         """
@@ -76,7 +107,7 @@ class SKFileExport(object):
                 if fn(self.data):
                     return version
             else:
-                self.logger.warn('invalid version:%s in sk_app_versions -- value is not callable:%s', version, fn)
+                self.logger.warning('invalid version:%s in sk_app_versions -- value is not callable:%s', version, fn)
         self.logger.error('cannot detect valid FCC Speed Test app export data')
 
 
@@ -15,6 +15,7 @@ import pandas as pd
 
 import mba2mfii
 from mba2mfii.tools import json_decode
+from mba2mfii.tools.asof import join_directions
 
 from re import match, sub
 
@@ -51,6 +52,85 @@ class SKLegacyExport(object):
                         ('measurement_app_name',    'FCC Speed Test app')
                     ]
 
+    # Paths of fields required to build output rows when projecting (lists are traversed transparently)
+    field_paths =   [   ('app_version_code',),
+                        ('app_version_name',),
+                        ('datetime',),
+                        ('enterprise_id',),
+                        ('schedule_config_version',),
+                        ('sim_operator_code',),
+                        ('submission_type',),
+                        ('timestamp',),
+                        ('timezone',),
+                        ('requested_tests',),
+                        ('metrics', 'type'),
+                        ('metrics', 'timestamp'),
+                        ('metrics', 'latitude'),
+                        ('metrics', 'longitude'),
+                        ('metrics', 'phone_type'),
+                        ('metrics', 'phone_type_code'),
+                        ('metrics', 'network_type'),
+                        ('metrics', 'dbm'),
+                        ('metrics', 'signal_strength'),
+                        ('metrics', 'manufacturer'),
+                        ('metrics', 'model'),
+                        ('tests', 'type'),
+                        ('tests', 'timestamp'),
+                        ('tests', 'datetime'),
+                        ('tests', 'success'),
+                        ('tests', 'bytes_sec'),
+                        ('tests', 'rtt_avg'),
+                        ('tests', 'rtt_stddev'),
+                        ('tests', 'lost_packets'),
+                        ('tests', 'received_packets'),
+                        ('tests', 'target'),
+                        ('tests', 'target_ipaddress'),
+                        ('tests', 'closest_target'),
+                        ('tests', 'ip_closest_target')
+                    ]
+
+    columns     =   [   'latitude', 'longitude', 'timestamp', 'signal_strength', 'download_speed', 'latency',
+                        'provider_id', 'provider_name', 'device_id', 'device_imei', 'measurement_method_code',
+                        'measurement_app_name', 'measurement_server_location'   ]
+
+    # Columns as-of joined onto test events by timestamp, as column: (timestamp dict property,
+    # tuple item, default replacing falsy values, converter)
+    timestamp_columns   =   {   'latitude':                     ('lat_long_dict',           0,      (None, None),   None),
+                                'longitude':                    ('lat_long_dict',           1,      (None, None),   None),
+                                'timestamp':                    ('datetime_dict',           None,   None,           None),
+                                'signal_strength':              ('signal_strength_dict',    None,   0,              None),
+                                'download_speed':               ('download_speed_dict',     None,   0,              None),
+                                'latency':                      ('latency_dict',            None,   0,              int),
+                                'measurement_server_location':  ('target_dict',             None,   'N/A',          None)   }
+
+    # As-of join direction ('nearest', 'backward' or 'forward') and tolerance (seconds, or None for
+    # any distance) of each timestamped column
+    joins       =   {   'latitude':                     ('nearest',     None),
+                        'longitude':                    ('nearest',     None),
+                        'timestamp':                    ('nearest',     None),
+                        'signal_strength':              ('nearest',     None),
+                        'download_speed':               ('nearest',     None),
+                        'latency':                      ('nearest',     None),
+                        'measurement_server_location':  ('nearest',     None),
+                        'upload_speed':                 ('nearest',     None),
+                        'jitter':                       ('nearest',     None),
+                        'packet_loss':                  ('nearest',     None),
+                        'network_type':                 ('nearest',     None)   }
+
+    # Columns read from the download test events themselves, unaffected by join_direction and join_tolerance
+    event_columns   =   [ 'timestamp', 'download_speed', 'measurement_server_location' ]
+
+    # Optional columns appended to columns in extended output mode, as column: timestamp dict property
+    extended_columns    =   [   ('upload_speed',    'upload_speed_dict'),
+                                ('jitter',          'jitter_dict'),
+                                ('packet_loss',     'packet_loss_dict'),
+                                ('network_type',    'network_type_dict')    ]
+
+    rounding    =   {   'latitude':         8,
+                        'longitude':        8,
+                        'download_speed':   6,
+                        'upload_speed':     6   }
+
     test_ids    =   {   'target':   'CLOSESTTARGET',
                         'download': 'JHTTPGETMT',
                         'upload':   'JHTTPPOSTMT',
@@ -59,14 +139,13 @@ class SKLegacyExport(object):
     def __init__(self, data, **kwargs):
         """
         """
-        self.logger =   logging.getLogger(__name__)
-        self.pdf    =   mba2mfii.data['providers']
-        self.hdf    =   mba2mfii.data['handsets']
+        self.logger     =   logging.getLogger(__name__)
+        self.runtime    =   kwargs.get('runtime') or mba2mfii.get_runtime()
 
         try:
             assert isinstance(data, dict), 'data must be a JSON dict:%s' % data
         except AssertionError:
-            self.logger.error('Must initialize {} with valid data:{}'.format(self.__class__.__name__, type(data)))
+            self.logger.error('Must initialize %s with valid data:%s', self.__class__.__name__, type(data))
             raise
 
         self.data   =   data
@@ -79,40 +158,105 @@ class SKLegacyExport(object):
         for key, val in self.defaults:
             self.__dict__[key] = kwargs.get(key, val)
 
+        # As-of join settings, with join_direction and join_tolerance overriding those of metric columns
+        self.joins  =   dict(self.joins)
+        for column, (direction, tolerance) in list(self.joins.items()):
+            if column not in self.event_columns:
+                self.joins[column] = (  kwargs.get('join_direction') or direction,
+                                        kwargs.get('join_tolerance') if kwargs.get('join_tolerance') is not None else tolerance  )
+            if self.joins[column][0] not in join_directions:
+                raise ValueError('invalid join direction:%s (choices:%s)' % (self.joins[column][0], join_directions))
+
+        self._asof_indexes  =   {}
+
+        # Select reference data snapshots effective at measurement time
+        timestamp   =   self.timestamp
+        self.pdf    =   self.runtime.get_reference_data('providers', timestamp)
+        self.hdf    =   self.runtime.get_reference_data('handsets', timestamp)
+
         # Set provider_name if provider_id specified
         self.provider_name = self.get_provider_name(provider_id=self.provider_id)
 
 
-    def get_value_by_timestamp(self, event_dict, timestamp=None, default=None):
+    def get_event_timestamp(self, timestamp=None):
         """
-        Returns value from object dictionary by matching (or nearest to) timestamp, else default
+        Returns timestamp as int, defaulting to first timestamp in download_tests events or instance timestamp
         """
         from six import integer_types, string_types
 
-        if not isinstance(event_dict, dict):
-            raise TypeError('event_dict argument must be a dictionary:%s' % type(event_dict))
-
         if timestamp is None:
-            # Default timestamp is first timestamp in download_tests events or instance timestamp
             timestamp   =   next((odict['timestamp'] for odict in self.download_tests), self.timestamp)
 
         if not isinstance(timestamp, integer_types):
             self.logger.debug(  'timestamp is not an int:%s (value:%s)', type(timestamp), timestamp)
             timestamp = int(timestamp)
+        return timestamp
+
+
+    def get_value_by_timestamp(self, event_dict, timestamp=None, default=None, direction='nearest', tolerance=None):
+        """
+        Returns value from object dictionary (or timestamp dict property named event_dict, using its
+        cached index) by matching (or nearest to) timestamp, else default
+        """
+        from six import string_types
+        from mba2mfii.tools.asof import AsOfIndex
+
+        if isinstance(event_dict, string_types):
+            index = self.get_asof_index(event_dict)
+        elif isinstance(event_dict, dict):
+            index = AsOfIndex(event_dict)
+        else:
+            raise TypeError('event_dict argument must be a dictionary:%s' % type(event_dict))
 
-        timestamps      =   [ t for t in sorted(event_dict.keys(), key=lambda x: abs(timestamp - x)) ]
+        timestamp       =   self.get_event_timestamp(timestamp)
 
-        if not timestamps:
-            self.logger.debug(  'no value detected, returning default:%s (calling function:%s)',
-                                default, inspect.stack()[1][3]  )
+        # Stack inspection is expensive -- only when debug messages are emitted
+        debug           =   self.logger.isEnabledFor(logging.DEBUG)
+
+        if not len(index):
+            if debug:
+                self.logger.debug(  'no value detected, returning default:%s (calling function:%s)',
+                                    default, inspect.stack(0)[1][3]  )
             return default
 
-        if timestamp not in timestamps:
-            self.logger.debug(  'no such timestamp:%s in timestamps:%s, selecting closest timestamp (calling function:%s)',
-                                timestamp, timestamps, inspect.stack()[1][3] )
-            timestamp   =   next((t for t in timestamps), None)
+        if timestamp not in index.keys and debug:
+            self.logger.debug(  'no such timestamp:%s in timestamps:%s, selecting %s timestamp (calling function:%s)',
+                                timestamp, list(index.keys), direction, inspect.stack(0)[1][3] )
+
+        return index.get([ timestamp ], direction=direction, tolerance=tolerance, default=None)[0] or default
+
 
-        return event_dict.get(timestamp) or default
+    def get_asof_index(self, attr):
+        """
+        Returns AsOfIndex over timestamp dict property attr, built once per export
+        """
+        from mba2mfii.tools.asof import AsOfIndex
+
+        if attr not in self._asof_indexes:
+            self._asof_indexes[attr] = AsOfIndex(getattr(self, attr))
+        return self._asof_indexes[attr]
+
+
+    def get_joined_values(self, column, timestamps):
+        """
+        Returns list of values of timestamped column as-of joined onto timestamps, using direction and tolerance in joins
+        """
+        attr, item, default, convert = self.timestamp_columns[column]
+        direction, tolerance = self.joins[column]
+
+        values  =   [ value or default for value in self.get_asof_index(attr).get(timestamps, direction, tolerance) ]
+        if item is not None:
+            values  =   [ value[item] for value in values ]
+        if convert is not None:
+            values  =   [ convert(value) for value in values ]
+        return values
+
+
+    def get_joined_value(self, column, timestamp=None):
+        """
+        Returns value of timestamped column as-of joined onto timestamp
+        """
+        return self.get_joined_values(column, [ self.get_event_timestamp(timestamp) ])[0]
 
 
     def get_provider_tuple(self, code=None, provider_id=None):
@@ -125,13 +269,11 @@ class SKLegacyExport(object):
         if not isinstance(code, integer_types):
             code = int(self.sim_operator_code)
 
-        if provider_id in list(self.pdf.provider_id.values):
-            pdf = self.pdf[self.pdf.provider_id==provider_id]
-        elif code in list(self.pdf.sim_operator_code.values):
-            pdf = self.pdf[self.pdf.sim_operator_code==code]
-        else:
-            self.logger.warn('cannot find provider in providers data from provider_id:%s code:%s', provider_id, code)
-            pdf = pd.DataFrame(columns=self.pdf.columns)
+        pdf = self.pdf[self.pdf.provider_id.eq(provider_id).values] if provider_id is not None else self.pdf.iloc[:0]
+        if pdf.empty:
+            pdf = self.pdf[self.pdf.sim_operator_code.eq(code).fillna(False).values.astype(bool)]
+        if pdf.empty:
+            self.logger.warning('cannot find provider in providers data from provider_id:%s code:%s', provider_id, code)
         return next(((pid, pname) for pid, pname in pdf[['provider_id', 'provider_name']].values), (None, None))
 
 
@@ -139,14 +281,14 @@ class SKLegacyExport(object):
         """
         Returns tuple of (latitude, longitude) from cell location metrics matching timestamp
         """
-        return self.get_value_by_timestamp(self.lat_long_dict, timestamp=timestamp, default=(None, None))
+        return self.get_value_by_timestamp('lat_long_dict', timestamp=timestamp, default=(None, None))
 
 
     def get_phone_type_tuple(self, timestamp=None):
         """
         Returns tuple of (phone_type, phone_type_code) from network data metrics matching timestamp
         """
-        return self.get_value_by_timestamp(self.phone_type_dict, timestamp=None, default=(None, None))
+        return self.get_value_by_timestamp('phone_type_dict', timestamp=None, default=(None, None))
 
 
     # Methods returning columnar values for dataframe
@@ -155,42 +297,42 @@ class SKLegacyExport(object):
         """
         Returns 'latitude' value from cell location metrics matching timestamp
         """
-        return self.get_lat_long_tuple(timestamp=timestamp)[0]
+        return self.get_joined_value('latitude', timestamp=timestamp)
 
 
     def get_longitude(self, timestamp=None):
         """
         Returns 'longitude' value from cell location metrics matching timestamp
         """
-        return self.get_lat_long_tuple(timestamp=timestamp)[1]
+        return self.get_joined_value('longitude', timestamp=timestamp)
 
 
     def get_timestamp(self, timestamp=None):
         """
         Returns 'datetime' value from download tests matching timestamp
         """
-        return self.get_value_by_timestamp(self.datetime_dict, timestamp=timestamp)
+        return self.get_joined_value('timestamp', timestamp=timestamp)
 
 
     def get_signal_strength(self, timestamp=None):
         """
         Returns converted 'dbm' or 'signal_strength' value from cell location metrics matching timestamp
         """
-        return self.get_value_by_timestamp(self.signal_strength_dict, timestamp=timestamp, default=0)
+        return self.get_joined_value('signal_strength', timestamp=timestamp)
 
 
     def get_download_speed(self, timestamp=None):
         """
         Returns converted 'bytes_sec' value from download tests matching timestamp
         """
-        return self.get_value_by_timestamp(self.download_speed_dict, timestamp=timestamp, default=0)
+        return self.get_joined_value('download_speed', timestamp=timestamp)
 
 
     def get_latency(self, timestamp=None):
         """
         Returns converted 'rtt_avg' value from latency tests matching timestamp
         """
-        return int(self.get_value_by_timestamp(self.latency_dict, timestamp=timestamp, default=0))
+        return self.get_joined_value('latency', timestamp=timestamp)
 
 
     def get_provider_id(self, **kwargs):
@@ -228,26 +370,26 @@ class SKLegacyExport(object):
 
             if make.lower() == 'apple':
                 code    =   str(self.phone_type_tuple[1]).lower()
-                model   =   next((model for model in hdf[hdf.device_code.str.lower()==code].device_marketing_name.values), model)
+                model   =   next((model for model in hdf[hdf.device_code_lower==code].device_marketing_name.values), model)
             elif make.lower() == 'samsung' and match(smregex, model):
                 dmodel  =   sub(smregex, '\g<model>', model).lower()
-                model   =   next((model for model in hdf[hdf.device_model.str.lower()==dmodel].device_marketing_name.values), model)
+                model   =   next((model for model in hdf[hdf.device_model_lower==dmodel].device_marketing_name.values), model)
 
-            device_ids  =   list(hdf[hdf.device_marketing_name.str.lower()==model.lower()].device_id.values)
+            device_ids  =   list(hdf[hdf.device_marketing_name_lower==model.lower()].device_id.values)
             hdf         =   hdf[hdf.provider_id==provider_id]
 
             if hdf[hdf.device_id.isin(device_ids)].empty:
                 if len(device_ids) == 1:
                     device_id   =   next((id for id in device_ids), None)
-                    self.logger.warn(   'Device ID:%s detected but not approved for Provider ID:%s (make:%s model:%s)',
+                    self.logger.warning('Device ID:%s detected but not approved for Provider ID:%s (make:%s model:%s)',
                                         device_id, provider_id, make, model     )
                 elif len(device_ids) > 1:
                     device_id   =   None
-                    self.logger.warn(   'Multiple Device IDs:%s detected but none approved for Provider ID:%s (make:%s model:%s)',
+                    self.logger.warning('Multiple Device IDs:%s detected but none approved for Provider ID:%s (make:%s model:%s)',
                                         device_ids, provider_id, make, model    )
                 else:
                     device_id   =   None
-                    self.logger.warn(   'No devices matched for Provider ID:%s (make:%s model:%s) -- allowed Device IDs:%s',
+                    self.logger.warning('No devices matched for Provider ID:%s (make:%s model:%s) -- allowed Device IDs:%s',
                                         provider_id, make, model, list(hdf.device_id.values)    )
             else:
                 device_ids  =   list(hdf[hdf.device_id.isin(device_ids)].device_id.values)
@@ -257,8 +399,8 @@ class SKLegacyExport(object):
                                         device_id, provider_id, make, model  )
                 else:
                     device_id   =   next((id for id in device_ids), None)
-                    self.logger.warn(  'Multiple Device IDs:%s detected and approved for Provider ID:%s (make:%s model:%s) -- returning Device ID:%s',
-                                        device_ids, make, model, device_id  )
+                    self.logger.warning('Multiple Device IDs:%s detected and approved for Provider ID:%s (make:%s model:%s) -- returning Device ID:%s',
+                                        device_ids, provider_id, make, model, device_id  )
             return device_id
 
 
@@ -287,7 +429,7 @@ class SKLegacyExport(object):
         """
         Returns combined 'target' and 'target_ipaddress' values from download tests matching timestamp
         """
-        return self.get_value_by_timestamp(self.target_dict, timestamp=timestamp, default='N/A')
+        return self.get_joined_value('measurement_server_location', timestamp=timestamp)
 
 
     def get_odict(self, array, filter):
@@ -324,35 +466,45 @@ class SKLegacyExport(object):
                                                                             key=lambda x: x[0] ) }
 
 
-    def to_dataframe(self):
+    @classmethod
+    def get_columns(cls, extended=False):
         """
-        Returns pandas dataframe for each download_test_events entry
+        Returns list of output columns, including extended_columns if extended
         """
-        import pandas as pd
+        return cls.columns + [ column for column, _ in cls.extended_columns ] if extended else cls.columns
 
-        columns =   [   'latitude', 'longitude', 'timestamp', 'signal_strength', 'download_speed', 'latency',
-                        'provider_id', 'provider_name', 'device_id', 'device_imei', 'measurement_method_code',
-                        'measurement_app_name', 'measurement_server_location'   ]
 
-        array = []
+    def to_dataframe(self, extended=False):
+        """
+        Returns pandas dataframe for each download_test_events entry, low-cardinality string columns
+        dictionary-encoded
+        """
+        import pandas as pd
+        from mba2mfii.accumulator import encode_columns
+
         if self.download_test_events:
-            events  =   self.download_test_events
+            events  =   list(self.download_test_events)
         elif self.test_ids['download'] in self.requested_tests:
-            events  =   self.target_test_events
+            events  =   list(self.target_test_events)
         else:
             events  =   []
 
-        for timestamp in events:
-            row = []
-            for column in columns:
-                func = getattr(self, 'get_{}'.format(column))
-                row.append(func(timestamp=timestamp))
-            array.append(row)
+        # Timestamped columns are as-of joined onto all events at once, other columns are constant per export
+        data = { }
+        for column in self.columns:
+            if column in self.timestamp_columns:
+                data[column] = self.get_joined_values(column, events)
+            elif events:
+                data[column] = [ getattr(self, 'get_{}'.format(column))(timestamp=None) ] * len(events)
+            else:
+                data[column] = [ ]
+
+        # Extended columns keep falsy values (e.g. 0% packet loss)
+        if extended:
+            for column, attr in self.extended_columns:
+                data[column] = self.get_asof_index(attr).get(events, *self.joins[column])
 
-        return pd.DataFrame(array, columns=columns).round( {
-            'latitude':         8,
-            'longitude':        8,
-            'download_speed':   6   } )
+        return pd.DataFrame(encode_columns(data), columns=self.get_columns(extended)).round(self.rounding)
 
 
     def to_csv(self, filename):
@@ -450,6 +602,45 @@ class SKLegacyExport(object):
         return { odict['timestamp']: _convert_us(odict.get('rtt_avg')) for odict in self.latency_tests }
 
 
+    @property
+    def upload_speed_dict(self):
+        from six import integer_types, string_types
+        def _convert_bps(val):
+            if isinstance(val, integer_types):
+                return (0.000008 * val)
+            return val
+
+        return { odict['timestamp']: _convert_bps(odict.get('bytes_sec')) for odict in self.upload_tests }
+
+
+    @property
+    def jitter_dict(self):
+        from six import integer_types, string_types
+        def _convert_us(val):
+            if isinstance(val, integer_types):
+                return int(0.001 * val)
+            return val
+
+        return { odict['timestamp']: _convert_us(odict.get('rtt_stddev')) for odict in self.latency_tests }
+
+
+    @property
+    def packet_loss_dict(self):
+        from six import integer_types, string_types
+        def _percent_lost(odict):
+            lost, received = odict.get('lost_packets'), odict.get('received_packets')
+            if isinstance(lost, integer_types) and isinstance(received, integer_types) and (lost + received) > 0:
+                return 100.0 * lost / (lost + received)
+            return None
+
+        return { odict['timestamp']: _percent_lost(odict) for odict in self.latency_tests }
+
+
+    @property
+    def network_type_dict(self):
+        return { odict['timestamp']: odict.get('network_type', odict.get('phone_type')) for odict in self.network_data_metrics }
+
+
     @property
     def datetime_dict(self):
         return { odict['timestamp']: odict['datetime'] for odict in self.all_tests }
@@ -472,7 +663,7 @@ class SKLegacyExport(object):
 
     @property
     def phone_type_tuple(self):
-        return self.get_value_by_timestamp(self.phone_type_dict, default=(None, None))
+        return self.get_value_by_timestamp('phone_type_dict', default=(None, None))
 
 
     @property
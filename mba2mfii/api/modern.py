@@ -14,7 +14,7 @@ warnings.filterwarnings('ignore', message='numpy.ufunc size changed')
 import pandas as pd
 
 import mba2mfii
-from mba2mfii.tools import json_decode
+from mba2mfii.tools import json_decode, compile_accessor
 
 from re import match, sub
 
@@ -41,6 +41,28 @@ class SKModernExport(object):
                         ('measurement_app_name',    'FCC Speed Test app v2')
                     ]
 
+    # Fields read by getters as (name, path), where the first key of each path names the instance
+    # attribute it resolves against -- compiled once per class into accessor functions
+    fields      =   [   ('manufacturer',                ('device_environment', 'manufacturer')),
+                        ('model',                       ('device_environment', 'model')),
+                        ('carrier_name',                ('device_environment', 'carrier_name')),
+                        ('latitude',                    ('tests', 'download', 'environment', 'location', 'lat')),
+                        ('longitude',                   ('tests', 'download', 'environment', 'location', 'lon')),
+                        ('signal_strength',             ('tests', 'download', 'environment', 'telephony', 'cellular_strength')),
+                        ('timestamp',                   ('tests', 'download', 'local_datetime')),
+                        ('measurement_server_location', ('tests', 'download', 'target')),
+                        ('download_speed',              ('successful_tests', 'download', 'throughput')),
+                        ('latency',                     ('successful_tests', 'latency', 'round_trip_time')),
+                        ('upload_speed',                ('successful_tests', 'upload', 'throughput')),
+                        ('jitter',                      ('successful_tests', 'latency', 'jitter')),
+                        ('packet_loss',                 ('successful_tests', 'latency', 'packet_loss')),
+                        ('network_type',                ('tests', 'download', 'environment', 'telephony', 'network_type'))
+                    ]
+
+    # Paths of fields required to build output rows when projecting ('*' matches every test)
+    field_paths =   [ ('tests', '*', 'successes') ] + [
+                        (('tests',) if path[0] == 'successful_tests' else path[:1]) + path[1:] for _, path in fields ]
+
     test_ids    =   {   'download': 'download',
                         'upload':   'upload',
                         'latency':  'latency'       }
@@ -49,18 +71,25 @@ class SKModernExport(object):
                         'provider_id', 'provider_name', 'device_id', 'device_imei', 'measurement_method_code',
                         'measurement_app_name', 'measurement_server_location'   ]
 
+    # Optional columns appended to columns in extended output mode
+    extended_columns    =   [ 'upload_speed', 'jitter', 'packet_loss', 'network_type' ]
+
+    rounding    =   {   'latitude':         8,
+                        'longitude':        8,
+                        'download_speed':   6,
+                        'upload_speed':     6   }
+
 
     def __init__(self, data, **kwargs):
         """
         """
-        self.logger =   logging.getLogger(__name__)
-        self.pdf    =   mba2mfii.data['providers']
-        self.hdf    =   mba2mfii.data['handsets']
+        self.logger     =   logging.getLogger(__name__)
+        self.runtime    =   kwargs.get('runtime') or mba2mfii.get_runtime()
 
         try:
             assert isinstance(data, dict), 'data must be a JSON dict:%s' % data
         except AssertionError:
-            self.logger.error('Must initialize {} with valid data:{}'.format(self.__class__.__name__, type(data)))
+            self.logger.error('Must initialize %s with valid data:%s', self.__class__.__name__, type(data))
             raise
 
         self.data   =   data
@@ -73,29 +102,91 @@ class SKModernExport(object):
         for key, val in self.defaults:
             self.__dict__[key] = kwargs.get(key, val)
 
+        # Select reference data snapshots effective at measurement time
+        timestamp   =   self.get_reference_timestamp()
+        self.pdf    =   self.runtime.get_reference_data('providers', timestamp)
+        self.hdf    =   self.runtime.get_reference_data('handsets', timestamp)
+
+        self._successful_tests  =   None
+
         # Set provider_name if provider_id specified
         self.provider_name = self.get_provider_name(provider_id=self.provider_id)
 
 
     # Public instance methods
 
-    def to_dataframe(self):
+    @classmethod
+    def get_columns(cls, extended=False):
         """
-        Returns pandas dataframe with test results entry
+        Returns list of output columns, including extended_columns if extended
         """
-        import pandas as pd
+        return cls.columns + cls.extended_columns if extended else cls.columns
+
+
+    def to_record(self, extended=False):
+        """
+        Returns list of column values with test results entry, sharing one copy of repeated
+        low-cardinality strings across records
+        """
+        from mba2mfii.accumulator import dictionary_columns, intern_string
 
         row     =   [ ]
-        for column in self.columns:
+        for column in self.get_columns(extended):
             func = getattr(self, 'get_{}'.format(column))
-            row.append(func())
+            row.append(intern_string(func()) if column in dictionary_columns else func())
+        return row
+
+
+    def to_dataframe(self, extended=False):
+        """
+        Returns pandas dataframe with test results entry, low-cardinality string columns dictionary-encoded
+        """
+        import pandas as pd
+        from mba2mfii.accumulator import encode_columns
+
+        columns =   self.get_columns(extended)
+        data    =   { column: [ value ] for column, value in zip(columns, self.to_record(extended=extended)) }
+
+        return pd.DataFrame(encode_columns(data), columns=columns).round(self.rounding)
+
+
+    @classmethod
+    def records_to_dataframe(cls, records, extended=False):
+        """
+        Returns single pandas dataframe built from records of many exports, with rounding applied once
 
-        array   =   [ row ]
+        Column values match those of concatenating one to_dataframe() per export: a column
+        holding any None, or both ints and floats, stays object so ints are not promoted to
+        float before the final concatenation decides the column dtype, and float values in
+        object columns are rounded individually as each single-row dataframe would be.  Low-cardinality
+        string columns are dictionary-encoded as in to_dataframe().
+        """
+        import numpy as np
+        import pandas as pd
+        from pandas.api.types import infer_dtype
+        from mba2mfii.accumulator import encode_strings
+
+        names   =   cls.get_columns(extended)
+        columns =   { }
+        for i, column in enumerate(names):
+            values  =   np.empty(len(records), dtype=object)
+            values[:] = [ row[i] for row in records ]
+            series  =   pd.Series(values, dtype=object)
+
+            if not any(value is None for value in values) and infer_dtype(values) != 'mixed-integer-float':
+                series  =   series.infer_objects()
+
+            if column in cls.rounding:
+                decimals = cls.rounding[column]
+                if series.dtype == object:
+                    values[:] = [ float(np.round(x, decimals)) if isinstance(x, float) else x for x in values ]
+                    series  =   pd.Series(values, dtype=object)
+                else:
+                    series  =   series.round(decimals)
 
-        return pd.DataFrame(array, columns=self.columns).round( {
-            'latitude':         8,
-            'longitude':        8,
-            'download_speed':   6   } )
+            columns[column] = series
+
+        return encode_strings(pd.DataFrame(columns, columns=names))
 
 
     def to_csv(self, filename):
@@ -115,13 +206,22 @@ class SKModernExport(object):
 
     # Private helper methods
 
-    def _get_nested_dict(self, d, keys, default=None):
-        assert type(keys) is list
-        if d is None:
-            return default
-        if not keys:
-            return d
-        return self._get_nested_dict(d.get(keys[0]), keys[1:], default=default)
+    @classmethod
+    def _get_accessors(cls):
+        """
+        Returns dict of field name to (attribute, accessor) compiled from fields (cached per class)
+        """
+        if cls.__dict__.get('_accessors') is None:
+            cls._accessors = { name: (path[0], compile_accessor(path[1:])) for name, path in cls.fields }
+        return cls._accessors
+
+
+    def _get_field(self, name, default=None):
+        """
+        Returns value of field declared in fields, else default
+        """
+        attr, accessor = self._get_accessors()[name]
+        return accessor(getattr(self, attr), default)
 
 
     def _get_handset_tuple(self):
@@ -141,12 +241,11 @@ class SKModernExport(object):
         if not isinstance(carrier, string_types):
             return (None, None)
 
-        if provider_id in list(self.pdf.provider_id.values):
-            pdf = self.pdf[self.pdf.provider_id==provider_id]
-        elif carrier in list(self.pdf.provider_name.values):
-            pdf = self.pdf[self.pdf.provider_name==carrier]
-        else:
-            self.logger.warn('cannot find provider in providers data from provider_id:%s carrier:%s', provider_id, carrier)
+        pdf = self.pdf[self.pdf.provider_id.eq(provider_id).values] if provider_id is not None else self.pdf.iloc[:0]
+        if pdf.empty:
+            pdf = self.pdf[self.pdf.provider_name.eq(carrier).values]
+        if pdf.empty:
+            self.logger.warning('cannot find provider in providers data from provider_id:%s carrier:%s', provider_id, carrier)
             return (provider_id, carrier)
         return next(((pid, pname) for pid, pname in pdf[['provider_id', 'provider_name']].values), (None, None))
 
@@ -155,23 +254,20 @@ class SKModernExport(object):
         """
         Returns 'manufacturer' value from device environment
         """
-        keys    =   [ 'manufacturer' ]
-        return self._get_nested_dict(self.device_environment, keys)
+        return self._get_field('manufacturer')
 
 
     def _get_device_model(self):
         """
         Returns 'model' value from device environment
         """
-        keys    =   [ 'model' ]
-        return self._get_nested_dict(self.device_environment, keys)
+        return self._get_field('model')
 
 
     def _get_device_carrier(self):
         """
         """
-        keys    =   [ 'carrier_name' ]
-        return self._get_nested_dict(self.device_environment, keys)
+        return self._get_field('carrier_name')
 
 
     # Converters
@@ -198,69 +294,103 @@ class SKModernExport(object):
 
 
     def convert_timestamp_str(self, val):
-        from six import integer_types, string_types
-        from datetime import datetime
+        from six import string_types
+        from mba2mfii.tools.timestamps import parse_timestamp
         if isinstance(val, string_types):
-            return int(datetime.strptime(val, '%Y-%m-%dT%H:%M:%SZ').timestamp())
+            epoch = parse_timestamp(val)
+            if epoch is None:
+                raise ValueError('cannot parse timestamp:%s' % val)
+            return epoch
         return val
 
 
+    def get_reference_timestamp(self):
+        """
+        Returns measurement timestamp (epoch seconds) used to select reference data snapshots, else None
+        """
+        try:
+            return self.convert_timestamp_str(self.get_timestamp())
+        except (TypeError, ValueError):
+            return None
+
+
     # Methods returning columnar values for dataframe
 
     def get_latitude(self, **kwargs):
         """
         Returns 'latitude' value from download test environment location data
         """
-        keys    =   [ 'download', 'environment', 'location', 'lat' ]
-        return self._get_nested_dict(self.tests, keys)
+        return self._get_field('latitude')
 
 
     def get_longitude(self, **kwargs):
         """
         Returns 'longitude' value from download test environment location data
         """
-        keys    =   [ 'download', 'environment', 'location', 'lon' ]
-        return self._get_nested_dict(self.tests, keys)
+        return self._get_field('longitude')
 
 
     def get_timestamp(self, **kwargs):
         """
         Returns 'local_datetime' value from download tests
         """
-        keys    =   [ 'download', 'local_datetime' ]
-        return self._get_nested_dict(self.tests, keys)
+        return self._get_field('timestamp')
 
 
     def get_signal_strength(self, **kwargs):
         """
         Returns 'cellular_strength' value from download test environment telephony data
         """
-        keys    =   [ 'download', 'environment', 'telephony', 'cellular_strength' ]
-        return self._get_nested_dict(self.tests, keys, default=0)
+        return self._get_field('signal_strength', default=0)
 
 
     def get_download_speed(self, **kwargs):
         """
         Returns converted 'throughput' value from download tests
         """
-        keys    =   [ 'download', 'throughput' ]
-        return self.convert_bps_to_mbps(self._get_nested_dict(self.successful_tests, keys, default=0))
+        return self.convert_bps_to_mbps(self._get_field('download_speed', default=0))
 
 
     def get_latency(self, **kwargs):
         """
         Returns converted 'round_trip_time' value from latency tests
         """
-        keys    =   [ 'latency', 'round_trip_time' ]
-        return int(self.convert_microsecond_to_millisecond(self._get_nested_dict(self.successful_tests, keys, default=0)))
+        return int(self.convert_microsecond_to_millisecond(self._get_field('latency', default=0)))
+
+
+    def get_upload_speed(self, **kwargs):
+        """
+        Returns converted 'throughput' value from upload tests, else None
+        """
+        return self.convert_bps_to_mbps(self._get_field('upload_speed'))
+
+
+    def get_jitter(self, **kwargs):
+        """
+        Returns converted 'jitter' value from latency tests, else None
+        """
+        return self.convert_microsecond_to_millisecond(self._get_field('jitter'))
+
+
+    def get_packet_loss(self, **kwargs):
+        """
+        Returns 'packet_loss' percentage from latency tests, else None
+        """
+        return self._get_field('packet_loss')
+
+
+    def get_network_type(self, **kwargs):
+        """
+        Returns 'network_type' value from download test environment telephony data, else None
+        """
+        return self._get_field('network_type')
 
 
     def get_measurement_server_location(self, **kwargs):
         """
         Returns 'target' value from download tests
         """
-        keys    =   [ 'download', 'target' ]
-        return self._get_nested_dict(self.tests, keys, default='N/A')
+        return self._get_field('measurement_server_location', default='N/A')
 
 
     def get_provider_id(self, **kwargs):
@@ -297,26 +427,26 @@ class SKModernExport(object):
             smregex     =   r'(?i)^(?:SM|SGH)-(?P<model>.+)$'
 
             if make.lower() == 'apple':
-                model   =   next((model for model in hdf[hdf.device_code.str.lower()==model].device_marketing_name.values), model)
+                model   =   next((model for model in hdf[hdf.device_code_lower==model.lower()].device_marketing_name.values), model)
             elif make.lower() == 'samsung' and match(smregex, model):
                 dmodel  =   sub(smregex, '\g<model>', model).lower()
-                model   =   next((model for model in hdf[hdf.device_model.str.lower()==dmodel].device_marketing_name.values), model)
+                model   =   next((model for model in hdf[hdf.device_model_lower==dmodel].device_marketing_name.values), model)
 
-            device_ids  =   list(hdf[hdf.device_marketing_name.str.lower()==model.lower()].device_id.values)
+            device_ids  =   list(hdf[hdf.device_marketing_name_lower==model.lower()].device_id.values)
             hdf         =   hdf[hdf.provider_id==provider_id]
 
             if hdf[hdf.device_id.isin(device_ids)].empty:
                 if len(device_ids) == 1:
                     device_id   =   next((id for id in device_ids), None)
-                    self.logger.warn(   'Device ID:%s detected but not approved for Provider ID:%s (make:%s model:%s)',
+                    self.logger.warning('Device ID:%s detected but not approved for Provider ID:%s (make:%s model:%s)',
                                         device_id, provider_id, make, model     )
                 elif len(device_ids) > 1:
                     device_id   =   None
-                    self.logger.warn(   'Multiple Device IDs:%s detected but none approved for Provider ID:%s (make:%s model:%s)',
+                    self.logger.warning('Multiple Device IDs:%s detected but none approved for Provider ID:%s (make:%s model:%s)',
                                         device_ids, provider_id, make, model    )
                 else:
                     device_id   =   None
-                    self.logger.warn(   'No devices matched for Provider ID:%s (make:%s model:%s) -- allowed Device IDs:%s',
+                    self.logger.warning('No devices matched for Provider ID:%s (make:%s model:%s) -- allowed Device IDs:%s',
                                         provider_id, make, model, list(hdf.device_id.values)    )
             else:
                 device_ids  =   list(hdf[hdf.device_id.isin(device_ids)].device_id.values)
@@ -326,8 +456,8 @@ class SKModernExport(object):
                                         device_id, provider_id, make, model  )
                 else:
                     device_id   =   next((id for id in device_ids), None)
-                    self.logger.warn(  'Multiple Device IDs:%s detected and approved for Provider ID:%s (make:%s model:%s) -- returning Device ID:%s',
-                                        device_ids, make, model, device_id  )
+                    self.logger.warning('Multiple Device IDs:%s detected and approved for Provider ID:%s (make:%s model:%s) -- returning Device ID:%s',
+                                        device_ids, provider_id, make, model, device_id  )
             return device_id
 
 
@@ -369,7 +499,9 @@ class SKModernExport(object):
 
     @property
     def successful_tests(self):
-        return { obj: odict for obj, odict in iteritems(self.tests) if odict.get('successes') > 0 }
+        if self._successful_tests is None:
+            self._successful_tests = { obj: odict for obj, odict in iteritems(self.tests) if odict.get('successes') > 0 }
+        return self._successful_tests
 
 
 
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of provider and device detection against synthetic reference data tables, checked
+against stored thresholds (conf/benchmarks.yml)
+
+Usage: python -m mba2mfii.benchmarks [--sizes 100,1000,10000,100000] [--check]
+"""
+
+import os, sys
+import logging
+
+import click
+
+
+# Provider and devices detected by every benchmark export, placed among synthetic rows
+provider    =   {   'provider_name':        'Benchmark Wireless',
+                    'sim_operator_code':    311480      }
+
+devices     =   {   'apple':    {   'device_manufacturer':      'Apple',
+                                    'device_model':             'A1660',
+                                    'device_marketing_name':    'iPhone 7',
+                                    'device_code':              'iPhone9,1'     },
+                    'samsung':  {   'device_manufacturer':      'Samsung',
+                                    'device_model':             'G950U',
+                                    'device_marketing_name':    'Galaxy S8',
+                                    'device_code':              'dreamqltesq'   },
+                    'generic':  {   'device_manufacturer':      'Motorola',
+                                    'device_model':             'XT1925',
+                                    'device_marketing_name':    'Moto G6',
+                                    'device_code':              'ali'           }   }
+
+# Handset (manufacturer, model, device code) reported by benchmark exports of each device
+handsets    =   {   'apple':    ( 'Apple', 'iPhone', 'iPhone9,1' ),
+                    'samsung':  ( 'samsung', 'SM-G950U', None ),
+                    'generic':  ( 'motorola', 'Moto G6', None )     }
+
+default_sizes   =   [ 100, 1000, 10000, 100000 ]
+
+
+def make_providers(size):
+    """
+    Returns pandas DataFrame of synthetic providers data with size rows, including benchmark provider
+    """
+    import pandas as pd
+
+    df  =   pd.DataFrame({  'provider_id':          range(1, size + 1),
+                            'provider_name':        [ 'Provider {0:06d}'.format(i) for i in range(1, size + 1) ],
+                            'symbolized_name':      [ 'provider_{0:06d}'.format(i) for i in range(1, size + 1) ],
+                            'sim_operator_code':    range(400000, 400000 + size)    })
+
+    df.loc[size // 2, list(provider.keys())] = list(provider.values())
+    return df
+
+
+def make_handsets(size, providers):
+    """
+    Returns tuple of (pandas DataFrame of synthetic handsets data with size rows, dict of benchmark device ids)
+    approving benchmark devices for the benchmark provider
+    """
+    import pandas as pd
+
+    provider_ids    =   providers['provider_id'].values
+    df              =   pd.DataFrame({  'provider_id':              provider_ids[[ i % len(provider_ids) for i in range(size) ]],
+                                        'device_id':                range(1, size + 1),
+                                        'device_manufacturer':      [ 'Maker {0:03d}'.format(i % 100) for i in range(size) ],
+                                        'device_model':             [ 'M{0:06d}'.format(i) for i in range(size) ],
+                                        'device_marketing_name':    [ 'Phone {0:06d}'.format(i) for i in range(size) ],
+                                        'device_code':              [ 'Code{0},{1}'.format(i // 10, i % 10) for i in range(size) ]  })
+
+    provider_id =   int(providers.loc[providers.provider_name == provider['provider_name'], 'provider_id'].iloc[0])
+    device_ids  =   {}
+    for i, (name, vdict) in enumerate(sorted(devices.items())):
+        index = size * (i + 1) // (len(devices) + 1)
+        df.loc[index, [ 'provider_id' ] + list(vdict.keys())] = [ provider_id ] + list(vdict.values())
+        device_ids[name] = int(df.loc[index, 'device_id'])
+    return df, device_ids
+
+
+def make_runtime(size, path):
+    """
+    Returns tuple of (Runtime using synthetic reference data tables with size rows, dict of benchmark device ids),
+    loaded from CSV files written to path as package data would be
+    """
+    from mba2mfii.runtime import Runtime, load_datafile
+
+    providers           =   make_providers(size)
+    handsets, device_ids=   make_handsets(size, providers)
+    runtime             =   Runtime(configure_logging=False)
+
+    for label, df in [ ('providers', providers), ('handsets', handsets) ]:
+        filename = os.path.join(path, '{0}-{1}.csv'.format(label, size))
+        df.to_csv(filename, index=False)
+        runtime.set_data(label, load_datafile(label, filename))
+    return runtime, device_ids
+
+
+def make_export(app, device, runtime):
+    """
+    Returns legacy or modern app export of benchmark device, detecting provider and device from runtime reference data
+    """
+    from mba2mfii.api import SKLegacyExport, SKModernExport
+
+    make, model, code   =   handsets[device]
+    timestamp           =   1539000000
+
+    if app == 'legacy':
+        data = {    'enterprise_id':        'FCC_Public',
+                    'sim_operator_code':    provider['sim_operator_code'],
+                    'timestamp':            timestamp,
+                    'metrics':  [   {   'type': 'phone_identity', 'manufacturer': make, 'model': model },
+                                    {   'type': 'network_data', 'timestamp': timestamp, 'phone_type': 'GSM',
+                                        'phone_type_code': code     }   ],
+                    'tests':    [   {   'type': 'JHTTPGETMT', 'timestamp': timestamp, 'success': True }     ]   }
+        return SKLegacyExport(data=data, runtime=runtime)
+
+    data = {    'device_environment':   {   'manufacturer': make, 'model': code or model,
+                                            'carrier_name': provider['provider_name']   },
+                'tests':                {   'download': { 'local_datetime': '2018-10-08T12:00:00Z' }    }   }
+    return SKModernExport(data=data, runtime=runtime)
+
+
+def detect(export):
+    """
+    Returns tuple of (provider_id, provider_name, device_id) detected by export
+    """
+    return ( export.get_provider_id(), export.get_provider_name(), export.get_device_id() )
+
+
+def run(sizes=None, apps=('legacy', 'modern'), number=20, repeat=5):
+    """
+    Returns list of result dicts with milliseconds per export (best of repeat) detecting provider and
+    device of each app and device against synthetic tables of each size
+    """
+    import shutil
+    import tempfile
+    import timeit
+
+    logger  =   logging.getLogger(__name__)
+    results =   []
+    path    =   tempfile.mkdtemp(prefix='mba2mfii-benchmarks-')
+
+    # Detection logs at warning level for unapproved devices -- keep logging out of timings
+    logging.disable(logging.WARNING)
+    try:
+        for size in (sizes or default_sizes):
+            runtime, device_ids = make_runtime(size, path)
+            for app in apps:
+                for device in sorted(devices):
+                    export      =   make_export(app, device, runtime)
+                    detected    =   detect(export)
+                    if detected[1] != provider['provider_name']:
+                        raise ValueError('benchmark %s_%s detected provider:%s (expected provider:%s)'
+                                         % (app, device, detected[1], provider['provider_name']))
+
+                    timings = timeit.Timer(lambda: detect(export)).repeat(repeat=repeat, number=number)
+                    results.append({    'case':     '{0}_{1}'.format(app, device),
+                                        'size':     size,
+                                        'ms':       1000.0 * min(timings) / number,
+                                        'detected': detected[2] == device_ids[device]   })
+                    logger.debug('benchmark %s size:%s -- %.3f ms per export', results[-1]['case'], size, results[-1]['ms'])
+    finally:
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+def load_thresholds(filename=None):
+    """
+    Returns dict of { case: { size: maximum milliseconds per export } } from thresholds file (default:
+    package conf/benchmarks.yml)
+    """
+    import yaml
+    from pkg_resources import resource_string
+
+    if filename:
+        with open(filename, 'r') as fp:
+            config = yaml.safe_load(fp)
+    else:
+        config = yaml.safe_load(resource_string('mba2mfii', 'conf/benchmarks.yml'))
+
+    return { case: { int(size): float(ms) for size, ms in vdict.items() }
+                for case, vdict in (config.get('thresholds') or {}).items() }
+
+
+def check_results(results, thresholds):
+    """
+    Returns list of results exceeding thresholds or not detecting their benchmark device, adding
+    'threshold' to each result (None if not set)
+    """
+    failed = []
+    for result in results:
+        result['threshold'] = thresholds.get(result['case'], {}).get(result['size'])
+        if not result['detected'] or (result['threshold'] is not None and result['ms'] > result['threshold']):
+            failed.append(result)
+    return failed
+
+
+@click.command()
+@click.option('--sizes', default=','.join(map(str, default_sizes)),
+                help='Comma-separated numbers of rows in synthetic providers and handsets tables')
+@click.option('--number', default=20, type=click.IntRange(1, None), help='Detections per timing')
+@click.option('--repeat', default=5, type=click.IntRange(1, None), help='Timings per case (best is reported)')
+@click.option('--thresholds', 'thresholds_file', type=click.Path(exists=True, dir_okay=False),
+                help='Thresholds file (default: package conf/benchmarks.yml)')
+@click.option('--check/--no-check', default=False,
+                help='Exit with status 1 if any case exceeds its threshold or does not detect its device')
+def main(sizes, number, repeat, thresholds_file, check):
+    """
+    Benchmark provider and device detection per export against synthetic reference data tables
+    """
+    sizes       =   [ int(size) for size in sizes.split(',') if size.strip() ]
+    results     =   run(sizes=sizes, number=number, repeat=repeat)
+    failed      =   check_results(results, load_thresholds(thresholds_file))
+
+    click.echo('{0:<18} {1:>8} {2:>10} {3:>10} {4:>9}'.format('case', 'size', 'ms', 'threshold', 'detected'))
+    for result in results:
+        click.echo('{0:<18} {1:>8} {2:>10.3f} {3:>10} {4:>9} {5}'.format(
+                    result['case'], result['size'], result['ms'],
+                    '' if result['threshold'] is None else '{0:g}'.format(result['threshold']),
+                    'yes' if result['detected'] else 'no', 'FAILED' if result in failed else ''))
+
+    if failed:
+        click.echo('{0} of {1} benchmarks exceeded thresholds or did not detect their device'.format(len(failed), len(results)), err=True)
+        if check:
+            sys.exit(1)
+
+
+
+if __name__ == '__main__':
+    main()
+
+
+#
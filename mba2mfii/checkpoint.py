@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpointed conversion results and quarantine of failed input files for resumable batch runs
+"""
+
+import os, sys
+import logging
+import json
+import pickle
+
+
+
+class Checkpoint(object):
+    """
+    Periodically persists converted results per input file to a checkpoint folder
+
+    Results are kept as converted (before deduplication), so a resumed run rebuilds output exactly as
+    a fresh run would.  Input files are identified by path, size and modification time -- files that
+    changed since they were converted, or failed (quarantined) files, are converted again on resume.
+    Checkpoints made with different conversion arguments, reference data or mba2mfii version are not
+    resumed.
+    """
+
+    version         =   1
+
+    # Arguments affecting conversion results -- a checkpoint made with different values is not resumed
+    conversion_args =   [   'device_id', 'device_imei', 'provider_id', 'extended', 'join_direction',
+                            'join_tolerance', 'project_fields', 'reference_dir'     ]
+
+    state_file      =   'state.json'
+    part_template   =   'part-{0:06d}.pkl'
+
+    def __init__(self, path, args=None, every=None, resume=False, dry_run=False, references=None, **kwargs):
+        from mba2mfii import __version__
+
+        self.logger     =   logging.getLogger(__name__)
+        self.path       =   path
+        self.every      =   int(every or 1000)
+        self.dry_run    =   dry_run
+        self.args       =   { key: (args or {}).get(key) for key in self.conversion_args }
+
+        if self.args['reference_dir']:
+            self.args['reference_dir'] = os.path.abspath(self.args['reference_dir'])
+
+        # Package version and digest of reference data (see ReferenceStore.get_digest()) results were converted with
+        self.package    =   __version__
+        self.references =   references
+
+        self.completed  =   {}
+        self.quarantine =   {}
+        self.parts      =   []
+        self.results    =   {}
+        self.pending    =   []
+        self.resumed    =   0
+
+        if resume:
+            self.load()
+
+
+    @staticmethod
+    def get_key(fp):
+        """
+        Returns absolute path of input file fp, identifying it whatever the working directory
+        """
+        return os.path.abspath(fp)
+
+
+    @staticmethod
+    def get_fingerprint(fp):
+        """
+        Returns [ size, modification time ] of input file fp
+        """
+        stat = os.stat(fp)
+        return [ stat.st_size, stat.st_mtime ]
+
+
+    def load(self):
+        """
+        Loads state and stored results of previous runs, unless made with different conversion arguments
+        """
+        state_path = os.path.join(self.path, self.state_file)
+        if not os.path.exists(state_path):
+            self.logger.info('no checkpoint to resume from in folder:%s -- converting all input files', self.path)
+            return
+
+        with open(state_path, 'r') as fp:
+            state = json.load(fp)
+
+        if state.get('version') != self.version or state.get('args') != self.args:
+            self.logger.warning('skipping checkpoint in folder:%s -- made with different version or conversion arguments (%s)',
+                                self.path, state.get('args'))
+            return
+        elif state.get('package') != self.package or state.get('references') != self.references:
+            self.logger.warning('skipping checkpoint in folder:%s -- made with different mba2mfii version:%s or reference data',
+                                self.path, state.get('package'))
+            return
+
+        self.completed  =   { key: tuple(value) for key, value in state.get('completed', {}).items() }
+        self.quarantine =   { key: value for key, value in state.get('quarantine', {}).items() if os.path.exists(key) }
+        self.parts      =   state.get('parts', [])
+
+        for part in self.parts:
+            with open(os.path.join(self.path, part), 'rb') as fp:
+                for input, fingerprint, result in pickle.load(fp):
+                    if self.completed.get(input) == tuple(fingerprint):
+                        self.results[input] = result
+
+        self.logger.info('resuming from checkpoint in folder:%s -- %s completed and %s quarantined input files',
+                            self.path, len(self.results), len(self.quarantine))
+
+
+    def is_completed(self, fp):
+        """
+        Returns True if input file fp was converted by a previous run and has not changed since
+        """
+        key = self.get_key(fp)
+        try:
+            return key in self.results and self.completed.get(key) == tuple(self.get_fingerprint(fp))
+        except OSError:
+            return False
+
+
+    def get_result(self, fp):
+        """
+        Returns stored result of input file fp
+        """
+        self.resumed += 1
+        return self.results[self.get_key(fp)]
+
+
+    def add(self, fp, result):
+        """
+        Adds converted result of input file fp, saving pending results every so many input files
+        """
+        key         =   self.get_key(fp)
+        fingerprint =   self.get_fingerprint(fp)
+        self.pending.append((key, fingerprint, result))
+        self.completed[key] = tuple(fingerprint)
+        self.quarantine.pop(key, None)
+
+        if len(self.pending) >= self.every:
+            self.save()
+
+
+    def fail(self, fp, error):
+        """
+        Adds input file fp to quarantine with error reason
+        """
+        self.logger.error('quarantined input file:%s -- %s: %s', fp, type(error).__name__, error)
+        self.quarantine[self.get_key(fp)] = { 'error': type(error).__name__, 'reason': str(error) }
+        self.completed.pop(self.get_key(fp), None)
+
+
+    def save(self):
+        """
+        Writes pending results to a new part file and state (atomically) to checkpoint folder
+        """
+        if self.dry_run:
+            self.pending = []
+            return
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        if self.pending:
+            part = self.part_template.format(len(self.parts) + 1)
+            with open(os.path.join(self.path, part), 'wb') as fp:
+                pickle.dump([ (input, list(fingerprint), result) for input, fingerprint, result in self.pending ],
+                            fp, protocol=pickle.HIGHEST_PROTOCOL)
+            self.parts.append(part)
+            self.logger.debug('saved %s converted input files to checkpoint part:%s', len(self.pending), part)
+            self.pending = []
+
+        state       =   {   'version':      self.version,
+                            'args':         self.args,
+                            'package':      self.package,
+                            'references':   self.references,
+                            'parts':        self.parts,
+                            'completed':    { key: list(value) for key, value in self.completed.items() },
+                            'quarantine':   self.quarantine     }
+
+        state_path  =   os.path.join(self.path, self.state_file)
+        with open(state_path + '.tmp', 'w') as fp:
+            json.dump(state, fp, indent=2, sort_keys=True)
+        getattr(os, 'replace', os.rename)(state_path + '.tmp', state_path)
+
+
+    def summary(self):
+        """
+        Logs and returns number of quarantined input files
+        """
+        if self.quarantine:
+            self.logger.warning('%s input files quarantined -- listed with error reasons in file:%s',
+                                len(self.quarantine), os.path.join(self.path, self.state_file))
+        self.logger.info('checkpoint folder:%s -- %s input files resumed, %s quarantined',
+                            self.path, self.resumed, len(self.quarantine))
+        return len(self.quarantine)
+
+
+#
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Pipelined conversion of input files -- stages of worker threads connected by bounded queues, with
+per-stage utilization statistics
+"""
+
+import logging
+import threading
+import time
+
+from six.moves import queue
+
+
+# Marks the end of items in a queue (one per worker of the stage reading it)
+_done   =   object()
+
+
+class Stage(object):
+    """
+    Stage of worker threads applying func(key, value) to items, returning the new value
+
+    Times are summed over workers: busy is time spent in func, idle time spent waiting for items from
+    the previous stage, and blocked time spent waiting for room to pass items on.
+    """
+
+    def __init__(self, name, func=None, workers=1):
+        self.name       =   name
+        self.func       =   func
+        self.workers    =   int(workers or 1)
+
+        self.items      =   0
+        self.busy       =   0.0
+        self.idle       =   0.0
+        self.blocked    =   0.0
+
+        self.lock       =   threading.Lock()
+
+
+    def add(self, items=0, busy=0.0, idle=0.0, blocked=0.0):
+        """
+        Add item count and times of one worker
+        """
+        with self.lock:
+            self.items      +=  items
+            self.busy       +=  busy
+            self.idle       +=  idle
+            self.blocked    +=  blocked
+
+
+    def get_stats(self, elapsed):
+        """
+        Returns dict of stage statistics over elapsed seconds, with utilization as the fraction of
+        worker time spent busy
+        """
+        capacity = elapsed * self.workers
+        return {    'stage':        self.name,
+                    'workers':      self.workers,
+                    'items':        self.items,
+                    'busy':         self.busy,
+                    'idle':         self.idle,
+                    'blocked':      self.blocked,
+                    'utilization':  self.busy / capacity if capacity > 0 else 0.0   }
+
+
+
+class Pipeline(object):
+    """
+    Runs keys (e.g. input filenames) through stages of worker threads, handing each result to a sink
+    in the calling thread in input order
+
+    Queues between stages are bounded, and the first stage only starts an item once fewer than capacity
+    items are between it and the sink, so a slow stage (or sink) holds up the stages before it instead of
+    items piling up in memory.  An exception raised by a stage is passed to the sink with its item,
+    which later stages skip.
+    """
+
+    # Seconds between checks for a stopped pipeline while waiting on a queue
+    poll    =   0.1
+
+    def __init__(self, stages, capacity=16, sink_name='sink'):
+        self.logger     =   logging.getLogger(__name__)
+        self.stages     =   list(stages)
+        self.capacity   =   max(int(capacity or 16), 1)
+        self.sink       =   Stage(sink_name)
+        self.stop       =   threading.Event()
+        self.elapsed    =   0.0
+
+
+    def _put(self, q, item):
+        """
+        Returns True once item is put in queue q, else False if the pipeline stopped while waiting
+        """
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=self.poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _get(self, q):
+        """
+        Returns next item from queue q, else _done if the pipeline stopped while waiting
+        """
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=self.poll)
+            except queue.Empty:
+                pass
+        return _done
+
+
+    def _work(self, stage, inbox, outbox, slots, remaining, next_workers):
+        """
+        Worker thread of stage, passing items from inbox to outbox until inbox is done -- the last worker
+        of the stage to finish marks outbox done for next_workers workers of the next stage
+        """
+        while True:
+            start = time.time()
+            if slots is not None and not self._put(slots, None):
+                break
+            waited = time.time()
+
+            item = self._get(inbox)
+            if item is _done:
+                stage.add(blocked=waited - start, idle=time.time() - waited)
+                break
+
+            fetched             =   time.time()
+            seq, key, value, e  =   item
+            if e is None:
+                try:
+                    value = stage.func(key, value)
+                except Exception as error:
+                    value, e = None, error
+
+            processed = time.time()
+            if not self._put(outbox, (seq, key, value, e)):
+                break
+            stage.add(items=1, busy=processed - fetched, idle=fetched - waited,
+                        blocked=(waited - start) + (time.time() - processed))
+
+        with stage.lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(outbox, _done)
+
+
+    def run(self, keys, sink):
+        """
+        Runs keys through stages, calling sink(key, value, exception) for each in input order
+        """
+        keys    =   list(keys)
+        queues  =   [ queue.Queue() ] + [ queue.Queue(self.capacity) for _ in self.stages ]
+        slots   =   queue.Queue(self.capacity)
+
+        for seq, key in enumerate(keys):
+            queues[0].put((seq, key, None, None))
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_done)
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            remaining       =   [ stage.workers ]
+            next_workers    =   self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, name='{0}-{1}'.format(stage.name, len(threads)),
+                                                args=(stage, queues[i], queues[i + 1], slots if i == 0 else None,
+                                                        remaining, next_workers)))
+
+        start = time.time()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Results arrive out of order from stages with several workers -- hold them until their turn
+        pending = {}
+        try:
+            for seq in range(len(keys)):
+                waited = time.time()
+                while seq not in pending:
+                    item = self._get(queues[-1])
+                    if item is not _done:
+                        pending[item[0]] = item
+
+                _, key, value, e    =   pending.pop(seq)
+                fetched             =   time.time()
+                slots.get()
+                sink(key, value, e)
+                self.sink.add(items=1, busy=time.time() - fetched, idle=fetched - waited)
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.time() - start
+
+
+    def get_stats(self):
+        """
+        Returns list of dicts of statistics of stages and sink (see Stage.get_stats())
+        """
+        return [ stage.get_stats(self.elapsed) for stage in self.stages + [ self.sink ] ]
+
+
+    def log_stats(self, logger=None):
+        """
+        Log utilization of each stage, and the busiest stage (the one to add workers to, or to speed up)
+        """
+        logger  =   logger or self.logger
+        stats   =   self.get_stats()
+        for vdict in stats:
+            logger.info('pipeline stage:%-8s %2s threads -- %s items, %3.0f%% busy (%.2fs), waited %.2fs for input, %.2fs for output',
+                        vdict['stage'], vdict['workers'], vdict['items'], 100.0 * vdict['utilization'],
+                        vdict['busy'], vdict['idle'], vdict['blocked'])
+
+        busiest = max(stats, key=lambda vdict: vdict['utilization'])
+        logger.info('pipeline ran %.2fs -- busiest stage:%s (%.0f%% busy)', self.elapsed, busiest['stage'],
+                    100.0 * busiest['utilization'])
+
+
+#
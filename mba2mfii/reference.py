@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Dated snapshots of reference data (providers and handsets) selected by measurement timestamp
+"""
+
+import logging
+import calendar
+
+from bisect import bisect_right, insort
+from datetime import date, datetime
+from re import search
+
+from six import integer_types, string_types
+
+
+
+class ReferenceStore(object):
+    """
+    Holds dated snapshots of each reference data file, indexed by effective date
+
+    A measurement uses the latest snapshot effective on or before its timestamp, or the earliest
+    snapshot if it predates all of them.  Measurements without a timestamp use the default snapshot.
+    """
+
+    # Effective date embedded in reference data filenames, e.g. 'handsets-10oct2018.csv'
+    filename_regex  =   r'(?P<date>\d{1,2}[a-z]{3}\d{4})'
+
+    def __init__(self):
+        self.logger     =   logging.getLogger(__name__)
+        self.dates      =   {}
+        self.snapshots  =   {}
+        self.defaults   =   {}
+
+
+    @classmethod
+    def parse_date(cls, value):
+        """
+        Returns epoch seconds (UTC) of date, datetime, epoch or 'YYYY-MM-DD' string, or of date embedded in filename, else None
+        """
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return calendar.timegm(value.utctimetuple())
+        if isinstance(value, date):
+            return calendar.timegm(value.timetuple())
+        if isinstance(value, integer_types + (float,)):
+            return int(value)
+        if isinstance(value, string_types):
+            try:
+                return calendar.timegm(datetime.strptime(value, '%Y-%m-%d').timetuple())
+            except ValueError:
+                pass
+            match = search(cls.filename_regex, value.lower())
+            if match:
+                try:
+                    return calendar.timegm(datetime.strptime(match.group('date'), '%d%b%Y').timetuple())
+                except ValueError:
+                    pass
+        return None
+
+
+    def add(self, label, df, effective=None, filename=None, default=False):
+        """
+        Adds snapshot df of reference data label, effective from date (or date in filename),
+        replacing any snapshot with the same effective date
+        """
+        epoch = self.parse_date(effective if effective is not None else filename)
+        if epoch is None:
+            self.logger.warning('no effective date for %s (file:%s) -- applying snapshot to all measurements', label, filename)
+            epoch = 0
+
+        dates       =   self.dates.setdefault(label, [])
+        snapshots   =   self.snapshots.setdefault(label, {})
+        if epoch not in snapshots:
+            insort(dates, epoch)
+        snapshots[epoch] = df
+
+        if default or label not in self.defaults:
+            self.defaults[label] = df
+
+        self.logger.debug('added %s snapshot (file:%s effective:%s rows:%s)', label, filename, epoch, len(df))
+        return epoch
+
+
+    def clear(self, label):
+        """
+        Removes all snapshots of reference data label
+        """
+        self.dates.pop(label, None)
+        self.snapshots.pop(label, None)
+        self.defaults.pop(label, None)
+
+
+    def get_digest(self):
+        """
+        Returns SHA-256 hex digest of all snapshots (labels, effective dates and contents), so results
+        converted with different reference data can be told apart
+        """
+        import hashlib
+        import pandas as pd
+
+        digest = hashlib.sha256()
+        for label in sorted(self.snapshots):
+            for epoch in self.dates[label]:
+                df = self.snapshots[label][epoch]
+                digest.update('{0}:{1}:{2}:{3};'.format(label, epoch, list(df.columns), df is self.defaults.get(label)).encode('utf-8'))
+                digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        return digest.hexdigest()
+
+
+    def select(self, label, timestamp=None):
+        """
+        Returns snapshot of reference data label effective at timestamp (epoch seconds), else None if no snapshots
+        """
+        dates = self.dates.get(label)
+        if not dates:
+            return None
+
+        try:
+            timestamp = float(timestamp)
+        except (TypeError, ValueError):
+            return self.defaults[label]
+
+        index = max(bisect_right(dates, timestamp) - 1, 0)
+        return self.snapshots[label][dates[index]]
+
+
+#
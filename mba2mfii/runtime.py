@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Idempotent, thread-safe initialization of package configuration, logging and reference data
+"""
+
+import os, sys
+import logging
+import threading
+
+
+
+class Runtime(object):
+    """
+    Owns package configuration, logging and reference data, loading each piece once
+
+    Loading is idempotent and thread-safe, so a long-running service can create a Runtime once
+    (or use the process-wide default) and pass it to SKFileExport (runtime=...) for each conversion.
+    """
+
+    files           =   [   'providers', 'handsets'  ]
+
+    _default        =   None
+    _default_lock   =   threading.Lock()
+
+    def __init__(self, config_file='conf/config.yml', logging_file='conf/logging.yml', logpath='logs',
+                    configure_logging=True, data=None):
+        from mba2mfii.reference import ReferenceStore
+
+        self.logger             =   logging.getLogger(__name__)
+        self.config_file        =   config_file
+        self.logging_file       =   logging_file
+        self.logpath            =   logpath
+        self.configure_logging  =   configure_logging
+
+        self.config             =   None
+        self.data               =   data if data is not None else {}
+        self.references         =   ReferenceStore()
+
+        self._lock              =   threading.RLock()
+        self._loaded            =   set()
+
+
+    @classmethod
+    def get_default(cls):
+        """
+        Returns process-wide default Runtime, creating it once
+        """
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = cls()
+        return cls._default
+
+
+    def _once(self, key, func, reload=False):
+        """
+        Calls func unless key was already loaded (or reload is True), holding the runtime lock
+        """
+        if key in self._loaded and not reload:
+            return False
+        with self._lock:
+            if key in self._loaded and not reload:
+                return False
+            func()
+            self._loaded.add(key)
+        return True
+
+
+    def load(self, files=None):
+        """
+        Loads configuration, logging, environment and reference data files not loaded yet
+        """
+        self.load_config()
+        if self.configure_logging:
+            self.load_logging()
+        self.load_env()
+
+        for file in (files or self.files):
+            if file in self.files:
+                self.load_data(file)
+            else:
+                self.logger.warning('cannot call init loader for file:%s', file)
+        return self
+
+
+    def load_config(self, filename=None, reload=False):
+        """
+        Loads package configuration (once unless reload is True)
+        """
+        def _load():
+            import yaml
+            from pkg_resources import resource_string, resource_exists
+
+            path = filename or self.config_file
+            if resource_exists('mba2mfii', path):
+                self.logger.info('initializing package configuration (file:%s)', path)
+                self.config = yaml.safe_load(resource_string('mba2mfii', path))
+                self.logger.debug('initialized package configuration:%s', self.config)
+            else:
+                raise ValueError('missing config file:%s' % path)
+
+        self._once('config', _load, reload=reload)
+        return self.config
+
+
+    def load_logging(self, filename=None, logpath=None, reload=False):
+        """
+        Configures logging from package logging configuration (once unless reload is True)
+        """
+        def _load():
+            import logging.config
+            import yaml
+            from pkg_resources import resource_string, resource_exists, resource_filename
+
+            path    =   filename or self.logging_file
+            logdir  =   logpath or self.logpath
+            if resource_exists('mba2mfii', path):
+                self.logger.info('initializing logging configuration (file:%s)', path)
+                logging_config = yaml.safe_load(resource_string('mba2mfii', path))
+                if resource_exists('mba2mfii', logdir):
+                    for handler, vdict in logging_config.get('handlers', {}).items():
+                        logfile = vdict.get('filename')
+                        if logfile:
+                            logging_config['handlers'][handler]['filename'] = os.path.join(resource_filename('mba2mfii', logdir), logfile)
+                logging.config.dictConfig(logging_config)
+                self.logger.debug('initialized logging configuration:%s', logging_config)
+            else:
+                raise ValueError('missing config file:%s' % path)
+
+        self._once('logging', _load, reload=reload)
+
+
+    def load_env(self, reload=False):
+        """
+        Sets OS environment variables from configuration (once unless reload is True)
+        """
+        def _load():
+            for var, value in (self.load_config() or {}).get('env', {}).items():
+                if value is not None:
+                    self.logger.info('setting OS environment variable:%s to value:%s', var, value)
+                    os.environ[var] = value
+
+        self._once('env', _load, reload=reload)
+
+
+    def load_data(self, label, filename=None, reload=False):
+        """
+        Loads default reference data file for label and dated snapshots configured in versions
+        (once unless reload is True), returns default data
+        """
+        from six import iteritems
+
+        def _load():
+            config  =   self.load_config()
+            df      =   load_datafile(label, filename or 'pkg_data/{0}'.format(config['data'][label]))
+
+            self.references.add(label, df, filename=filename or config['data'][label], default=True)
+            for effective, vfile in iteritems((config.get('versions') or {}).get(label) or {}):
+                self.references.add(label, load_datafile(label, 'pkg_data/{0}'.format(vfile)), effective=effective, filename=vfile)
+            self.data[label] = df
+
+        self._once('data:{}'.format(label), _load, reload=reload)
+        return self.data[label]
+
+
+    def set_data(self, label, df):
+        """
+        Sets default reference data for label to df (e.g. synthetic tables), replacing loaded data and snapshots
+        """
+        with self._lock:
+            self.references.clear(label)
+            self.references.add(label, df, effective=0, default=True)
+            self.data[label] = df
+            self._loaded.add('data:{}'.format(label))
+
+
+    def load_reference_dir(self, path):
+        """
+        Adds dated snapshots from reference data files in path named after their label, e.g. 'handsets-10oct2018.csv'
+        """
+        from glob import glob
+
+        if not os.path.isdir(path):
+            raise ValueError('missing reference data folder:%s' % path)
+
+        with self._lock:
+            for label in self.files:
+                self.load_data(label)
+                for filename in sorted(glob(os.path.join(os.path.abspath(path), '{}-*.csv'.format(label)))):
+                    self.references.add(label, load_datafile(label, filename), filename=filename)
+
+
+    def get_reference_digest(self):
+        """
+        Returns digest of loaded reference data and snapshots (see ReferenceStore.get_digest()), loading
+        default reference data files not loaded yet
+        """
+        with self._lock:
+            for label in self.files:
+                if label not in self.data:
+                    self.load_data(label)
+            return self.references.get_digest()
+
+
+    def get_reference_data(self, label, timestamp=None):
+        """
+        Returns reference data for label from the snapshot effective at timestamp (epoch seconds), else default data
+        """
+        if label not in self.data:
+            self.load_data(label)
+        df = self.references.select(label, timestamp)
+        return df if df is not None else self.data[label]
+
+
+
+def load_datafile(label, filename, headers=None):
+    """
+    Returns pandas DataFrame of reference data file (package resource or absolute path) with
+    explicit dtypes and precomputed lowercased lookup columns
+    """
+    import pandas as pd
+    from pkg_resources import resource_exists, resource_stream
+    from mba2mfii import datafile_dtypes, datafile_lowercase
+
+    logger = logging.getLogger(__name__)
+
+    if os.path.isabs(filename) and os.path.isfile(filename):
+        stream = filename
+    elif resource_exists('mba2mfii', filename):
+        stream = resource_stream('mba2mfii', filename)
+    else:
+        raise ValueError('missing %s data file:%s' % (label, filename))
+
+    dtypes = datafile_dtypes.get(label)
+    if isinstance(headers, list):
+        logger.info('initializing %s (file:%s headers:%s)', label, filename, headers)
+        df = pd.read_csv(stream, header=0, names=headers, dtype=dtypes)
+    else:
+        logger.info('initializing %s (file:%s)', label, filename)
+        df = pd.read_csv(stream, dtype=dtypes)
+
+    for column in datafile_lowercase.get(label, []):
+        if column in df.columns:
+            df['{}_lower'.format(column)] = df[column].str.lower().astype('category')
+    return df
+
+
+#
@@ -13,6 +13,7 @@ from mba2mfii import __version__ as mba2mfii_version
 
 from mba2mfii.tasks import Task
 from mba2mfii.api import SKFileExport
+from mba2mfii.tools.logs import install_repeat_filter, remove_repeat_filter
 
 from mba2mfii.scripts.common  import *
 
@@ -26,6 +27,8 @@ pass_task = click.make_pass_decorator(Task, ensure=True)
 @click.command(context_settings=CONTEXT_SETTINGS)
 @input_argument
 @output_argument
+@input_options
+@output_options
 @data_options
 @common_options
 @click.version_option(version=mba2mfii_version)
@@ -46,25 +49,47 @@ def cli(task, input, output, **kwargs):
     mba2mfii.init_load()
     mba2mfii.set_logging_level(kwargs.get('verbose', False))
 
+    # reference_dir is kept in task arguments, so checkpoints record it
+    if task.args.get('reference_dir'):
+        mba2mfii.init_load_reference_dir(task.args['reference_dir'])
+
     logger = logging.getLogger(__name__)
 
     logger.debug('calling core command mba2mfii cli')
 
-    for fp in task.input:
-        logger.info('processing file:%s', fp)
-        try:
-            input = SKFileExport(fp, **task.args)
-            df = input.to_dataframe()
-            if df.empty:
-                logger.warn('empty dataframe from MBA export:%s', fp)
-            else:
-                task.build_output(df)
-        except TypeError:
-            logger.error('cannot load MBA export:%s', fp)
-            raise
-
-    task.sort_output(sort_columns=[ 'timestamp' ], ascending=False)
-    task.write_output(output)
+    task.set_dedup(task.args.pop('dedup', None), capacity=task.args.pop('dedup_capacity', None))
+    task.set_checkpoint(task.args.pop('checkpoint', None), resume=task.args.pop('resume', False),
+                        every=task.args.pop('checkpoint_every', None))
+    task.set_max_memory(task.args.pop('max_memory', None))
+    task.set_pipeline(task.args.pop('pipeline', None), prefetch=task.args.pop('prefetch', None))
+    task.set_queue(task.args.pop('queue', None), chunk_files=task.args.pop('queue_chunk', None),
+                    stale=task.args.pop('queue_stale', None), mode=task.args.pop('queue_mode', None))
+
+    max_repeats     =   0 if task.args.get('log_summary') else task.args.get('log_repeats')
+    repeat_filter   =   install_repeat_filter(max_repeats=max_repeats)
+    try:
+        if task.queue is None:
+            task.process_input(threads=task.args.pop('threads', None))
+        elif not task.process_queue(threads=task.args.pop('threads', None)):
+            return
+
+        task.sort_output(sort_columns=[ 'timestamp' ], ascending=False)
+        if task.args.get('validate'):
+            task.validate_output(rejected_output=task.args.get('rejected_output'))
+        task.write_output(output)
+
+        # Optional sidecars are written after OUTPUT, so a failure writing them does not lose OUTPUT
+        if task.args.get('sqlite'):
+            task.write_sqlite(task.args['sqlite'])
+        if task.args.get('aggregate_output'):
+            task.aggregate_output(task.args['aggregate_output'], size=task.args.get('hex_size', 1000.0))
+    except mba2mfii.TaskError as e:
+        # Exit with non-zero status, e.g. for batch schedulers running work queue workers
+        raise click.ClickException(e.value)
+    finally:
+        task.close()
+        remove_repeat_filter(repeat_filter)
+        repeat_filter.summary(logger)
 
 
 
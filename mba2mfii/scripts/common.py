@@ -4,6 +4,8 @@ import os, sys
 
 import mba2mfii
 from mba2mfii.tasks import Task
+from mba2mfii.tools import json_backends, json_backend_env
+from mba2mfii.tools.asof import join_directions
 
 import click
 
@@ -53,16 +55,420 @@ def provider_id_option(f):
                         help='Override provider detection and use specified Provider ID',
                         callback=callback)(f)
 
+
+def reference_dir_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['reference_dir'] = value
+        return value
+    return click.option('--reference-dir',
+                        required=False,
+                        type=click.Path(exists=True, file_okay=False, resolve_path=True),
+                        help='Also load dated providers-*.csv and handsets-*.csv snapshots from folder',
+                        callback=callback)(f)
+
 # Input options
 
 
+def json_backend_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['json_backend'] = value
+        return value
+    return click.option('--json-backend',
+                        required=False,
+                        type=click.Choice(json_backends),
+                        help='Force JSON parsing backend (default: fastest installed, or ${})'.format(json_backend_env),
+                        callback=callback)(f)
+
+
+def project_fields_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['project_fields'] = value
+        return value
+    return click.option('--project-fields/--no-project-fields', default=False,
+                        help='Decode only the fields required for output from each JSON file',
+                        callback=callback)(f)
+
+
+def join_direction_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['join_direction'] = value
+        return value
+    return click.option('--join-direction',
+                        required=False,
+                        type=click.Choice(join_directions),
+                        help='Match location, signal and latency metrics recorded nearest to, before or after each download test (default: nearest)',
+                        callback=callback)(f)
+
+
+def join_tolerance_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value is not None:
+            task.args['join_tolerance'] = value
+        return value
+    return click.option('--join-tolerance',
+                        required=False,
+                        type=click.IntRange(0, None),
+                        help='Maximum seconds between a download test and the metrics matched to it (default: no limit)',
+                        callback=callback)(f)
+
+
+def check_threads(task):
+    """
+    Raises click.UsageError if both --threads and --pipeline are given (whichever comes last on the
+    command line), as pipelined conversion uses its own numbers of threads
+    """
+    if task.args.get('threads') and task.args.get('pipeline'):
+        raise click.UsageError('--threads cannot be used with --pipeline -- give pipeline threads as --pipeline DECODE,CONVERT')
+
+
+def threads_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['threads'] = value
+            check_threads(task)
+        return value
+    return click.option('--threads',
+                        required=False,
+                        type=click.IntRange(1, None),
+                        help='Convert input files concurrently using this many threads',
+                        callback=callback)(f)
+
+
+def pipeline_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            try:
+                workers = [ int(count) for count in value.split(',') ]
+            except ValueError:
+                workers = []
+            if len(workers) not in (1, 2) or min(workers) < 1:
+                raise click.BadParameter('pipeline threads must be DECODE,CONVERT numbers of threads (or one number for both), e.g. 2,4')
+            task.args['pipeline'] = (workers * 2)[:2] if len(workers) == 1 else workers
+            check_threads(task)
+        return value
+    return click.option('--pipeline',
+                        required=False,
+                        metavar='DECODE,CONVERT',
+                        help='Convert input files in pipelined stages using these numbers of decode and convert threads, '
+                                'reading files ahead in a separate thread',
+                        callback=callback)(f)
+
+
+def prefetch_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['prefetch'] = value
+        return value
+    return click.option('--prefetch',
+                        required=False,
+                        type=click.IntRange(1, None),
+                        help='Most input files read ahead of building output with --pipeline (default: 16)',
+                        callback=callback)(f)
+
+
+def checkpoint_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['checkpoint'] = value
+        return value
+    return click.option('--checkpoint',
+                        required=False,
+                        type=click.Path(file_okay=False, writable=True, resolve_path=True),
+                        help='Save converted results to this checkpoint folder and quarantine input files failing conversion',
+                        callback=callback)(f)
+
+
+def resume_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['resume'] = value
+        return value
+    return click.option('--resume/--no-resume',
+                        default=False,
+                        help='Resume from checkpoint folder (default: output filename with .checkpoint suffix), converting only new, changed or quarantined input files',
+                        callback=callback)(f)
+
+
+def checkpoint_every_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        if value:
+            task.args['checkpoint_every'] = value
+        return value
+    return click.option('--checkpoint-every',
+                        required=False,
+                        type=click.IntRange(1, None),
+                        help='Save checkpoint every so many converted input files (default: 1000)',
+                        callback=callback)(f)
+
+
+def queue_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['queue'] = value
+        return value
+    return click.option('--queue',
+                        type=click.Path(file_okay=False),
+                        default=None,
+                        help='Batch mode: claim chunks of INPUT files from this work queue folder shared by workers, and merge partial outputs',
+                        callback=callback)(f)
+
+
+def queue_chunk_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['queue_chunk'] = value
+        return value
+    return click.option('--queue-chunk',
+                        type=click.IntRange(min=1),
+                        default=100,
+                        help='Number of INPUT files per chunk when creating work queue',
+                        callback=callback)(f)
+
+
+def queue_mode_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['queue_mode'] = value
+        return value
+    return click.option('--queue-mode',
+                        type=click.Choice([ 'auto', 'work', 'merge' ]),
+                        default='auto',
+                        help='Convert chunks, merge partial outputs, or both (auto: the worker completing the last chunk merges)',
+                        callback=callback)(f)
+
+
+def queue_stale_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['queue_stale'] = value
+        return value
+    return click.option('--queue-stale',
+                        type=click.IntRange(min=1),
+                        default=None,
+                        help='Take over chunks of workers that did not refresh their claim for this many seconds (default: 60)',
+                        callback=callback)(f)
+
 
 # Output options
 
 
+def extended_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['extended'] = value
+        return value
+    return click.option('--extended/--no-extended', default=False,
+                        help='Add upload speed, jitter, packet loss and network type columns to output',
+                        callback=callback)(f)
+
+
+def dedup_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['dedup'] = value
+        return value
+    return click.option('--dedup',
+                        type=click.Choice([ 'none', 'hash', 'bloom' ]),
+                        default='none',
+                        help='Drop duplicate measurements across inputs using a hash set or Bloom filter',
+                        callback=callback)(f)
+
+
+def dedup_capacity_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['dedup_capacity'] = value
+        return value
+    return click.option('--dedup-capacity',
+                        type=click.IntRange(1, None),
+                        default=10000000,
+                        help='Expected number of unique rows when using --dedup bloom',
+                        callback=callback)(f)
+
+
+def shard_by_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['shard_by'] = value
+        return value
+    return click.option('--shard-by',
+                        type=click.Choice([ 'provider_id', 'device_id' ]),
+                        default=None,
+                        help='Split output into one or more files per Provider ID or Device ID',
+                        callback=callback)(f)
+
+
+def max_rows_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['max_rows'] = value
+        return value
+    return click.option('--max-rows',
+                        type=click.IntRange(min=1),
+                        default=None,
+                        help='Split output into files of at most this many rows',
+                        callback=callback)(f)
+
+
+def max_bytes_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['max_bytes'] = value
+        return value
+    return click.option('--max-bytes',
+                        type=click.IntRange(min=1),
+                        default=None,
+                        help='Split output into files of at most this many (uncompressed) bytes',
+                        callback=callback)(f)
+
+
+def max_memory_option(f):
+    def callback(ctx, param, value):
+        from mba2mfii.accumulator import parse_memory
+        task = ctx.ensure_object(Task)
+        try:
+            task.args['max_memory'] = parse_memory(value) if value else None
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        return value
+    return click.option('--max-memory',
+                        default=None,
+                        help='Spill sorted output rows to disk once they use more than this much memory, e.g. 512M or 2G',
+                        callback=callback)(f)
+
+
+def check_compression_level(task):
+    """
+    Raises click.BadParameter if --compress-level is out of range for the output compression, once the
+    output, --compress and --compress-level are all parsed (whichever comes last on the command line)
+    """
+    from mba2mfii.writers import check_level, get_compression
+
+    if task.args.get('compression_level') is None or 'compression' not in task.args or task.output is None:
+        return
+    try:
+        check_level(get_compression(task.output, task.args['compression'])[0], task.args['compression_level'])
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--compress-level'")
+
+
+def compress_option(f):
+    def callback(ctx, param, value):
+        from mba2mfii.writers import zstd_available
+        task = ctx.ensure_object(Task)
+        if value == 'zstd' and not zstd_available():
+            raise click.BadParameter('zstd compression requires the zstandard package')
+        task.args['compression'] = value
+        check_compression_level(task)
+        return value
+    return click.option('--compress',
+                        type=click.Choice([ 'auto', 'none', 'gzip', 'bz2', 'xz', 'zstd' ]),
+                        default='auto',
+                        help='Compress output while writing (default: detect from output extension)',
+                        callback=callback)(f)
+
+
+def compress_level_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['compression_level'] = value
+        check_compression_level(task)
+        return value
+    return click.option('--compress-level',
+                        type=int,
+                        default=None,
+                        help='Compression level: 1-9 for gzip and bz2, 0-9 for xz, 1-22 for zstd '
+                                '(default: 6 for gzip and xz, 9 for bz2, 3 for zstd)',
+                        callback=callback)(f)
+
+
+def validate_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['validate'] = value
+        return value
+    return click.option('--validate/--no-validate', default=False,
+                        help='Validate rows before writing and move rejected rows to a sidecar file',
+                        callback=callback)(f)
+
+
+def rejected_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['rejected_output'] = value
+        return value
+    return click.option('--rejected',
+                        required=False,
+                        default=None,
+                        help='Sidecar file for rejected rows (default: OUTPUT with .rejected suffix)',
+                        callback=callback)(f)
+
+
+def require_imei_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['require_imei'] = value
+        return value
+    return click.option('--require-imei/--no-require-imei', default=False,
+                        help='Reject rows without a Device IMEI when validating',
+                        callback=callback)(f)
+
+
+def aggregate_option(f):
+    def callback(ctx, param, value):
+        from mba2mfii.aggregate import parquet_available
+        task = ctx.ensure_object(Task)
+        if value and value.endswith('.parquet') and not parquet_available():
+            raise click.BadParameter('Parquet output requires the pyarrow or fastparquet package (pip install mba2mfii[parquet])')
+        task.args['aggregate_output'] = value
+        return value
+    return click.option('--aggregate',
+                        required=False,
+                        default=None,
+                        help='Also write per-provider hex grid aggregates to this CSV or Parquet file',
+                        callback=callback)(f)
+
+
+def sqlite_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['sqlite'] = value
+        return value
+    return click.option('--sqlite',
+                        type=click.Path(dir_okay=False),
+                        default=None,
+                        help='Also upsert rows into this SQLite database, updating rows of previous runs',
+                        callback=callback)(f)
+
+
+def hex_size_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['hex_size'] = value
+        return value
+    return click.option('--hex-size',
+                        type=click.FloatRange(min=1),
+                        default=1000.0,
+                        help='Hex cell size (center to vertex) in meters for --aggregate',
+                        callback=callback)(f)
+
 
 # Common options
 
+
 def clobber_option(f):
     def callback(ctx, param, value):
         task = ctx.ensure_object(Task)
@@ -94,6 +500,7 @@ def verbose_option(f):
 
 # Input / output arguments
 
+
 def input_argument(f):
     def callback(ctx, param, value):
         task = ctx.ensure_object(Task)
@@ -116,7 +523,7 @@ def output_argument(f):
         task = ctx.ensure_object(Task)
         
         task.output = value
-        
+        check_compression_level(task)
         return value
     return click.argument('output',
                         required=True,
@@ -125,20 +532,46 @@ def output_argument(f):
 
 # Common decorators
 
+
+def log_repeats_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['log_repeats'] = value
+        return value
+    return click.option('--log-repeats',
+                        type=click.IntRange(0, None),
+                        default=10,
+                        help='Log each distinct warning at most this many times, counting further repeats',
+                        callback=callback)(f)
+
+
+def log_summary_option(f):
+    def callback(ctx, param, value):
+        task = ctx.ensure_object(Task)
+        task.args['log_summary'] = value
+        return value
+    return click.option('--log-summary/--no-log-summary', default=False,
+                        help='Log per-file progress and warnings only as counts after writing output',
+                        callback=callback)(f)
+
+
 def common_options(f):
-    for func in [ clobber_option, dry_run_option, verbose_option ]:
+    for func in [ clobber_option, dry_run_option, verbose_option, log_repeats_option, log_summary_option ]:
         f = func(f)
     return f
 
 
 def data_options(f):
-    for func in [ device_id_option, device_imei_option, provider_id_option ]:
+    for func in [ device_id_option, device_imei_option, provider_id_option, reference_dir_option ]:
         f = func(f)
     return f
 
 
 def input_options(f):
-    for func in [ ]:
+    for func in [ json_backend_option, project_fields_option, join_direction_option, join_tolerance_option, threads_option,
+                    pipeline_option, prefetch_option,
+                    checkpoint_option, resume_option, checkpoint_every_option,
+                    queue_option, queue_chunk_option, queue_mode_option, queue_stale_option ]:
         f = func(f)
     return f
 
@@ -150,7 +583,9 @@ def input_args_and_options(f):
 
 
 def output_options(f):
-    for func in [ ]:
+    for func in [ extended_option, dedup_option, dedup_capacity_option, shard_by_option, max_rows_option, max_bytes_option,
+                    max_memory_option, compress_option, compress_level_option, validate_option, rejected_option,
+                    require_imei_option, aggregate_option, hex_size_option, sqlite_option ]:
         f = func(f)
     return f
 
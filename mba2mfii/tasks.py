@@ -12,9 +12,13 @@ import pandas as pd
 
 class Task(object):
 
+    # Input files in flight per thread when converting concurrently (see process_input())
+    thread_window   =   4
+
     def __init__(self):
         import pandas as pd
         import logging
+        import threading
 
         self.input  =   []
         self.output =   None
@@ -23,11 +27,241 @@ class Task(object):
                             'dry_run':      False,
                             'device_imei':  None    }
 
+        self.dedup  =   None
+
+        self.checkpoint =   None
+
         self.data   =   pd.DataFrame()
 
+        # Pending DataFrames and batched export records, combined once by combine_output()
+        self.frames     =   []
+        self.batch      =   []
+        self.batch_cls  =   None
+
+        # Row counts of chunks combined into data, in order, so sorting can merge per-chunk runs
+        self.chunk_sizes    =   []
+
+        # Sorted runs of rows spilled to disk under a memory budget (see set_max_memory())
+        self.spill          =   None
+
+        # Validator applied while streaming spilled output (see validate_output())
+        self.validator      =   None
+
+        # Shared work queue of input file chunks in batch mode (see set_queue())
+        self.queue          =   None
+        self.queue_mode     =   None
+
+        # Numbers of threads and read-ahead of pipelined conversion (see set_pipeline())
+        self.pipeline       =   None
+
+        # Called after each input file is added to output, e.g. to refresh a work queue claim
+        self.heartbeat      =   None
+
+        # Guards accumulated output, so results may be added from multiple threads
+        self.lock       =   threading.RLock()
+
         self.logger =   logging.getLogger(__name__)
 
 
+    def convert_input(self, fp, **kwargs):
+        """
+        Returns converted result of input file fp -- tuple of (export class, record) for single-row
+        exports (e.g. SKModernExport), else pandas DataFrame (or None if empty)
+
+        Does not touch task state, so may be called from multiple threads.
+        """
+        import logging
+        from mba2mfii.api import SKFileExport
+
+        logger = logging.getLogger(__name__)
+        logger.log(logging.DEBUG if kwargs.get('log_summary') else logging.INFO, 'processing file:%s', fp)
+        try:
+            return self.convert_export(fp, SKFileExport(fp, **kwargs), **kwargs)
+        except TypeError:
+            logger.error('cannot load MBA export:%s', fp)
+            raise
+
+
+    def read_input(self, fp, **kwargs):
+        """
+        Returns text of input file fp, read ahead of decoding by process_pipeline()
+        """
+        import os
+        import logging
+
+        logger = logging.getLogger(__name__)
+        logger.log(logging.DEBUG if kwargs.get('log_summary') else logging.INFO, 'processing file:%s', fp)
+        if not os.path.isfile(fp):
+            logger.error('cannot load MBA export:%s', fp)
+            raise TypeError('invalid file pointer: {0!r}'.format(fp))
+
+        with open(fp, 'r') as f:
+            return f.read()
+
+
+    def decode_input(self, fp, text, **kwargs):
+        """
+        Returns SKFileExport of text read from input file fp
+        """
+        import logging
+        from mba2mfii.api import SKFileExport
+
+        try:
+            return SKFileExport(fp, text=text, **kwargs)
+        except TypeError:
+            logging.getLogger(__name__).error('cannot load MBA export:%s', fp)
+            raise
+
+
+    def convert_export(self, fp, input, **kwargs):
+        """
+        Returns converted result of SKFileExport input of file fp (see convert_input())
+        """
+        import logging
+
+        if input.is_modern_app:
+            return type(input.export), input.export.to_record(extended=kwargs.get('extended', False))
+
+        df = input.to_dataframe(extended=kwargs.get('extended', False))
+        if df.empty:
+            logging.getLogger(__name__).warning('empty dataframe from MBA export:%s', fp)
+            return None
+        return df
+
+
+    def process_input(self, threads=None):
+        """
+        Convert input files (concurrently in a thread pool if threads > 1) and build output in input order
+        """
+        args        =   dict(self.args)
+        threads     =   int(threads or 1)
+        checkpoint  =   self.checkpoint
+
+        def _convert(fp):
+            # Returns tuple of (status, result or error)
+            if checkpoint is not None and checkpoint.is_completed(fp):
+                return 'resumed', checkpoint.get_result(fp)
+            try:
+                return 'converted', self.convert_input(fp, **args)
+            except Exception as e:
+                if checkpoint is None:
+                    raise
+                return 'failed', e
+
+        def _build(fp, status, result):
+            if status == 'failed':
+                checkpoint.fail(fp, result)
+                return
+            if status == 'converted' and checkpoint is not None:
+                checkpoint.add(fp, result)
+            self.build_output_result(result)
+            if self.heartbeat is not None:
+                self.heartbeat()
+
+        try:
+            if self.pipeline is not None:
+                self.process_pipeline(_build, args)
+            elif threads > 1:
+                from concurrent.futures import ThreadPoolExecutor
+
+                from collections import deque
+
+                self.logger.info('converting %s input files using %s threads', len(self.input), threads)
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    # At most window files in flight, so results completed behind a slow file do not pile up
+                    window  =   threads * self.thread_window
+                    pending =   deque()
+                    for fp in self.input:
+                        pending.append((fp, executor.submit(_convert, fp)))
+                        if len(pending) >= window:
+                            fp, future = pending.popleft()
+                            _build(fp, *future.result())
+                    while pending:
+                        fp, future = pending.popleft()
+                        _build(fp, *future.result())
+            else:
+                for fp in self.input:
+                    _build(fp, *_convert(fp))
+        finally:
+            # Keep converted results even if the run is interrupted
+            if checkpoint is not None:
+                checkpoint.save()
+
+        self.logger.info('converted %s input files', len(self.input))
+        if checkpoint is not None:
+            checkpoint.summary()
+
+
+    def set_pipeline(self, workers=None, prefetch=None):
+        """
+        Convert input files in pipelined stages (see process_pipeline()) -- workers is a tuple of numbers
+        of decode and convert threads, prefetch the most input files in flight (default: 16)
+        """
+        if not workers:
+            self.pipeline = None
+            return
+        self.pipeline = { 'workers': tuple(workers), 'prefetch': int(prefetch or 16) }
+
+
+    def process_pipeline(self, build, args):
+        """
+        Convert input files in stages overlapping file reads with conversion -- one thread reads files
+        ahead, decode and convert threads parse and convert them, and results are passed in input order
+        to build(fp, status, result or error) in this thread, each stage connected by bounded queues
+        """
+        from mba2mfii.pipeline import Pipeline, Stage
+
+        checkpoint          =   self.checkpoint
+        decoders, converters=   self.pipeline['workers']
+
+        def _read(fp, value):
+            if checkpoint is not None and checkpoint.is_completed(fp):
+                return 'resumed', checkpoint.get_result(fp)
+            return 'read', self.read_input(fp, **args)
+
+        def _decode(fp, value):
+            status, result = value
+            return ('decoded', self.decode_input(fp, result, **args)) if status == 'read' else value
+
+        def _convert(fp, value):
+            status, result = value
+            return ('converted', self.convert_export(fp, result, **args)) if status == 'decoded' else value
+
+        def _sink(fp, value, e):
+            if e is None:
+                build(fp, *value)
+            elif checkpoint is None:
+                raise e
+            else:
+                build(fp, 'failed', e)
+
+        pipeline = Pipeline([   Stage('read', _read),
+                                Stage('decode', _decode, workers=decoders),
+                                Stage('convert', _convert, workers=converters)  ],
+                            capacity=self.pipeline['prefetch'], sink_name='build')
+
+        self.logger.info('converting %s input files in pipeline using %s decode and %s convert threads (%s files in flight)',
+                            len(self.input), decoders, converters, pipeline.capacity)
+        try:
+            pipeline.run(self.input, _sink)
+        finally:
+            pipeline.log_stats(self.logger)
+
+
+    def build_output_result(self, result):
+        """
+        Add result returned by convert_input() to output
+        """
+        import pandas as pd
+
+        if result is None:
+            return
+        elif isinstance(result, pd.DataFrame):
+            self.build_output(result)
+        else:
+            self.build_output_record(*result)
+
+
     def build_output(self, df):
         """
         Iteratively build output by appending pandas DataFrames
@@ -39,25 +273,650 @@ class Task(object):
             self.logger.error(msg)
             raise ValueError(msg)
 
-        if df.empty:
-            self.logger.warn('detected empty DataFrame -- skipping build_output()')
+        with self.lock:
+            if self.dedup is not None:
+                df = self.dedup.filter_dataframe(df)
+
+            if df.empty:
+                self.logger.warning('detected empty DataFrame -- skipping build_output()')
+            else:
+                self.logger.debug('appending %s rows to output DataFrame', len(df))
+                self.flush_batch()
+                self.frames.append(df)
+                self.check_memory(df)
+
+
+    def build_output_batch(self, export):
+        """
+        Iteratively build output by collecting records from single-row exports (e.g. SKModernExport),
+        converted into one DataFrame by flush_batch()
+        """
+        self.build_output_record(type(export), export.to_record(extended=self.args.get('extended', False)))
+
+
+    def build_output_record(self, export_cls, record):
+        """
+        Iteratively build output by collecting a record (list of values ordered as export_cls.columns)
+        """
+        with self.lock:
+            if self.batch_cls is not None and export_cls is not self.batch_cls:
+                self.flush_batch()
+
+            if self.dedup is not None and not self.dedup.add_record(record, export_cls.columns):
+                return
+
+            self.batch_cls = export_cls
+            self.batch.append(record)
+
+            if self.spill is not None and len(self.batch) >= self.spill.block_rows:
+                self.flush_batch()
+
+
+    def flush_batch(self):
+        """
+        Convert collected export records into a single DataFrame, preserving input order
+        """
+        with self.lock:
+            df = None
+            if self.batch:
+                self.logger.debug('appending %s batched rows to output DataFrame', len(self.batch))
+                df = self.batch_cls.records_to_dataframe(self.batch, extended=self.args.get('extended', False))
+                self.frames.append(df)
+
+            self.batch      =   []
+            self.batch_cls  =   None
+
+            if df is not None:
+                self.check_memory(df)
+
+
+    def set_dedup(self, mode, **kwargs):
+        """
+        Enable streaming deduplication of output rows ('hash' or 'bloom'), or disable if mode is None
+        """
+        from mba2mfii.tools.dedup import get_deduplicator
+
+        self.dedup = get_deduplicator(mode, **kwargs)
+
+
+    def set_checkpoint(self, path=None, resume=False, every=None):
+        """
+        Enable checkpointing of converted results to path (default: output filename with '.checkpoint'
+        suffix) and quarantine of failed input files, resuming from a previous run if resume is True
+        """
+        import os
+        from mba2mfii import get_runtime
+        from mba2mfii.checkpoint import Checkpoint
+
+        if path is None and not resume:
+            self.checkpoint = None
+            return
+
+        if path is None:
+            path = '{0}.checkpoint'.format(os.path.splitext(self.output)[0])
+
+        self.checkpoint = Checkpoint(path, args=self.args, every=every, resume=resume, dry_run=self.args['dry_run'],
+                                        references=get_runtime().get_reference_digest())
+
+
+    def set_queue(self, path, chunk_files=None, stale=None, mode=None):
+        """
+        Enable batch mode with work queue in shared folder path -- workers convert chunks of chunk_files
+        input files into partial outputs ('work' mode), partial outputs are merged into output once all
+        chunks are done ('merge' mode), or both ('auto' mode: the worker completing the last chunk merges)
+        """
+        from mba2mfii.workqueue import WorkQueue
+
+        if path is None:
+            self.queue = None
+            return
+
+        if self.checkpoint is not None:
+            self.logger.warning('not using checkpoint in batch mode -- completed chunks are kept in work queue:%s', path)
+            self.checkpoint = None
+
+        self.queue      =   WorkQueue(path, chunk_files=chunk_files, stale=stale)
+        self.queue_mode =   mode or 'auto'
+
+
+    def process_queue(self, threads=None):
+        """
+        Convert chunks of input files claimed from work queue into partial outputs, and returns True if
+        partial outputs were merged into combined output by this worker (see merge_queue()), else False,
+        raising TaskError if chunks failed (or, merging, are not done)
+        """
+        import time
+        from mba2mfii import TaskError
+
+        if self.args['dry_run']:
+            self.logger.info('skipping work queue:%s -- dry run is True', self.queue.path)
+            self.process_input(threads=threads)
+            return True
+
+        queue   =   self.queue
+        queue.create(list(self.input))
+        errors  =   0
+        waiting =   False
+
+        while self.queue_mode != 'merge':
+            chunk = queue.claim()
+            if chunk is None:
+                # Wait for chunks claimed by other workers, taking them over once stale (e.g. crashed workers)
+                claimed = queue.get_claimed()
+                if not claimed:
+                    break
+                if not waiting:
+                    self.logger.info('waiting for %s chunks claimed by other workers', len(claimed))
+                    waiting = True
+                time.sleep(min(queue.touch_interval, queue.stale))
+                continue
+            waiting = False
+            self.heartbeat = lambda: queue.touch(chunk)
+            try:
+                rows = self.process_chunk(chunk, threads=threads)
+            except Exception as e:
+                queue.fail(chunk, e)
+                errors += 1
+                continue
+            finally:
+                self.heartbeat = None
+            queue.complete(chunk, rows)
+
+        total, done, failed = queue.get_status()
+        if self.queue_mode == 'work':
+            self.logger.info('no chunks left to claim -- %s of %s chunks done, %s failed', done, total, failed)
+            if errors:
+                raise TaskError('%s chunks failed in work queue:%s' % (errors, queue.path))
+            return False
+        elif done < total:
+            claimed = len(queue.get_claimed())
+            log     = self.logger.error if failed or self.queue_mode == 'merge' else self.logger.info
+            log('not merging partial outputs -- %s of %s chunks done, %s failed, %s claimed', done, total, failed, claimed)
+            if failed or self.queue_mode == 'merge':
+                raise TaskError('%s of %s chunks done, %s failed, %s claimed in work queue:%s' % (done, total, failed, claimed, queue.path))
+            return False
+        elif self.queue_mode == 'auto' and not queue.claim_merge():
+            self.logger.info('not merging partial outputs -- merged by another worker')
+            return False
+
+        self.merge_queue()
+        return True
+
+
+    def process_chunk(self, chunk, threads=None):
+        """
+        Convert input files of work queue chunk into its partial output, returns number of rows
+        """
+        import pandas as pd
+
+        # Each chunk starts from empty output (including records batched before a failed chunk),
+        # deduplicating rows within the chunk (and across chunks by merge_queue())
+        self.data, self.frames, self.chunk_sizes    =   pd.DataFrame(), [], []
+        self.batch, self.batch_cls                  =   [], None
+        if self.dedup is not None:
+            self.dedup.reset()
+        if self.spill is not None:
+            self.spill.cleanup()
+
+        self.input = list(self.queue.chunks[chunk])
+        self.logger.info('converting chunk:%s of %s (%s input files)', chunk + 1, len(self.queue.chunks), len(self.input))
+        self.process_input(threads=threads)
+        self.flush_batch()
+        return self.write_part(self.queue.get_path('parts', chunk))
+
+
+    def write_part(self, path, ascending=False):
+        """
+        Write combined output sorted by timestamp to folder path as a run of portable blocks (see
+        mba2mfii.accumulator) and returns number of rows -- rows with unparsable timestamps are placed last
+        """
+        import os
+        import shutil
+        import numpy as np
+        from mba2mfii.accumulator import write_blocks
+        from mba2mfii.tools.ordering import get_sort_keys
+        from mba2mfii.tools.timestamps import epoch_column
+
+        self.combine_output()
+        if not self.data.empty and not self.get_chunk_order(ascending=ascending)[0]:
+            self.logger.warning('some timestamps could not be parsed -- placing their rows last in partial output:%s', path)
+            self.load_spilled()
+            keys                =   get_sort_keys(self.data[epoch_column].values, ascending=ascending)
+            self.data           =   self.data.take(np.argsort(keys, kind='stable'))
+            self.chunk_sizes    =   [ len(self.data) ]
         else:
-            self.logger.debug('appending {} rows to output DataFrame'.format(len(df)))
-            self.data = self.data.append(df, ignore_index=True)
+            self.sort_output(sort_columns=[ 'timestamp' ], ascending=ascending)
+
+        tmp_path = '{0}.tmp-{1}'.format(path, self.queue.worker if self.queue is not None else os.getpid())
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        rows, blocks = 0, 0
+        for df in self.iter_output():
+            if self.heartbeat is not None:
+                self.heartbeat()
+            keys    =   get_sort_keys(df[epoch_column].values, ascending=ascending)
+            blocks  +=  len(write_blocks(df, keys, tmp_path, block=blocks, portable=True))
+            rows    +=  len(df)
+
+        # A worker taking over a stale claim may have finished the same chunk first
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        return rows
+
+
+    def merge_queue(self):
+        """
+        Load partial outputs of all work queue chunks as sorted runs, merged while sorting, validating,
+        aggregating and writing output
+        """
+        import pandas as pd
+        from mba2mfii.accumulator import SpillStore
+
+        self.data, self.frames, self.chunk_sizes = pd.DataFrame(), [], []
+        if self.spill is not None:
+            self.spill.cleanup()
+        else:
+            self.spill = SpillStore(None, ascending=False)
+
+        parts = self.queue.get_parts()
+        for path, rows in parts:
+            self.spill.attach(path, rows=rows)
+        self.logger.info('merging %s rows from partial outputs of %s chunks', self.spill.rows, len(parts))
+
+        # Keep columns (and dtypes) of partial outputs
+        if self.spill.runs:
+            self.data = next(self.spill.iter_run(self.spill.runs[0]))[0].iloc[:0]
+            if self.dedup is not None:
+                self.dedup_parts()
+
+
+    def dedup_parts(self):
+        """
+        Drop rows of attached partial outputs seen before in merged order (duplicates converted in
+        other chunks), keeping the first as a single run over all input files would, and replace
+        them by the remaining rows spilled to disk as one run
+        """
+        from mba2mfii.accumulator import SpillStore
+        from mba2mfii.tools.ordering import get_sort_keys
+        from mba2mfii.tools.timestamps import epoch_column
+
+        parts, self.spill   =   self.spill, SpillStore(None, path=self.spill.dir, block_rows=self.spill.block_rows, ascending=False)
+
+        # Rows were deduplicated within each chunk -- count rows kept and dropped while merging
+        self.dedup.reset()
+        self.dedup.kept, self.dedup.dropped = 0, 0
+
+        frames = ( self.dedup.filter_dataframe(df) for df in parts.iter_merged() )
+        self.spill.spill_run(( df, get_sort_keys(df[epoch_column].values, ascending=False) ) for df in frames if not df.empty)
+        parts.cleanup()
+        self.logger.info('dropped %s duplicate rows of other chunks while merging partial outputs', self.dedup.dropped)
+
+
+    def set_max_memory(self, max_memory, path=None, ascending=False):
+        """
+        Spill output rows to disk (in path, default: output folder) as runs sorted by timestamp once pending
+        rows use more than max_memory bytes, or keep all rows in memory if max_memory is None
+        """
+        import os
+        from mba2mfii.accumulator import SpillStore
+
+        if not max_memory:
+            self.spill = None
+            return
+
+        if path is None and self.output and os.path.isdir(os.path.dirname(os.path.abspath(self.output))):
+            path = os.path.dirname(os.path.abspath(self.output))
+
+        self.spill = SpillStore(max_memory, path=path, ascending=ascending)
+
+
+    def check_memory(self, df):
+        """
+        Add memory used by pending df, spilling output to disk if over memory budget
+        """
+        if self.spill is not None and self.spill.add(df):
+            self.spill_output()
+
+
+    def is_spilled(self):
+        """
+        Returns True if output rows were spilled to disk
+        """
+        return self.spill is not None and bool(self.spill.runs)
+
+
+    def has_output(self):
+        """
+        Returns True if any output rows are held in memory or spilled to disk
+        """
+        self.combine_output()
+        return not self.data.empty or self.is_spilled()
+
+
+    def spill_output(self):
+        """
+        Sort combined output rows by timestamp and spill them to disk as a run, keeping all rows in memory
+        instead if timestamps cannot be parsed
+        """
+        from mba2mfii.tools.ordering import get_sort_keys
+        from mba2mfii.tools.timestamps import epoch_column
+
+        with self.lock:
+            self.combine_output()
+            if self.data.empty:
+                return
+
+            ordered, order = self.get_chunk_order(ascending=self.spill.ascending)
+            if not ordered:
+                self.logger.warning('cannot spill output to disk -- timestamps could not be parsed, keeping all rows in memory')
+                if self.is_spilled():
+                    self.load_spilled()
+                self.spill = None
+                return
+
+            data = self.data.take(order) if order is not None else self.data
+            self.spill.spill(data, get_sort_keys(data[epoch_column].values, ascending=self.spill.ascending))
+
+            # Keep columns (and dtypes) of spilled rows
+            self.data           =   self.data.iloc[:0]
+            self.chunk_sizes    =   []
+
+
+    def load_spilled(self):
+        """
+        Load rows spilled to disk back into combined output (sorted by timestamp, without rows rejected
+        by validate_output()) and stop spilling
+        """
+        from mba2mfii.accumulator import concat_frames
+
+        with self.lock:
+            self.combine_output()
+            if not self.is_spilled():
+                return
+
+            self.logger.warning('loading %s rows spilled to disk back into memory', self.spill.rows)
+            spill, self.spill   =   self.spill, None
+            data, sizes         =   spill.load()
+            spill.cleanup()
+
+            self.chunk_sizes    =   sizes + ([ len(self.data) ] if not self.data.empty else [])
+            self.data           =   concat_frames([ data ] + ([ self.data ] if not self.data.empty else []))
+            self.sort_output(sort_columns=[ 'timestamp' ], ascending=spill.ascending)
+
+            if self.validator is not None:
+                self.data       =   self.validator.split(self.data)[0]
+                self.validator  =   None
+
+
+    def iter_output(self, chunksize=100000):
+        """
+        Yields combined output DataFrames in output order, merging runs spilled to disk (sorted by timestamp)
+        and dropping rows rejected by validate_output() while streaming
+        """
+        from mba2mfii.tools.ordering import get_sort_keys
+        from mba2mfii.tools.timestamps import epoch_column
+
+        self.combine_output()
+
+        if self.is_spilled():
+            ordered, order = self.get_chunk_order(ascending=self.spill.ascending)
+            if not ordered:
+                self.load_spilled()
+
+        if self.is_spilled():
+            data    =   self.data.take(order) if order is not None else self.data
+            keys    =   get_sort_keys(data[epoch_column].values, ascending=self.spill.ascending) if not data.empty else None
+            chunks  =   self.spill.iter_merged(data, keys)
+        else:
+            chunks  =   ( self.data.iloc[start:start + chunksize] for start in range(0, len(self.data), chunksize) )
+
+        for df in chunks:
+            if self.validator is not None:
+                df = self.validator.split(df)[0]
+            if not df.empty:
+                yield df
+
+
+    def close(self):
+        """
+        Remove any output rows spilled to disk
+        """
+        if self.spill is not None:
+            self.spill.cleanup()
+
+
+    def combine_output(self):
+        """
+        Concatenate pending DataFrames into combined output DataFrame, with timestamps of new rows
+        parsed into internal epoch_column and columns converted to compact dtypes
+        """
+        import pandas as pd
+        from mba2mfii.accumulator import compact_frame, concat_frames
+        from mba2mfii.tools.timestamps import epoch_column, to_epoch_array
+
+        with self.lock:
+            self.flush_batch()
+
+            if self.frames:
+                frames, self.frames =   self.frames, []
+                new                 =   concat_frames(frames)
+
+                if not self.data.empty and epoch_column not in self.data.columns:
+                    self.data[epoch_column] = to_epoch_array(self.data['timestamp'].values if 'timestamp' in self.data.columns
+                                                                else [ None ] * len(self.data))
+
+                # Parse timestamps of all new rows in one vectorized pass, and convert columns to compact dtypes
+                new[epoch_column]   =   to_epoch_array(new['timestamp'].values if 'timestamp' in new.columns else [ None ] * len(new))
+                new                 =   compact_frame(new)
+
+                self.chunk_sizes    =   (self.chunk_sizes if not self.data.empty else []) + [ len(df) for df in frames ]
+                self.data           =   concat_frames(([ self.data ] if not self.data.empty else []) + [ new ])
+
+                # Batched int/float columns are left as object -- promote to float as concatenating
+                # per-export DataFrames would have, unless other values forced an object column
+                for column in self.data.columns:
+                    if pd.api.types.infer_dtype(self.data[column], skipna=False) == 'mixed-integer-float':
+                        self.data[column] = self.data[column].astype(float)
+
+
+    def get_output_columns(self):
+        """
+        Returns list of output columns, excluding internal columns
+        """
+        from mba2mfii.tools.timestamps import epoch_column
+
+        return [ column for column in self.data.columns if column != epoch_column ]
+
+
+    def get_chunk_order(self, ascending=True):
+        """
+        Returns tuple of (True, positions ordering rows by epoch_column, or None if already in order)
+        from per-chunk sorted runs, else (False, None) if some timestamps could not be parsed
+        """
+        import numpy as np
+        from mba2mfii.tools.ordering import get_sort_keys, order_chunks
+        from mba2mfii.tools.timestamps import epoch_column
+
+        if epoch_column not in self.data.columns or 'timestamp' not in self.data.columns:
+            return False, None
+        if (self.data[epoch_column].isnull().values & self.data['timestamp'].notnull().values).any():
+            return False, None
+
+        keys    =   get_sort_keys(self.data[epoch_column].values, ascending=ascending)
+        sizes   =   self.chunk_sizes if sum(self.chunk_sizes) == len(self.data) else [ len(self.data) ]
+        return True, order_chunks(np.split(keys, np.cumsum(sizes)[:-1]))
 
 
     def sort_output(self, sort_columns=None, ascending=True):
         """
-        Sort data values by sort_columns
+        Sort data values by sort_columns (stable) -- sorting by 'timestamp' alone merges per-chunk
+        sorted runs of epoch_column, skipping the sort entirely when chunks are already in order
         """
+        from mba2mfii.tools.timestamps import epoch_column
+
+        self.combine_output()
+
+        if self.is_spilled():
+            if list(sort_columns or []) in ([ 'timestamp' ], [ epoch_column ]) and ascending == self.spill.ascending:
+                self.logger.debug('sorting output while merging runs spilled to disk')
+                return
+            self.load_spilled()
+
+        ordered, order = (False, None)
+        if not self.data.empty and list(sort_columns or []) in ([ 'timestamp' ], [ epoch_column ]):
+            ordered, order = self.get_chunk_order(ascending=ascending)
+
         if self.data.empty:
-            self.logger.warn(   'skipping sort of output -- results DataFrame empty' )
+            self.logger.warning(   'skipping sort of output -- results DataFrame empty' )
+        elif ordered:
+            if order is None:
+                self.logger.debug('skipping sort of output -- rows already in order')
+            else:
+                self.data = self.data.take(order)
+            self.chunk_sizes = [ len(self.data) ]
         else:
             if (set(sort_columns) - set(self.data.columns)):
-                self.logger.error(  'skipping sort of output -- sort_columns:%s not in DataFrame columns:%s'
+                self.logger.error(  'skipping sort of output -- sort_columns:%s not in DataFrame columns:%s',
                                     (set(sort_columns) - set(self.data.columns)), self.data.columns     )
             else:
-                self.data = self.data.sort_values(by=sort_columns, ascending=ascending)
+                self.data = self.data.sort_values(by=sort_columns, ascending=ascending, kind='mergesort')
+                self.chunk_sizes = [ len(self.data) ]
+
+
+    def validate_output(self, rejected_output=None):
+        """
+        Validate combined output, removing rejected rows and writing them with reasons to rejected_output
+        (default: output filename with '.rejected' suffix)
+        """
+        import os
+        from mba2mfii.validation import Validator
+        from mba2mfii.writers import write_csv
+
+        if not self.has_output():
+            self.logger.warning('skipping validation of output -- results DataFrame empty')
+            return
+
+        validator = Validator(require_imei=self.args.get('require_imei', False))
+        if self.is_spilled():
+            return self.validate_spilled(validator, rejected_output)
+
+        self.data, rejected = validator.validate(self.data)
+        rejected_output, compression = self.get_rejected_output(rejected_output)
+
+        if rejected.empty:
+            pass
+        elif os.path.exists(rejected_output) and not self.args['clobber']:
+            self.logger.warning('skipping write to rejected rows file:%s -- file exists and clobber is False', rejected_output)
+        elif self.args['dry_run']:
+            self.logger.info('skipping write to rejected rows file:%s -- dry run is True', rejected_output)
+        else:
+            self.logger.info('writing %s rejected rows to file:%s', len(rejected), rejected_output)
+            write_csv(rejected, rejected_output, compression=compression, level=self.args.get('compression_level'),
+                        columns=self.get_output_columns() + [ 'reasons' ])
+
+
+    def validate_spilled(self, validator, rejected_output=None):
+        """
+        Validate output spilled to disk while streaming merged runs, writing rejected rows with reasons to
+        rejected_output -- valid rows are selected again by iter_output() when writing
+        """
+        import os
+        from mba2mfii.writers import write_csv_frames
+
+        rejected_output, compression = self.get_rejected_output(rejected_output)
+        stats = { 'rows': 0, 'rejected': 0, 'counts': [] }
+
+        def _iter_rejected():
+            for df in self.iter_output():
+                _, rejected, masks = validator.split(df)
+                if not stats['counts']:
+                    stats['counts'] = [ [ reason, 0 ] for reason, _ in masks ]
+                for count, (_, mask) in zip(stats['counts'], masks):
+                    count[1] += int(mask.sum())
+                stats['rows']       +=  len(df)
+                stats['rejected']   +=  len(rejected)
+                yield rejected
+
+        if (os.path.exists(rejected_output) and not self.args['clobber']) or self.args['dry_run']:
+            for _ in _iter_rejected():
+                pass
+            fp = None
+        else:
+            fp = write_csv_frames(_iter_rejected(), rejected_output, compression=compression,
+                                    level=self.args.get('compression_level'), columns=self.get_output_columns() + [ 'reasons' ])
+
+        validator.log_counts(stats['rows'], stats['rejected'], stats['counts'])
+        self.validator = validator
+
+        if not stats['rejected']:
+            pass
+        elif fp is not None:
+            self.logger.info('wrote %s rejected rows to file:%s', fp.rows, rejected_output)
+        elif self.args['dry_run']:
+            self.logger.info('skipping write to rejected rows file:%s -- dry run is True', rejected_output)
+        else:
+            self.logger.warning('skipping write to rejected rows file:%s -- file exists and clobber is False', rejected_output)
+
+
+    def get_rejected_output(self, rejected_output=None):
+        """
+        Returns tuple of (rejected rows filename, default: output filename with '.rejected' suffix, compression)
+        """
+        import os
+        from mba2mfii.writers import compressions, get_compression
+
+        if rejected_output is None:
+            compression, output = get_compression(self.output, self.args.get('compression'))
+            cext                =   compressions[compression][0] if compression else ''
+            root, ext           =   os.path.splitext(output[:len(output) - len(cext)])
+            rejected_output     =   '{0}.rejected{1}{2}'.format(root, ext or '.csv', cext)
+        else:
+            compression, rejected_output = get_compression(rejected_output)
+        return rejected_output, compression
+
+
+    def aggregate_output(self, output, size=1000.0, chunksize=1000000):
+        """
+        Aggregate combined output into hex cells per provider and write to output CSV or Parquet
+        """
+        import os
+        from mba2mfii.aggregate import HexAggregator
+
+        # Check the filename as written, e.g. with '.gz' appended by --compress gzip
+        output = HexAggregator.get_output(output, self.args.get('compression'))
+
+        if not self.has_output():
+            self.logger.warning('skipping aggregation to file:%s -- results DataFrame empty', output)
+        elif os.path.exists(output) and not self.args['clobber']:
+            self.logger.warning('skipping aggregation to file:%s -- file exists and clobber is False', output)
+        elif self.args['dry_run']:
+            self.logger.info('skipping aggregation to file:%s -- dry run is True', output)
+        else:
+            aggregator = HexAggregator(size=size)
+            for df in self.iter_output(chunksize=chunksize):
+                aggregator.update(df)
+            aggregator.write(output, compression=self.args.get('compression'), level=self.args.get('compression_level'))
+
+
+    def write_sqlite(self, path):
+        """
+        Upsert combined output rows (with epoch_column) into SQLite database path, keyed by measurement
+        """
+        from mba2mfii.tools.timestamps import epoch_column
+        from mba2mfii.writers import SQLiteWriter
+
+        if not self.has_output():
+            self.logger.warning('skipping write to database:%s -- results DataFrame empty', path)
+        elif self.args['dry_run']:
+            self.logger.info('skipping write to database:%s -- dry run is True', path)
+        else:
+            columns = self.get_output_columns() + ([ epoch_column ] if epoch_column in self.data.columns else [])
+            SQLiteWriter(path).write(self.iter_output(), columns=columns)
 
 
     def write_output(self, output=None):
@@ -66,8 +925,17 @@ class Task(object):
         """
         import os
 
+        self.combine_output()
+
+        if self.dedup is not None:
+            self.dedup.summary()
+
+        from mba2mfii.writers import ShardWriter, get_compression, write_csv, write_csv_frames
+
         if output is None:
             output = self.output
+
+        compression, output = get_compression(output, self.args.get('compression'))
         
         if not self.args['dry_run']:
             if not os.path.exists(os.path.dirname(output)):
@@ -76,16 +944,43 @@ class Task(object):
                 except:
                     pass
 
-        if self.data.empty:
-            self.logger.warn('skipping write to output file:{} -- results DataFrame empty'.format(output))
+        # Shards are split from one DataFrame -- load rows spilled to disk back into memory
+        sharded = self.args.get('shard_by') or self.args.get('max_rows') or self.args.get('max_bytes')
+        if sharded:
+            self.load_spilled()
+
+        if not self.has_output():
+            self.logger.warning('skipping write to output file:%s -- results DataFrame empty', output)
+        elif sharded:
+            self.logger.info('writing %s rows to shards of output file:%s', len(self.data), output)
+            writer = ShardWriter(   shard_by=self.args.get('shard_by'),
+                                    max_rows=self.args.get('max_rows'),
+                                    max_bytes=self.args.get('max_bytes'),
+                                    compression=compression,
+                                    level=self.args.get('compression_level'),
+                                    clobber=self.args['clobber'],
+                                    dry_run=self.args['dry_run'],
+                                    columns=self.get_output_columns()   )
+            writer.write(self.data, output)
+        elif self.is_spilled():
+            self.logger.info('writing rows merged from disk to output file:%s', output)
+            if os.path.exists(output) and not self.args['clobber']:
+                self.logger.warning('skipping write to output file:%s -- file exists and clobber is False', output)
+            elif self.args['dry_run']:
+                self.logger.info('skipping write to output file:%s -- dry run is True', output)
+            else:
+                fp = write_csv_frames(self.iter_output(), output, compression=compression,
+                                        level=self.args.get('compression_level'), columns=self.get_output_columns())
+                self.logger.info('wrote %s rows to output file:%s', fp.rows if fp is not None else 0, output)
         else:
-            self.logger.info('writing {} rows to output file:{}'.format(len(self.data), output))
+            self.logger.info('writing %s rows to output file:%s', len(self.data), output)
             if os.path.exists(output) and not self.args['clobber']:
-                self.logger.warn('skipping write to output file:{} -- file exists and clobber is False'.format(output))
+                self.logger.warning('skipping write to output file:%s -- file exists and clobber is False', output)
             elif self.args['dry_run']:
-                self.logger.info('skipping write to output file:{} -- dry run is True'.format(output))
+                self.logger.info('skipping write to output file:%s -- dry run is True', output)
             else:
-                self.data.to_csv(output, index=False)
+                write_csv(self.data, output, compression=compression, level=self.args.get('compression_level'),
+                            columns=self.get_output_columns())
 
 
 
@@ -2,11 +2,25 @@
 Common tools for use throughout script
 """
 
+import os
 import sys
 import logging
 
+from decimal import InvalidOperation, Decimal as decimal
+from distutils.util import strtobool
+
+from six import string_types, iteritems
+
 logger = logging.getLogger(__name__)
 
+# Supported JSON parsing backends, in order of preference
+json_backends   =   [ 'orjson', 'simdjson', 'ujson', 'json' ]
+
+# Environment variable used to force a specific JSON backend
+json_backend_env    =   'MBA2MFII_JSON_BACKEND'
+
+_json_loaders   =   {}
+
 
 def snake_case(string):
     from re import sub
@@ -51,4 +65,195 @@ def json_decode(obj):
         return obj
 
 
+def _coerce_scalar(obj):
+    """
+    Converts a single JSON scalar into numeric or boolean (same rules as json_decode)
+    """
+    if isinstance(obj, string_types):
+        try:
+            return int(obj) if (int(obj) == decimal(obj)) else decimal(obj)
+        except (ValueError, InvalidOperation):
+            pass
+        try:
+            return decimal(obj)
+        except (ValueError, InvalidOperation):
+            pass
+        try:
+            return bool(strtobool(obj))
+        except ValueError:
+            pass
+        return obj
+    elif isinstance(obj, (float, decimal)) and (int(obj) == decimal(obj)):
+        return int(obj)
+    else:
+        return obj
+
+
+def json_coerce(obj, depth=0):
+    """
+    Post-parse equivalent of json.load(fp, object_hook=json_decode) in a single pass
+
+    The object_hook re-decodes every value once per enclosing dict, so depth tracks the
+    number of enclosing dicts and values nested two or more dicts deep receive a second
+    conversion (e.g. '2.0' -> Decimal('2.0') -> 2) exactly as json_decode would.
+    """
+    if isinstance(obj, dict):
+        return { k: json_coerce(v, depth + 1) for k, v in iteritems(obj) }
+    elif isinstance(obj, list):
+        return [ json_coerce(v, depth) for v in obj ]
+    elif depth == 0:
+        return obj
+
+    value = _coerce_scalar(obj)
+    if depth > 1 and isinstance(value, decimal):
+        value = _coerce_scalar(value)
+    return value
+
+
+def compile_accessor(keys):
+    """
+    Returns function resolving a fixed sequence of nested dict keys, returning default if any
+    level (or the value itself) is None
+    """
+    keys = tuple(keys)
+
+    def accessor(d, default=None):
+        for key in keys:
+            if d is None:
+                return default
+            d = d.get(key)
+        return default if d is None else d
+
+    return accessor
+
+
+def compile_paths(paths):
+    """
+    Returns nested dict tree compiled from list of key paths for use with json_project
+
+    Lists are traversed transparently, '*' matches every key of a dict, and an empty node
+    selects the whole value beneath it.
+    """
+    def _merge(a, b):
+        if not a or not b:
+            return {}
+        tree = dict(a)
+        for key, sub in iteritems(b):
+            tree[key] = _merge(tree[key], sub) if key in tree else sub
+        return tree
+
+    def _expand(tree):
+        star = tree.get('*')
+        for key in tree:
+            if star is not None and key != '*':
+                tree[key] = _merge(tree[key], star)
+            _expand(tree[key])
+        return tree
+
+    tree = {}
+    for path in paths:
+        node = tree
+        for i, key in enumerate(path):
+            if key in node and not node[key]:
+                break
+            if i == len(path) - 1:
+                node[key] = {}
+            else:
+                node = node.setdefault(key, {})
+    return _expand(tree)
+
+
+def json_project(obj, tree, depth=0):
+    """
+    Returns copy of parsed JSON data containing only the paths in compiled tree, converting
+    only the projected values as per json_coerce
+    """
+    if not tree:
+        return json_coerce(obj, depth)
+    elif isinstance(obj, dict):
+        star = tree.get('*')
+        return { k: json_project(v, tree.get(k, star), depth + 1) for k, v in iteritems(obj)
+                    if (k in tree) or (star is not None) }
+    elif isinstance(obj, list):
+        return [ json_project(v, tree, depth) for v in obj ]
+    else:
+        return json_coerce(obj, depth)
+
+
+def json_coerce_fields(obj, tree, depth=0):
+    """
+    Returns parsed JSON data with only the values at paths in compiled tree converted as per
+    json_coerce, keeping all other values as parsed
+    """
+    if not tree:
+        return json_coerce(obj, depth)
+    elif isinstance(obj, dict):
+        star = tree.get('*')
+        return { k: json_coerce_fields(v, tree.get(k, star), depth + 1) if (k in tree) or (star is not None) else v
+                    for k, v in iteritems(obj) }
+    elif isinstance(obj, list):
+        return [ json_coerce_fields(v, tree, depth) for v in obj ]
+    else:
+        return json_coerce(obj, depth)
+
+
+def get_json_backend(name=None):
+    """
+    Returns tuple of (name, loads) for requested JSON backend, else the fastest installed backend
+
+    Backend may be forced via name argument or MBA2MFII_JSON_BACKEND environment variable.
+    """
+    import importlib
+
+    name = name or os.environ.get(json_backend_env) or None
+    if name is not None and name not in json_backends:
+        raise ValueError('invalid JSON backend:%s (choices:%s)' % (name, json_backends))
+
+    for backend in ([ name ] if name else json_backends):
+        if backend not in _json_loaders:
+            try:
+                module = importlib.import_module(backend)
+            except ImportError:
+                _json_loaders[backend] = None
+            else:
+                _json_loaders[backend] = getattr(module, 'loads', None)
+        if callable(_json_loaders[backend]):
+            return backend, _json_loaders[backend]
+
+    raise ValueError('JSON backend not installed:%s' % name)
+
+
+def json_parse(fp, backend=None):
+    """
+    Returns parsed JSON data from file pointer using selected backend, without conversion
+    """
+    return json_parse_text(fp.read(), backend=backend)
+
+
+def json_parse_text(text, backend=None):
+    """
+    Returns parsed JSON data from text (e.g. read ahead of parsing) using selected backend, without conversion
+    """
+    import json
+
+    name, loads = get_json_backend(backend)
+
+    try:
+        return loads(text)
+    except Exception as e:
+        if name == 'json':
+            raise
+        # Fall back to stdlib for inputs the fast backends reject (e.g. NaN, big integers)
+        logger.debug('JSON backend:%s failed (%s) -- falling back to json', name, e)
+        return json.loads(text)
+
+
+def json_load(fp, backend=None):
+    """
+    Returns decoded JSON data from file pointer using selected backend, with numeric and
+    boolean strings converted as per json_decode
+    """
+    return json_coerce(json_parse(fp, backend=backend))
+
+
 #
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized as-of joins of timestamped values onto event timestamps
+"""
+
+import numpy as np
+
+
+join_directions =   [ 'nearest', 'backward', 'forward' ]
+
+
+
+class AsOfIndex(object):
+    """
+    Sorted index over a timestamp dict, matching many event timestamps at once with binary search
+
+    Building the index sorts the m timestamps once, and each lookup of n events costs O(n log m).
+    Ties between equally distant timestamps in 'nearest' direction resolve to the timestamp that
+    came first in the dict, as sorting the dict keys by distance would.
+    """
+
+    def __init__(self, event_dict):
+        keys        =   np.asarray(list(event_dict.keys()), dtype=np.int64)
+        values      =   list(event_dict.values())
+        order       =   np.argsort(keys, kind='stable')
+
+        self.keys   =   keys[order]
+        self.ranks  =   order
+        self.values =   [ values[i] for i in order ]
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def lookup(self, timestamps, direction='nearest', tolerance=None):
+        """
+        Returns int64 array of positions in sorted keys matching each timestamp in direction
+        ('nearest', 'backward' or 'forward'), or -1 where no timestamp lies within tolerance (seconds)
+        """
+        t   =   np.asarray(timestamps, dtype=np.int64).reshape(-1)
+        n   =   len(self.keys)
+        if n == 0:
+            return np.full(len(t), -1, dtype=np.int64)
+
+        backward    =   np.searchsorted(self.keys, t, side='right') - 1
+        forward     =   np.searchsorted(self.keys, t, side='left')
+        has_b       =   backward >= 0
+        has_f       =   forward < n
+        b           =   np.clip(backward, 0, n - 1)
+        f           =   np.clip(forward, 0, n - 1)
+
+        if direction == 'backward':
+            index   =   np.where(has_b, b, -1)
+        elif direction == 'forward':
+            index   =   np.where(has_f, f, -1)
+        elif direction == 'nearest':
+            far     =   np.iinfo(np.int64).max
+            db      =   np.where(has_b, t - self.keys[b], far)
+            df      =   np.where(has_f, self.keys[f] - t, far)
+            index   =   np.where((df < db) | ((df == db) & (self.ranks[f] < self.ranks[b])), f, b)
+        else:
+            raise ValueError('invalid join direction:%s (choices:%s)' % (direction, join_directions))
+
+        if tolerance is not None:
+            distance    =   np.abs(self.keys[np.clip(index, 0, n - 1)] - t)
+            index       =   np.where((index >= 0) & (distance <= tolerance), index, -1)
+        return index
+
+
+    def get(self, timestamps, direction='nearest', tolerance=None, default=None):
+        """
+        Returns list of values matching each timestamp, else default
+        """
+        return [ self.values[i] if i >= 0 else default for i in self.lookup(timestamps, direction, tolerance) ]
+
+
+#
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming deduplication of converted measurement rows
+"""
+
+import logging
+import hashlib
+import math
+import struct
+
+from decimal import Decimal as decimal
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Deduplicator(object):
+    """
+    Drops rows whose key has already been seen, storing a 64-bit digest per key in a set
+    """
+
+    # Columns identifying a measurement (device_imei is preferred over device_id when present)
+    key_columns =   [   'device_imei', 'device_id', 'timestamp', 'download_speed', 'latency',
+                        'latitude', 'longitude'     ]
+
+    # Decimal places of key columns rounded in output (see SKLegacyExport.rounding)
+    rounding    =   {   'latitude':         8,
+                        'longitude':        8,
+                        'download_speed':   6   }
+
+    def __init__(self, **kwargs):
+        self.logger     =   logging.getLogger(__name__)
+        self.seen       =   set()
+        self.kept       =   0
+        self.dropped    =   0
+
+        # Positions of key_columns in lists of record columns, by id of the list
+        self._indexes   =   {}
+
+
+    def get_digest(self, key):
+        """
+        Returns 16-byte digest of key tuple
+        """
+        return hashlib.md5(repr(key).encode('utf-8')).digest()
+
+
+    def normalize(self, value, column):
+        """
+        Returns value of column as written to output -- a Python scalar with floats rounded as in output
+        and integral floats as int -- so equal values give equal keys whatever their dtype, else None
+        if missing
+        """
+        if isinstance(value, np.generic):
+            value = value.item()
+        elif isinstance(value, decimal):
+            value = float(value)
+
+        try:
+            if value is None or value != value:
+                return None
+        except TypeError:
+            # pandas.NA
+            return None
+
+        if isinstance(value, float):
+            if column in self.rounding:
+                value = float(np.round(value, self.rounding[column]))
+            if value.is_integer():
+                value = int(value)
+        return value
+
+
+    def get_key(self, values):
+        """
+        Returns key tuple from values ordered as key_columns, normalized as written to output
+        """
+        values = [ self.normalize(value, column) for value, column in zip(values, self.key_columns) ]
+        return tuple([ values[0] if values[0] is not None else values[1] ] + values[2:])
+
+
+    def get_indexes(self, columns):
+        """
+        Returns positions of key_columns in list of columns (None if missing), cached per list
+        """
+        cached = self._indexes.get(id(columns))
+        if cached is None or cached[0] is not columns:
+            cached = self._indexes[id(columns)] = ( columns, [ columns.index(column) if column in columns else None
+                                                                for column in self.key_columns ] )
+        return cached[1]
+
+
+    def reset(self):
+        """
+        Forgets keys seen so far, keeping counts of kept and dropped rows
+        """
+        self.seen = set()
+
+
+    def _add(self, digest):
+        value = struct.unpack('<Q', digest[:8])[0]
+        if value in self.seen:
+            return False
+        self.seen.add(value)
+        return True
+
+
+    def add(self, values):
+        """
+        Returns True if values (ordered as key_columns) were not seen before, else False
+        """
+        if self._add(self.get_digest(self.get_key(values))):
+            self.kept += 1
+            return True
+        self.dropped += 1
+        return False
+
+
+    def add_record(self, record, columns):
+        """
+        Returns True if record (list of values ordered as columns) was not seen before, else False
+        """
+        return self.add([ record[i] if i is not None else None for i in self.get_indexes(columns) ])
+
+
+    def filter_dataframe(self, df):
+        """
+        Returns pandas dataframe without rows seen before
+        """
+        if df.empty:
+            return df
+
+        arrays  =   [ df[column].values if column in df.columns else [ None ] * len(df)
+                        for column in self.key_columns ]
+        mask    =   [ self.add(values) for values in zip(*arrays) ]
+        return df if all(mask) else df[mask]
+
+
+    def summary(self):
+        """
+        Logs and returns number of duplicate rows dropped
+        """
+        self.logger.info('deduplication kept %s rows and dropped %s duplicate rows', self.kept, self.dropped)
+        return self.dropped
+
+
+
+class BloomDeduplicator(Deduplicator):
+    """
+    Drops rows whose key has probably been seen, using a Bloom filter of fixed size
+
+    Memory is bounded by capacity regardless of row count, at the cost of dropping roughly
+    error_rate of unique rows once capacity keys have been added.
+    """
+
+    def __init__(self, capacity=None, error_rate=None, **kwargs):
+        super(BloomDeduplicator, self).__init__(**kwargs)
+
+        self.capacity   =   int(capacity or 10000000)
+        self.error_rate =   float(error_rate or 1e-6)
+        self.size       =   int(math.ceil(-self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)))
+        self.hashes     =   max(1, int(round((float(self.size) / self.capacity) * math.log(2))))
+        self.bits       =   bytearray((self.size + 7) // 8)
+
+        self.logger.debug(  'initialized Bloom filter (capacity:%s error_rate:%s bits:%s hashes:%s)',
+                            self.capacity, self.error_rate, self.size, self.hashes  )
+
+
+    def reset(self):
+        """
+        Forgets keys seen so far, keeping counts of kept and dropped rows
+        """
+        self.bits = bytearray((self.size + 7) // 8)
+
+
+    def _add(self, digest):
+        h1, h2  =   struct.unpack('<QQ', digest)
+        found   =   True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.size
+            if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                found = False
+                self.bits[bit >> 3] |= (1 << (bit & 7))
+        return not found
+
+
+
+dedup_modes =   {   'hash':     Deduplicator,
+                    'bloom':    BloomDeduplicator   }
+
+
+def get_deduplicator(mode, **kwargs):
+    """
+    Returns deduplicator instance for mode ('hash' or 'bloom'), else None
+    """
+    if not mode or mode == 'none':
+        return None
+    if mode not in dedup_modes:
+        raise ValueError('invalid deduplication mode:%s (choices:%s)' % (mode, list(dedup_modes)))
+    return dedup_modes[mode](**kwargs)
+
+
+#
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Rate limiting and aggregation of repeated log messages
+"""
+
+import logging
+import threading
+
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Passes at most max_repeats records per message template (before formatting) at level, counting the rest
+
+    Records above level (e.g. errors) always pass.  A max_repeats of 0 suppresses all records at level,
+    so only the counts logged by summary() remain.
+    """
+
+    def __init__(self, max_repeats=10, level=logging.WARNING):
+        super(RepeatFilter, self).__init__()
+        self.max_repeats    =   max_repeats
+        self.level          =   level
+        self.counts         =   {}
+        self.lock           =   threading.Lock()
+
+
+    def filter(self, record):
+        # Same record is filtered by each handler -- count it once
+        passed = getattr(record, '_repeat_filter', None)
+        if passed is not None:
+            return passed
+
+        if record.levelno != self.level:
+            passed = True
+        else:
+            key = (record.name, record.msg)
+            with self.lock:
+                count = self.counts[key] = self.counts.get(key, 0) + 1
+            passed = self.max_repeats is None or count <= self.max_repeats
+
+        record._repeat_filter = passed
+        return passed
+
+
+    def summary(self, logger=None):
+        """
+        Logs and returns number of suppressed records, with a count per message template
+        """
+        logger      =   logger or logging.getLogger(__name__)
+        suppressed  =   0
+
+        with self.lock:
+            counts = sorted(self.counts.items(), key=lambda item: -item[1])
+
+        for (name, msg), count in counts:
+            if self.max_repeats is not None and count > self.max_repeats:
+                suppressed += count - self.max_repeats
+                logger.info('%s occurrences of message (%s suppressed, logger:%s): %s',
+                            count, count - self.max_repeats, name, msg)
+        return suppressed
+
+
+
+def install_repeat_filter(max_repeats=10, level=logging.WARNING, loggers=('mba2mfii', '')):
+    """
+    Returns RepeatFilter added to handlers of loggers (default: package and root loggers)
+    """
+    repeat_filter = RepeatFilter(max_repeats=max_repeats, level=level)
+    for name in loggers:
+        for handler in logging.getLogger(name).handlers:
+            handler.addFilter(repeat_filter)
+    return repeat_filter
+
+
+def remove_repeat_filter(repeat_filter, loggers=('mba2mfii', '')):
+    """
+    Removes RepeatFilter from handlers of loggers
+    """
+    for name in loggers:
+        for handler in logging.getLogger(name).handlers:
+            handler.removeFilter(repeat_filter)
+
+
+#
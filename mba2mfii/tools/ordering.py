@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Near-linear ordering of output chunks by timestamp, using per-chunk sortedness and k-way merges
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sort key of missing timestamps, placing them last as pandas sort_values() does
+missing_key =   np.iinfo(np.int64).max
+
+
+def get_sort_keys(epoch, ascending=True):
+    """
+    Returns int64 sort keys of nullable epoch seconds (negated if descending, missing values last)
+    """
+    import pandas as pd
+
+    epoch           =   pd.Series(epoch)
+    missing         =   epoch.isnull().values
+    keys            =   np.asarray(epoch.fillna(0), dtype=np.int64)
+    keys            =   keys.copy() if ascending else -keys
+    keys[missing]   =   missing_key
+    return keys
+
+
+def is_sorted(keys):
+    """
+    Returns True if keys are in (non-strictly) ascending order
+    """
+    return len(keys) < 2 or bool(np.all(keys[1:] >= keys[:-1]))
+
+
+def merge_runs(runs):
+    """
+    Returns tuple of (keys, positions) merging sorted runs, each a tuple of (keys, positions)
+
+    Runs are merged pairwise (O(n log k) for k runs), each merge placing the later run after equal
+    keys of the earlier one, so the merge is stable in run order.
+    """
+    runs = list(runs)
+    if not runs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    while len(runs) > 1:
+        merged = []
+        for i in range(0, len(runs) - 1, 2):
+            (a, a_pos), (b, b_pos) = runs[i], runs[i + 1]
+
+            b_index         =   np.searchsorted(a, b, side='right') + np.arange(len(b))
+            a_mask          =   np.ones(len(a) + len(b), dtype=bool)
+            a_mask[b_index] =   False
+
+            keys            =   np.empty(len(a) + len(b), dtype=np.int64)
+            positions       =   np.empty(len(a) + len(b), dtype=np.int64)
+            keys[a_mask], keys[b_index]             =   a, b
+            positions[a_mask], positions[b_index]   =   a_pos, b_pos
+            merged.append((keys, positions))
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+    return runs[0]
+
+
+def order_chunks(chunk_keys):
+    """
+    Returns int64 array of positions (in concatenated chunks) ordering chunks by their sort keys,
+    else None if chunks are already in order
+
+    Chunks already in order (e.g. from one time-ordered input file) are kept as-is, others are sorted
+    individually, and runs of consecutive chunks that follow on from each other are concatenated
+    before k-way merging.  Ties keep their original order.
+    """
+    runs        =   []
+    offset      =   0
+    reordered   =   False
+
+    for keys in chunk_keys:
+        positions = np.arange(offset, offset + len(keys), dtype=np.int64)
+        offset += len(keys)
+        if not len(keys):
+            continue
+
+        if is_sorted(keys):
+            pass
+        elif is_sorted(keys[::-1]) and bool(np.all(keys[1:] != keys[:-1])):
+            # Chunk in opposite order without ties -- reversing it is a stable sort
+            keys        =   keys[::-1]
+            positions   =   positions[::-1]
+            reordered   =   True
+        else:
+            order       =   np.argsort(keys, kind='stable')
+            keys        =   keys[order]
+            positions   =   positions[order]
+            reordered   =   True
+
+        # Collect pieces of each run, concatenated once below
+        if runs and runs[-1][0][-1][-1] <= keys[0]:
+            runs[-1][0].append(keys)
+            runs[-1][1].append(positions)
+        else:
+            runs.append(([ keys ], [ positions ]))
+
+    logger.debug('ordering %s rows from %s chunks in %s sorted runs', offset, len(chunk_keys), len(runs))
+    if len(runs) < 2 and not reordered:
+        return None
+    return merge_runs([ (np.concatenate(keys), np.concatenate(positions)) for keys, positions in runs ])[1]
+
+
+#
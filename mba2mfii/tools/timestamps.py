@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized parsing of measurement timestamps into int64 epoch seconds
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Timestamp format written by both app export formats, e.g. '2018-10-20T12:19:00Z'
+timestamp_format    =   '%Y-%m-%dT%H:%M:%SZ'
+timestamp_length    =   20
+
+# Internal column of int64 epoch seconds attached to output rows alongside formatted timestamps
+epoch_column        =   'timestamp_epoch'
+
+# Byte offsets of separators and digits in timestamp_format
+_separators =   { 4: b'-', 7: b'-', 10: b'T', 13: b':', 16: b':', 19: b'Z' }
+_digits     =   [ i for i in range(timestamp_length) if i not in _separators ]
+
+
+def _number(digits, start, stop):
+    value = np.zeros(len(digits), dtype=np.int64)
+    for i in range(start, stop):
+        value = value * 10 + digits[:, i].astype(np.int64)
+    return value
+
+
+def parse_fixed(values):
+    """
+    Returns tuple of (int64 array of epoch seconds, boolean array of values matching timestamp_format),
+    parsing fixed-width bytes of all values at once
+    """
+    n       =   len(values)
+    epoch   =   np.zeros(n, dtype=np.int64)
+    try:
+        raw = np.asarray(values, dtype=object).astype('S{0}'.format(timestamp_length + 1))
+    except (UnicodeError, TypeError, ValueError):
+        return epoch, np.zeros(n, dtype=bool)
+
+    chars   =   raw.view(np.uint8).reshape(n, timestamp_length + 1)
+    # uint8 arithmetic wraps characters below '0' around, so one comparison checks for digits
+    digits  =   chars[:, :timestamp_length] - np.uint8(ord('0'))
+    valid   =   (chars[:, timestamp_length] == 0) & np.all(digits[:, _digits] <= 9, axis=1)
+    for i, separator in _separators.items():
+        valid &= chars[:, i] == ord(separator)
+
+    year    =   _number(digits, 0, 4)
+    month   =   _number(digits, 5, 7)
+    day     =   _number(digits, 8, 10)
+    hour    =   _number(digits, 11, 13)
+    minute  =   _number(digits, 14, 16)
+    second  =   _number(digits, 17, 19)
+    valid   &=  (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    months  =   (np.where(valid, year, 1970) - 1970) * 12 + np.where(valid, month, 1) - 1
+    start   =   months.astype('datetime64[M]').astype('datetime64[D]')
+    days    =   (months + 1).astype('datetime64[M]').astype('datetime64[D]') - start
+    valid   &=  day <= days.astype(np.int64)
+
+    epoch[valid] = (start[valid] + (day[valid] - 1)).astype(np.int64) * 86400 \
+                    + hour[valid] * 3600 + minute[valid] * 60 + second[valid]
+    return epoch, valid
+
+
+def parse_timestamps(values):
+    """
+    Returns tuple of (int64 array of epoch seconds, boolean array of parsed values) of timestamp strings
+
+    Values in timestamp_format take a fixed-width fast path; other ISO 8601 variants (e.g. with
+    fractional seconds or UTC offsets) fall back to pandas.  Missing or unparsable values are not parsed.
+    """
+    import pandas as pd
+
+    values          =   np.asarray(values, dtype=object)
+    epoch, valid    =   parse_fixed(values)
+    if valid.all():
+        return epoch, valid
+
+    others  =   pd.Series(values[~valid])
+    try:
+        parsed = pd.to_datetime(others, format='ISO8601', errors='coerce', utc=True)
+    except (TypeError, ValueError):
+        # pandas < 2.0 infers ISO 8601 formats per value
+        parsed = pd.to_datetime(others, errors='coerce', utc=True)
+
+    index           =   np.flatnonzero(~valid)
+    parsed_mask     =   parsed.notnull().values
+    epoch[index]    =   np.where(parsed_mask, parsed.dt.tz_localize(None).values.astype('datetime64[s]').astype(np.int64), 0)
+    valid[index]    =   parsed_mask
+    return epoch, valid
+
+
+def to_epoch_array(values):
+    """
+    Returns pandas nullable Int64 array of epoch seconds of timestamp strings, with missing or
+    unparsable values as NA
+    """
+    import pandas as pd
+
+    epoch, valid = parse_timestamps(values)
+    return pd.arrays.IntegerArray(epoch, ~valid)
+
+
+def parse_timestamp(value):
+    """
+    Returns epoch seconds of a single timestamp string, else None
+    """
+    epoch, valid = parse_timestamps([ value ])
+    return int(epoch[0]) if valid[0] else None
+
+
+#
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import os, sys
+import logging
+
+import warnings
+warnings.filterwarnings('ignore', message='numpy.dtype size changed')
+warnings.filterwarnings('ignore', message='numpy.ufunc size changed')
+
+import numpy as np
+import pandas as pd
+
+
+
+class Validator(object):
+    """
+    Vectorized validation of Challenge Speed Test rows, splitting a DataFrame into valid and rejected rows
+    """
+
+    # Columns that must be present and not null
+    required    =   [   'latitude', 'longitude', 'timestamp', 'provider_id', 'device_id' ]
+
+    # Inclusive (min, max) ranges for numeric columns
+    ranges      =   {   'latitude':         (-90.0,     90.0    ),
+                        'longitude':        (-180.0,    180.0   ),
+                        'signal_strength':  (-150.0,    -20.0   ),
+                        'download_speed':   (0.000001,  10000.0 ),
+                        'latency':          (1,         10000   )   }
+
+    imei_regex  =   r'^\d{15,16}$'
+
+    def __init__(self, require_imei=False, **kwargs):
+        self.logger         =   logging.getLogger(__name__)
+        self.require_imei   =   require_imei
+
+
+    def get_masks(self, df):
+        """
+        Returns list of (reason, mask) tuples where mask is True for rows failing the check
+        """
+        masks   =   [ ]
+
+        for column in self.required:
+            if column in df.columns:
+                masks.append(('missing_{}'.format(column), df[column].isnull().values))
+            else:
+                masks.append(('missing_{}'.format(column), np.ones(len(df), dtype=bool)))
+
+        for column, (vmin, vmax) in sorted(self.ranges.items()):
+            if column not in df.columns:
+                continue
+            values  =   pd.to_numeric(df[column], errors='coerce').values.astype(float)
+            present =   ~np.isnan(values)
+            with np.errstate(invalid='ignore'):
+                masks.append(('invalid_{}'.format(column), present & ((values < vmin) | (values > vmax))))
+            if column not in self.required:
+                masks.append(('missing_{}'.format(column), ~present))
+
+        if 'latitude' in df.columns and 'longitude' in df.columns:
+            lat     =   pd.to_numeric(df['latitude'], errors='coerce').values.astype(float)
+            lon     =   pd.to_numeric(df['longitude'], errors='coerce').values.astype(float)
+            masks.append(('null_island_coordinates', (lat == 0) & (lon == 0)))
+
+        if 'measurement_server_location' in df.columns:
+            location = df['measurement_server_location']
+            masks.append(('missing_measurement_server_location', (location.isnull() | (location == 'N/A')).values))
+
+        if 'device_imei' in df.columns:
+            imei    =   df['device_imei']
+            present =   imei.notnull().values
+            valid   =   imei.astype(str).str.match(self.imei_regex).fillna(False).values.astype(bool)
+            masks.append(('invalid_device_imei', present & ~valid))
+            if self.require_imei:
+                masks.append(('missing_device_imei', ~present))
+        elif self.require_imei:
+            masks.append(('missing_device_imei', np.ones(len(df), dtype=bool)))
+
+        return masks
+
+
+    def split(self, df):
+        """
+        Returns tuple of (valid, rejected, masks), where rejected DataFrame includes a 'reasons' column,
+        without logging
+        """
+        masks   =   self.get_masks(df)
+        failed  =   np.zeros(len(df), dtype=bool)
+        for _, mask in masks:
+            failed  |=  mask
+
+        valid       =   df[~failed]
+        rejected    =   df[failed].copy()
+
+        if failed.any():
+            reasons =   np.array([ '' ] * int(failed.sum()), dtype=object)
+            for reason, mask in masks:
+                reasons[mask[failed]] += reason + ';'
+            rejected['reasons'] = [ reason.rstrip(';') for reason in reasons ]
+        else:
+            rejected['reasons'] = pd.Series([], dtype=object)
+
+        return valid, rejected, masks
+
+
+    def log_counts(self, rows, rejected, counts):
+        """
+        Logs rows rejected per reason, from list of (reason, count) tuples, and numbers of valid and rejected rows
+        """
+        for reason, count in counts:
+            if count:
+                self.logger.info('rejected %s rows -- %s', count, reason)
+
+        self.logger.info('validated %s rows -- %s valid, %s rejected', rows, rows - rejected, rejected)
+
+
+    def validate(self, df):
+        """
+        Returns tuple of (valid, rejected) DataFrames, where rejected includes a 'reasons' column
+        """
+        valid, rejected, masks = self.split(df)
+        self.log_counts(len(df), len(rejected), [ (reason, int(mask.sum())) for reason, mask in masks ])
+        return valid, rejected
+
+
+#
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Work queue of input file chunks in a shared folder, claimed by batch workers on one or more machines
+using lock files
+"""
+
+import os, sys
+import errno
+import logging
+import json
+import time
+
+
+def _create_exclusive(path, data):
+    """
+    Returns True if file path was created (atomically, failing if it exists) with JSON data, else False
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return False
+        raise
+
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(data, fp)
+    return True
+
+
+def _write_atomic(path, data):
+    """
+    Writes JSON data to file path, replacing any existing file atomically
+    """
+    with open(path + '.tmp', 'w') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+    getattr(os, 'replace', os.rename)(path + '.tmp', path)
+
+
+
+class WorkQueue(object):
+    """
+    Chunks of input files listed in a manifest in a shared folder, each claimed by one worker
+
+    Workers claim a chunk by creating its lock file exclusively, which is atomic on local and network
+    filesystems, so no server or database is needed.  The first worker writes the manifest; workers started
+    with a different input list use the manifest.  Each completed chunk leaves a partial output folder (a
+    run of blocks sorted by timestamp, see mba2mfii.accumulator) and a done marker; the worker completing
+    the last chunk merges partial outputs.  Workers refresh their claims every touch_interval seconds while
+    converting, and claims not refreshed for stale seconds (default: stale_intervals refreshes missed, e.g.
+    by crashed workers) are taken over.  Failed chunks are skipped until their failed marker (in folder
+    'failed') is removed.
+    """
+
+    manifest_file   =   'manifest.json'
+    chunk_template  =   'chunk-{0:06d}'
+    touch_interval  =   10.0
+    stale_intervals =   6
+
+    def __init__(self, path, chunk_files=None, stale=None, worker=None, wait=600, **kwargs):
+        import socket
+
+        self.logger         =   logging.getLogger(__name__)
+        self.path           =   path
+        self.chunk_files    =   int(chunk_files or 100)
+        self.stale          =   stale or self.touch_interval * self.stale_intervals
+        self.worker         =   worker or '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self.wait           =   wait
+        self.chunks         =   []
+        self._touched       =   0.0
+
+
+    def get_path(self, folder, chunk=None, ext=''):
+        """
+        Returns path of folder in queue, or of chunk (with ext) in folder
+        """
+        if chunk is None:
+            return os.path.join(self.path, folder)
+        return os.path.join(self.path, folder, self.chunk_template.format(chunk) + ext)
+
+
+    def create(self, files):
+        """
+        Writes manifest of files in chunks of chunk_files, unless another worker has, and loads chunks
+        """
+        for folder in [ 'claims', 'done', 'failed', 'parts' ]:
+            try:
+                os.makedirs(self.get_path(folder))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        manifest_path = os.path.join(self.path, self.manifest_file)
+        if _create_exclusive(manifest_path + '.lock', { 'worker': self.worker }):
+            if not os.path.exists(manifest_path):
+                chunks = [ list(files[i:i + self.chunk_files]) for i in range(0, len(files), self.chunk_files) ]
+                _write_atomic(manifest_path, { 'chunk_files': self.chunk_files, 'chunks': chunks })
+                self.logger.info('queued %s input files in %s chunks in folder:%s', len(files), len(chunks), self.path)
+
+        # Another worker is writing the manifest
+        start = time.time()
+        while not os.path.exists(manifest_path):
+            if time.time() - start > self.wait:
+                raise IOError('timed out waiting for work queue manifest:%s' % manifest_path)
+            time.sleep(0.1)
+
+        with open(manifest_path, 'r') as fp:
+            self.chunks = json.load(fp)['chunks']
+
+        queued = [ fp for chunk in self.chunks for fp in chunk ]
+        if files and sorted(queued) != sorted(files):
+            self.logger.warning('using %s input files queued in folder:%s -- %s input files given',
+                                len(queued), self.path, len(files))
+        return self.chunks
+
+
+    def is_done(self, chunk):
+        return os.path.exists(self.get_path('done', chunk, '.json'))
+
+
+    def is_failed(self, chunk):
+        return os.path.exists(self.get_path('failed', chunk, '.json'))
+
+
+    def claim(self):
+        """
+        Returns index of a chunk claimed by this worker, else None if no chunks are left to claim
+        """
+        for chunk in range(len(self.chunks)):
+            if self.is_done(chunk) or self.is_failed(chunk):
+                continue
+
+            claim_path = self.get_path('claims', chunk, '.lock')
+            if _create_exclusive(claim_path, { 'worker': self.worker, 'time': time.time() }):
+                return chunk
+
+            if self.take_over(chunk, claim_path):
+                return chunk
+        return None
+
+
+    def take_over(self, chunk, claim_path):
+        """
+        Returns True if claim of chunk older than stale seconds was taken over by this worker
+        """
+        try:
+            age = time.time() - os.path.getmtime(claim_path)
+        except OSError:
+            return False
+        if age < self.stale:
+            return False
+
+        # Only one worker can rename the stale claim away
+        stale_path = '{0}.{1}'.format(claim_path, self.worker)
+        try:
+            os.rename(claim_path, stale_path)
+        except OSError:
+            return False
+        os.remove(stale_path)
+
+        if not _create_exclusive(claim_path, { 'worker': self.worker, 'time': time.time() }):
+            return False
+        self.logger.warning('took over claim of chunk:%s idle for %.0f seconds', chunk + 1, age)
+        return True
+
+
+    def touch(self, chunk, every=None):
+        """
+        Refreshes claim of chunk (at most once every seconds, default: touch_interval) while this worker
+        converts it, so the claim is not taken over as stale
+        """
+        now = time.time()
+        if now - self._touched < (self.touch_interval if every is None else every):
+            return
+        try:
+            os.utime(self.get_path('claims', chunk, '.lock'), None)
+        except OSError as e:
+            self.logger.warning('cannot refresh claim of chunk:%s -- %s', chunk + 1, e)
+        self._touched = now
+
+
+    def complete(self, chunk, rows):
+        """
+        Marks chunk as done by this worker, with number of rows in its partial output
+        """
+        _write_atomic(self.get_path('done', chunk, '.json'), { 'worker': self.worker, 'rows': rows })
+        self.logger.info('completed chunk:%s of %s -- %s rows', chunk + 1, len(self.chunks), rows)
+
+
+    def fail(self, chunk, error):
+        """
+        Marks chunk as failed by this worker with error reason and releases its claim, so removing the
+        failed marker queues the chunk again
+        """
+        self.logger.error('failed chunk:%s -- %s: %s', chunk + 1, type(error).__name__, error)
+        _write_atomic(self.get_path('failed', chunk, '.json'), {   'worker':   self.worker,
+                                                                    'error':    type(error).__name__,
+                                                                    'reason':   str(error)  })
+        try:
+            os.remove(self.get_path('claims', chunk, '.lock'))
+        except OSError:
+            pass
+
+
+    def get_status(self):
+        """
+        Returns tuple of (number of chunks, done chunks, failed chunks)
+        """
+        return ( len(self.chunks),
+                 sum(1 for chunk in range(len(self.chunks)) if self.is_done(chunk)),
+                 sum(1 for chunk in range(len(self.chunks)) if self.is_failed(chunk)) )
+
+
+    def get_claimed(self):
+        """
+        Returns list of chunks claimed (by any worker) that are neither done nor failed
+        """
+        return [ chunk for chunk in range(len(self.chunks))
+                    if not self.is_done(chunk) and not self.is_failed(chunk)
+                    and os.path.exists(self.get_path('claims', chunk, '.lock')) ]
+
+
+    def claim_merge(self):
+        """
+        Returns True if this worker claimed the final merge of partial outputs
+        """
+        return _create_exclusive(os.path.join(self.path, 'merge.lock'), { 'worker': self.worker, 'time': time.time() })
+
+
+    def get_parts(self):
+        """
+        Returns list of tuples of (partial output folder, number of rows) of done chunks, in input order
+        """
+        parts = []
+        for chunk in range(len(self.chunks)):
+            with open(self.get_path('done', chunk, '.json'), 'r') as fp:
+                parts.append(( self.get_path('parts', chunk), json.load(fp)['rows'] ))
+        return parts
+
+
+#
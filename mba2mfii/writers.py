@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+
+import os, sys
+import logging
+import hashlib
+import json
+
+from glob import glob
+from re import sub
+
+import warnings
+warnings.filterwarnings('ignore', message='numpy.dtype size changed')
+warnings.filterwarnings('ignore', message='numpy.ufunc size changed')
+
+import pandas as pd
+
+
+
+# Supported output compressions as name: (extension, default level)
+compressions    =   {   'gzip': ('.gz',     6),
+                        'bz2':  ('.bz2',    9),
+                        'xz':   ('.xz',     6),
+                        'zstd': ('.zst',    3)  }
+
+# Valid compression levels as name: (lowest, highest)
+compression_levels  =   {   'gzip': (1, 9),
+                            'bz2':  (1, 9),
+                            'xz':   (0, 9),
+                            'zstd': (1, 22) }
+
+
+def zstd_available():
+    """
+    Returns True if the optional zstandard package is installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return False
+    return True
+
+
+def get_compression(output, compression=None):
+    """
+    Returns tuple of (compression, output) detecting compression from output extension when
+    compression is None or 'auto', and appending the extension to output when missing
+    """
+    if compression in (None, 'auto'):
+        compression = next((name for name, (ext, _) in compressions.items() if output.endswith(ext)), None)
+    elif compression == 'none':
+        compression = None
+    elif compression not in compressions:
+        raise ValueError('invalid compression:%s (choices:%s)' % (compression, list(compressions)))
+
+    if compression == 'zstd' and not zstd_available():
+        raise ValueError('zstd compression requires the zstandard package')
+
+    if compression and not output.endswith(compressions[compression][0]):
+        output = output + compressions[compression][0]
+    return compression, output
+
+
+def check_level(compression, level):
+    """
+    Returns compression level (default for compression if None), else ValueError if out of range
+    """
+    if compression is None or level is None:
+        return level if compression is None else compressions[compression][1]
+
+    lowest, highest = compression_levels[compression]
+    if not lowest <= int(level) <= highest:
+        raise ValueError('invalid %s compression level:%s (choices:%s to %s)' % (compression, level, lowest, highest))
+    return int(level)
+
+
+class _HashingFile(object):
+    """
+    Binary file wrapper computing SHA-256 checksum and size of bytes written to disk
+    """
+
+    def __init__(self, path):
+        self.fp     =   open(path, 'wb')
+        self.sha256 =   hashlib.sha256()
+        self.size   =   0
+
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size   +=  len(data)
+        return self.fp.write(data)
+
+
+    def flush(self):
+        self.fp.flush()
+
+
+    def close(self):
+        self.fp.close()
+
+
+
+class OutputFile(object):
+    """
+    Output file (optionally compressed) tracking rows, uncompressed bytes, and size and
+    SHA-256 checksum of the file written to disk
+    """
+
+    def __init__(self, path, key=None, header=b'', compression=None, level=None):
+        self.path           =   path
+        self.key            =   key
+        self.rows           =   0
+        self.bytes          =   0
+        self.compression    =   compression
+        level               =   check_level(compression, level)
+        self.raw            =   _HashingFile(path)
+
+        try:
+            self.open(compression, level)
+            self.write(header)
+        except Exception:
+            self.discard()
+            raise
+
+
+    def open(self, compression, level):
+        """
+        Opens (compressing) stream writing to raw file
+        """
+        if compression is None:
+            self.fp =   self.raw
+        else:
+            if compression == 'gzip':
+                import gzip
+                self.fp =   gzip.GzipFile(filename='', mode='wb', compresslevel=level, fileobj=self.raw)
+            elif compression == 'bz2':
+                import bz2
+                self.fp =   bz2.BZ2File(self.raw, mode='wb', compresslevel=level)
+            elif compression == 'xz':
+                import lzma
+                self.fp =   lzma.LZMAFile(self.raw, mode='wb', preset=level)
+            elif compression == 'zstd':
+                import zstandard
+                self.fp =   zstandard.ZstdCompressor(level=level).stream_writer(self.raw, closefd=False)
+            else:
+                raise ValueError('invalid compression:%s' % compression)
+
+
+    def write(self, data, rows=0):
+        self.fp.write(data)
+        self.bytes  +=  len(data)
+        self.rows   +=  rows
+
+
+    def close(self):
+        if self.fp is not self.raw:
+            self.fp.close()
+        self.raw.close()
+
+
+    def discard(self):
+        """
+        Closes and removes partially written file (e.g. after an error)
+        """
+        try:
+            if getattr(self, 'fp', None) is not None and self.fp is not self.raw:
+                self.fp.close()
+        except Exception:
+            pass
+        self.raw.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def to_dict(self):
+        return {    'file':     os.path.basename(self.path),
+                    'key':      self.key,
+                    'rows':     self.rows,
+                    'bytes':    self.bytes,
+                    'size':     self.raw.size,
+                    'sha256':   self.raw.sha256.hexdigest()     }
+
+
+def iter_csv_chunks(df, chunksize=100000, columns=None):
+    """
+    Yields tuples of (encoded CSV text without header, rows) for chunks of df (only columns, if given),
+    preserving row order
+    """
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize]
+        yield chunk.to_csv(index=False, header=False, columns=columns).encode('utf-8'), len(chunk)
+
+
+def write_csv(df, output, compression=None, level=None, chunksize=100000, columns=None):
+    """
+    Streams df (only columns, if given) to output CSV in chunks, compressing while writing, and returns OutputFile
+    """
+    header  =   df.iloc[:0].to_csv(index=False, columns=columns).encode('utf-8')
+    fp      =   OutputFile(output, header=header, compression=compression, level=level)
+    try:
+        for data, rows in iter_csv_chunks(df, chunksize=chunksize, columns=columns):
+            fp.write(data, rows)
+    except Exception:
+        fp.discard()
+        raise
+    fp.close()
+    return fp
+
+
+def write_csv_frames(frames, output, compression=None, level=None, chunksize=100000, columns=None):
+    """
+    Streams pandas DataFrames (only columns, if given) to one output CSV, compressing while writing, and
+    returns OutputFile, else None if all frames are empty (no file written)
+    """
+    fp = None
+    try:
+        for df in frames:
+            if df.empty:
+                continue
+            if fp is None:
+                header  =   df.iloc[:0].to_csv(index=False, columns=columns).encode('utf-8')
+                fp      =   OutputFile(output, header=header, compression=compression, level=level)
+            for data, rows in iter_csv_chunks(df, chunksize=chunksize, columns=columns):
+                fp.write(data, rows)
+    except Exception:
+        if fp is not None:
+            fp.discard()
+        raise
+    if fp is not None:
+        fp.close()
+    return fp
+
+
+
+class ShardWriter(object):
+    """
+    Writes sorted pandas DataFrame to CSV shards split by column value and/or size, with a JSON manifest
+    """
+
+    shard_columns   =   [ 'provider_id', 'device_id' ]
+
+    def __init__(self, shard_by=None, max_rows=None, max_bytes=None, chunksize=100000,
+                    compression=None, level=None, **kwargs):
+        self.logger     =   logging.getLogger(__name__)
+
+        if shard_by is not None and shard_by not in self.shard_columns:
+            raise ValueError('invalid shard_by column:%s (choices:%s)' % (shard_by, self.shard_columns))
+
+        self.shard_by   =   shard_by
+        self.max_rows   =   int(max_rows) if max_rows else None
+        self.max_bytes  =   int(max_bytes) if max_bytes else None
+        self.chunksize  =   int(chunksize)
+        self.compression=   compression
+        self.level      =   level
+        self.clobber    =   kwargs.get('clobber', False)
+        self.dry_run    =   kwargs.get('dry_run', False)
+        self.columns    =   kwargs.get('columns')
+
+
+    def get_paths(self, output):
+        """
+        Returns tuple of (shard path template, manifest path) for output filename
+        """
+        cext        =   compressions[self.compression][0] if self.compression else ''
+        root, ext   =   os.path.splitext(output[:len(output) - len(cext)])
+        return '{0}.{{label}}{1}{2}'.format(root, ext or '.csv', cext), '{0}.manifest.json'.format(root)
+
+
+    def get_labels(self, df):
+        """
+        Returns pandas Series of shard labels for each row, e.g. 'provider_id-70' (or '' if not sharding by column)
+        """
+        def _format_key(val):
+            if val is None or val != val:
+                return 'none'
+            if isinstance(val, float) and val.is_integer():
+                val = int(val)
+            return sub(r'[^\w.-]+', '_', str(val))
+
+        if self.shard_by is None:
+            return pd.Series('', index=df.index)
+        return df[self.shard_by].map(lambda x: '{0}-{1}'.format(self.shard_by, _format_key(x)))
+
+
+    def iter_lines(self, df):
+        """
+        Yields tuples of (encoded line, rows) rendered in chunks, preserving row order
+        """
+        for data, rows in iter_csv_chunks(df, chunksize=self.chunksize, columns=self.columns):
+            eol     =   b'\r\n' if data.endswith(b'\r\n') else b'\n'
+            lines   =   data[:-len(eol)].split(eol)
+
+            if len(lines) != rows:
+                # Embedded line breaks in values -- keep whole chunk together
+                self.logger.warning('cannot split %s rows into lines -- writing chunk as a single block', rows)
+                yield data, rows
+            else:
+                for line in lines:
+                    yield line + eol, 1
+
+
+    def write(self, df, output):
+        """
+        Writes rows of df (already sorted) to shards named after output, returns manifest dict
+        """
+        self.compression, output = get_compression(output, self.compression)
+        template, manifest_path = self.get_paths(output)
+
+        existing = [ path for path in glob(template.format(label='*[0-9][0-9][0-9][0-9]')) + [ manifest_path ] if os.path.exists(path) ]
+        if existing and not self.clobber:
+            self.logger.warning('skipping write of shards for output file:%s -- %s files exist and clobber is False',
+                                output, len(existing))
+            return None
+        elif self.dry_run:
+            self.logger.info('skipping write of shards for output file:%s -- dry run is True', output)
+            return None
+
+        for path in existing:
+            os.remove(path)
+
+        header  =   df.iloc[:0].to_csv(index=False, columns=self.columns).encode('utf-8')
+        labels  =   self.get_labels(df)
+        shards  =   []
+
+        shard   =   None
+        try:
+            for label, group in df.groupby(labels, sort=True):
+                shard   =   None
+                index   =   0
+                for line, rows in self.iter_lines(group):
+                    if shard is None or \
+                            (self.max_rows and shard.rows + rows > self.max_rows) or \
+                            (self.max_bytes and shard.rows and shard.bytes + len(line) > self.max_bytes):
+                        if shard is not None:
+                            shard.close()
+                        index   +=  1
+                        shard   =   OutputFile( template.format(label='.'.join([ label, '{0:04d}'.format(index) ]).lstrip('.')),
+                                                    key=(label or None), header=header,
+                                                    compression=self.compression, level=self.level  )
+                        shards.append(shard)
+                    shard.write(line, rows)
+                if shard is not None:
+                    shard.close()
+                    shard = None
+        except Exception:
+            # Remove shards of the incomplete output, so no manifest refers to them
+            if shard is not None:
+                shard.discard()
+            for written in shards:
+                if written is not shard and os.path.exists(written.path):
+                    os.remove(written.path)
+            raise
+
+        manifest    =   {   'output':       os.path.basename(output),
+                            'compression':  self.compression,
+                            'shard_by':     self.shard_by,
+                            'max_rows':     self.max_rows,
+                            'max_bytes':    self.max_bytes,
+                            'rows':         sum(shard.rows for shard in shards),
+                            'shards':       [ shard.to_dict() for shard in shards ]     }
+
+        with open(manifest_path, 'w') as fp:
+            json.dump(manifest, fp, indent=2)
+
+        self.logger.info('wrote %s rows to %s shards (manifest:%s)', manifest['rows'], len(shards), manifest_path)
+        return manifest
+
+
+
+class SQLiteWriter(object):
+    """
+    Upserts rows into a SQLite database table, keyed by a natural measurement key so re-runs update
+    existing rows and the database serves as an incremental store
+
+    Rows are bulk-inserted with executemany() (one prepared statement) in a transaction per chunk, with
+    the database in WAL mode.  The measurement key joins device (Device IMEI, else Device ID), timestamp,
+    download speed, latency and coordinates, as used for deduplication.
+    """
+
+    table           =   'measurements'
+    key_column      =   'measurement_key'
+    index_columns   =   [ 'provider_id', 'device_id', 'timestamp' ]
+
+    # SQLite column types of compact output dtypes (see mba2mfii.accumulator.compact_dtypes)
+    dtype_types     =   {   'float64':  'REAL',
+                            'Int32':    'INTEGER',
+                            'Int64':    'INTEGER',
+                            'category': 'TEXT'      }
+
+    def __init__(self, path, table=None, chunksize=100000, **kwargs):
+        self.logger     =   logging.getLogger(__name__)
+        self.path       =   path
+        self.table      =   table or self.table
+        self.chunksize  =   int(chunksize)
+
+
+    def get_type(self, column):
+        """
+        Returns SQLite column type of output column from its compact dtype, else '' (no type, so values
+        are stored as given) -- the values of one run need not show the type of values of later runs
+        """
+        from mba2mfii.accumulator import compact_dtypes
+        from mba2mfii.tools.timestamps import epoch_column
+
+        if column == epoch_column:
+            return 'INTEGER'
+        return self.dtype_types.get(compact_dtypes.get(column), '')
+
+
+    @staticmethod
+    def get_values(series):
+        """
+        Returns list of values of pandas Series as Python types SQLite accepts, with missing values as None
+        """
+        import numpy as np
+        from decimal import Decimal
+
+        values = series.to_numpy(dtype=object, na_value=None)
+        return [ value.item() if isinstance(value, np.generic) else
+                 float(value) if isinstance(value, Decimal) else value for value in values ]
+
+
+    def get_keys(self, df):
+        """
+        Returns list of measurement keys of rows of df, with values normalized as written to output (see
+        Deduplicator.normalize()) so keys do not depend on column dtypes, e.g. 75 and 75.0
+        """
+        from mba2mfii.tools.dedup import Deduplicator
+
+        dedup   =   Deduplicator()
+        columns =   [ df[column].to_numpy(dtype=object) if column in df.columns else [ None ] * len(df)
+                        for column in dedup.key_columns ]
+        return [ '|'.join('' if value is None else str(value) for value in dedup.get_key(values))
+                    for values in zip(*columns) ]
+
+
+    def connect(self, columns):
+        """
+        Returns SQLite connection in WAL mode with table and key index created for columns, adding any
+        columns missing from an existing table
+        """
+        import sqlite3
+
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+        conn.execute('CREATE TABLE IF NOT EXISTS "{0}" ("{1}" TEXT NOT NULL)'.format(self.table, self.key_column))
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'.format(self.table, self.key_column))
+
+        existing = set(row[1] for row in conn.execute('PRAGMA table_info("{0}")'.format(self.table)))
+        for column in columns:
+            if column not in existing:
+                conn.execute('ALTER TABLE "{0}" ADD COLUMN "{1}" {2}'.format(self.table, column, self.get_type(column)).rstrip())
+        conn.commit()
+        return conn
+
+
+    def get_statement(self, columns):
+        """
+        Returns upsert statement for columns (replacing rows on SQLite versions before 3.24)
+        """
+        import sqlite3
+
+        names   =   ', '.join('"{0}"'.format(column) for column in [ self.key_column ] + columns)
+        params  =   ', '.join([ '?' ] * (len(columns) + 1))
+
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            return 'INSERT OR REPLACE INTO "{0}" ({1}) VALUES ({2})'.format(self.table, names, params)
+
+        updates = ', '.join('"{0}" = excluded."{0}"'.format(column) for column in columns)
+        return 'INSERT INTO "{0}" ({1}) VALUES ({2}) ON CONFLICT ("{3}") DO UPDATE SET {4}'.format(
+                    self.table, names, params, self.key_column, updates)
+
+
+    def write(self, frames, columns=None):
+        """
+        Upserts rows of pandas DataFrames (only columns, if given), creating indexes on index_columns,
+        returns number of rows written
+        """
+        conn, statement, rows = None, None, 0
+        try:
+            for df in frames:
+                if df.empty:
+                    continue
+                if conn is None:
+                    columns     =   list(columns or df.columns)
+                    conn        =   self.connect(columns)
+                    statement   =   self.get_statement(columns)
+
+                for start in range(0, len(df), self.chunksize):
+                    chunk   =   df.iloc[start:start + self.chunksize]
+                    values  =   [ self.get_keys(chunk) ] + [ self.get_values(chunk[column]) for column in columns ]
+                    with conn:
+                        conn.executemany(statement, zip(*values))
+                    rows    +=  len(chunk)
+
+            # Indexes are built once after bulk inserts into a new table, and maintained on re-runs
+            if conn is not None:
+                for column in self.index_columns:
+                    if column in columns:
+                        conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'.format(self.table, column))
+                conn.commit()
+                total = conn.execute('SELECT COUNT(*) FROM "{0}"'.format(self.table)).fetchone()[0]
+                self.logger.info('upserted %s rows into table:%s of database:%s (%s rows)', rows, self.table, self.path, total)
+        finally:
+            if conn is not None:
+                conn.close()
+        return rows
+
+
+#
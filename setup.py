@@ -34,7 +34,7 @@ requirements = [
 setup(
     name='mba2mfii',
     version=get_version(),
-    requires_python='>=2.7',
+    python_requires='>=3.7',
     description='MBA2MFII is a tool to convert MBA-exported JSON file inputs into an MF-II Challenge Speed Test CSV file output',
     license='BSD',
     author='Jonathan McCormack',
@@ -42,6 +42,8 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        'parquet':  [ 'pyarrow' ]   },
     entry_points='''
         [console_scripts]
         mba2mfii=mba2mfii.scripts:cli
@@ -52,8 +54,8 @@ setup(
         'Intended Audience :: Telecommnications Industry',
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Topic :: Communications',
         'Topic :: Utilities' ])
 
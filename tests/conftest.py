@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic app exports and command-line runs shared by tests
+"""
+
+import os, sys
+import json
+import random
+import subprocess
+
+import pytest
+
+
+ROOT    =   os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_legacy_export(i, rng, minutes=60):
+    """
+    Returns legacy app export data (list with one submission) of two download tests, in minute i % minutes
+    """
+    base    =   1534300000 + i * 1000
+    metrics =   []
+    tests   =   []
+
+    for k in range(3):
+        t = base + k * 37
+        metrics.append({    'type': 'location', 'timestamp': str(t), 'accuracy': '12.0',
+                            'latitude': str(40.1 + rng.random()), 'longitude': str(-75.2 - rng.random())   })
+        metrics.append({    'type': 'network_data', 'timestamp': str(t + 1), 'phone_type': 'GSM', 'phone_type_code': '1',
+                            'network_type': 'LTE', 'network_type_code': '13'    })
+        metrics.append({    'type': 'gsm_cell_location', 'timestamp': str(t + 2), 'signal_strength': str(rng.randint(5, 30))  })
+    metrics.append({ 'type': 'phone_identity', 'timestamp': str(base), 'manufacturer': 'samsung', 'model': 'SM-G930R6' })
+
+    for k in range(2):
+        t = base + 5 + k * 50
+        tests.append({  'type': 'CLOSESTTARGET', 'timestamp': str(t), 'success': 'true', 'closest_target': 'n1-dallas',
+                        'datetime': '2018-08-15T10:%02d:%02d.000-0400' % (i % minutes, k), 'ip_closest_target': '1.2.3.4'  })
+        tests.append({  'type': 'JHTTPGETMT', 'timestamp': str(t + 3), 'success': 'true', 'target': 'n1-dallas',
+                        'datetime': '2018-08-15T10:%02d:%02d.000-0400' % (i % minutes, k + 10),
+                        'bytes_sec': str(rng.randint(100000, 9000000)), 'target_ipaddress': '1.2.3.4'    })
+        tests.append({  'type': 'JHTTPPOSTMT', 'timestamp': str(t + 4), 'datetime': 'x', 'success': 'true',
+                        'bytes_sec': str(rng.randint(100000, 900000))   })
+        tests.append({  'type': 'JUDPLATENCY', 'timestamp': str(t + 6), 'datetime': 'y', 'success': 'true',
+                        'rtt_avg': str(rng.randint(20000, 90000)), 'rtt_stddev': '1234', 'lost_packets': '1',
+                        'received_packets': '99'    })
+
+    return [ {  'enterprise_id': 'FCC_Public', 'timestamp': str(base), 'datetime': '2018-08-15', 'timezone': '-4',
+                'sim_operator_code': '310750' if i % 2 else '311480', 'app_version_code': '20', 'conditions': [],
+                'metrics': metrics, 'requested_tests': [ 'CLOSESTTARGET', 'JHTTPGETMT' ], 'tests': tests    } ]
+
+
+def make_modern_export(i, rng, timestamp=None):
+    """
+    Returns modern app export data of one download test at timestamp (default: one per day and minute)
+    """
+    env = { 'location':     { 'lat': 40.5 + rng.random(), 'lon': -75.5 + rng.random() },
+            'telephony':    { 'cellular_strength': -90 - rng.randint(0, 20) }   }
+    return {    'metadata':             { 'app': '2.0' },
+                'device_environment':   {   'manufacturer': 'Apple', 'model': 'iphone9,1',
+                                            'carrier_name': 'Appalachian Wireless' if i % 2 else 'Verizon Wireless'    },
+                'tests':                {   'download': {   'successes': 1, 'throughput': rng.randint(100000, 9000000),
+                                                            'local_datetime': timestamp or '2018-10-%02dT12:%02d:00Z' % (1 + i % 28, i % 60),
+                                                            'target': 'n2-atl', 'environment': env  },
+                                            'upload':   { 'successes': 1, 'throughput': rng.randint(10000, 900000) },
+                                            'latency':  {   'successes': 1, 'round_trip_time': rng.randint(10000, 90000),
+                                                            'jitter': 1200, 'packet_loss': 0.5  }   }   }
+
+
+def write_exports(path, legacy=20, modern=20, timestamps=None, minutes=60, seed=1):
+    """
+    Writes legacy and modern export files to folders in path, returns list of folders -- legacy exports
+    cycle through minutes and modern exports through timestamps if given (e.g. to produce ties)
+    """
+    rng     =   random.Random(seed)
+    folders =   [ os.path.join(str(path), 'legacy'), os.path.join(str(path), 'modern') ]
+    for folder in folders:
+        os.makedirs(folder)
+
+    for i in range(max(legacy, modern)):
+        if i < legacy:
+            with open(os.path.join(folders[0], 'l{0:03d}.json'.format(i)), 'w') as fp:
+                json.dump(make_legacy_export(i, rng, minutes=minutes), fp)
+        if i < modern:
+            timestamp = timestamps[i % len(timestamps)] if timestamps else None
+            with open(os.path.join(folders[1], 'm{0:03d}.json'.format(i)), 'w') as fp:
+                json.dump(make_modern_export(i, rng, timestamp=timestamp), fp)
+    return folders
+
+
+def start_cli(args, cwd):
+    """
+    Returns process running the mba2mfii command with args in folder cwd (where log files are written)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ ROOT ] + [ p for p in [ os.environ.get('PYTHONPATH') ] if p ]))
+    return subprocess.Popen([ sys.executable, '-c', 'from mba2mfii.scripts import cli; cli()' ] + [ str(arg) for arg in args ],
+                            cwd=str(cwd), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def run_cli(args, cwd):
+    """
+    Returns tuple of (exit status, output) of the mba2mfii command run with args in folder cwd
+    """
+    process     =   start_cli(args, cwd)
+    output, _   =   process.communicate()
+    return process.returncode, output.decode('utf-8', 'replace')
+
+
+@pytest.fixture
+def exports(tmp_path):
+    """
+    Returns list of folders of synthetic legacy and modern exports
+    """
+    return write_exports(tmp_path / 'exports')
+
+
+#
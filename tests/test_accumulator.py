@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of output spilled to disk under a memory budget (--max-memory)
+"""
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.accumulator import SpillStore
+
+from conftest import run_cli, write_exports
+
+
+def test_iter_merged_matches_stable_sort():
+    """
+    Merging spilled runs (with ties across block boundaries) orders rows as a stable sort of all rows
+    """
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        store           =   SpillStore(1, block_rows=int(rng.integers(1, 8)))
+        keys, ids, n    =   [], [], 0
+        for _ in range(int(rng.integers(1, 6))):
+            m   =   int(rng.integers(0, 20))
+            run =   np.sort(rng.integers(0, 6, m)).astype(np.int64)
+            if m:
+                store.spill(pd.DataFrame({ 'id': np.arange(n, n + m) }), run)
+            keys.append(run)
+            ids.append(np.arange(n, n + m))
+            n += m
+
+        m           =   int(rng.integers(0, 10))
+        pending     =   np.sort(rng.integers(0, 6, m)).astype(np.int64)
+        keys.append(pending)
+        ids.append(np.arange(n, n + m))
+
+        merged      =   [ df.id.values for df in store.iter_merged(pd.DataFrame({ 'id': np.arange(n, n + m) }), pending) ]
+        expected    =   np.concatenate(ids)[np.argsort(np.concatenate(keys), kind='stable')]
+        store.cleanup()
+        assert np.array_equal(np.concatenate(merged).astype(np.int64) if merged else merged, expected)
+
+
+def test_max_memory_output_identical(tmp_path):
+    """
+    Output (and rejected rows) spilled over several runs with equal timestamps are byte-identical to
+    a run keeping all rows in memory
+    """
+    folders = write_exports(tmp_path / 'exports', legacy=20, modern=40, minutes=3,
+                            timestamps=[ '2018-10-02T12:00:00Z', '2018-10-01T08:30:00Z', '2018-10-02T12:00:00Z' ])
+
+    outputs = {}
+    for label, options in [ ('memory', []), ('spilled', [ '--max-memory', '1K' ]) ]:
+        output          =   tmp_path / '{0}.csv'.format(label)
+        status, log     =   run_cli(folders + [ output, '--clobber', '--validate' ] + options, tmp_path)
+        assert status == 0, log
+        outputs[label]  =   ( output.read_bytes(), (tmp_path / '{0}.rejected.csv'.format(label)).read_bytes(), log )
+
+    assert outputs['spilled'][2].count('spilled ') > 2
+    assert outputs['spilled'][0] == outputs['memory'][0]
+    assert outputs['spilled'][1] == outputs['memory'][1]
+    assert len(outputs['memory'][0].splitlines()) > 1
+
+
+#
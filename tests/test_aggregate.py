@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of hex-grid aggregation of converted measurements (--aggregate)
+"""
+
+from conftest import run_cli
+
+
+def test_compressed_aggregate_not_clobbered(tmp_path, exports):
+    """
+    An existing compressed aggregates file is kept without --clobber, checking the filename as written
+    """
+    status, log = run_cli(exports + [ tmp_path / 'first.csv', '--compress', 'gzip', '--aggregate', tmp_path / 'agg.csv' ], tmp_path)
+    assert status == 0, log
+    written = (tmp_path / 'agg.csv.gz').read_bytes()
+
+    status, log = run_cli(exports + [ tmp_path / 'second.csv', '--compress', 'gzip', '--aggregate', tmp_path / 'agg.csv',
+                                        '--hex-size', 500 ], tmp_path)
+    assert status == 0, log
+    assert 'skipping aggregation to file:{0} -- file exists'.format(tmp_path / 'agg.csv.gz') in log
+    assert (tmp_path / 'agg.csv.gz').read_bytes() == written
+    assert not (tmp_path / 'agg.csv').exists()
+
+
+#
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of as-of joins of timestamped values onto event timestamps
+"""
+
+import random
+
+import pytest
+
+from mba2mfii.tools.asof import AsOfIndex
+
+
+def expected_value(event_dict, timestamp, direction='nearest', tolerance=None):
+    """
+    Returns value of event_dict matching timestamp by scanning its keys, else None
+    """
+    if direction == 'nearest':
+        # Stable sort by distance, as SKLegacyExport.get_value_by_timestamp() did before AsOfIndex
+        keys = sorted(event_dict.keys(), key=lambda key: abs(timestamp - key))
+    elif direction == 'backward':
+        keys = sorted((key for key in event_dict if key <= timestamp), reverse=True)
+    else:
+        keys = sorted(key for key in event_dict if key >= timestamp)
+
+    keys = [ key for key in keys if tolerance is None or abs(timestamp - key) <= tolerance ]
+    return event_dict[keys[0]] if keys else None
+
+
+@pytest.mark.parametrize('direction', [ 'nearest', 'backward', 'forward' ])
+@pytest.mark.parametrize('tolerance', [ None, 0, 3 ])
+def test_lookup_matches_scan(direction, tolerance):
+    """
+    Matches of each direction and tolerance equal those of scanning the dict, including ties between
+    equally distant timestamps resolving to the one that came first in the dict
+    """
+    rng = random.Random(1)
+    for _ in range(300):
+        keys        =   rng.sample(range(0, 40, rng.choice([ 1, 2, 4 ])), rng.randint(0, 8))
+        event_dict  =   { key: 'v{0}'.format(key) for key in keys }
+        timestamps  =   [ rng.randint(-5, 45) for _ in range(10) ]
+
+        index = AsOfIndex(event_dict)
+        assert index.get(timestamps, direction=direction, tolerance=tolerance) == \
+                [ expected_value(event_dict, t, direction, tolerance) for t in timestamps ]
+
+
+def test_nearest_tie_break():
+    """
+    A timestamp halfway between two keys matches the key that came first in the dict
+    """
+    assert AsOfIndex({ 10: 'a', 20: 'b' }).get([ 15 ]) == [ 'a' ]
+    assert AsOfIndex({ 20: 'b', 10: 'a' }).get([ 15 ]) == [ 'b' ]
+
+
+def test_default_and_invalid_direction():
+    """
+    Unmatched timestamps (and any timestamp of an empty index) return default, unknown directions raise
+    """
+    index = AsOfIndex({ 10: 'a' })
+    assert index.get([ 5, 10, 15 ], direction='backward', default='-') == [ '-', 'a', 'a' ]
+    assert index.get([ 5, 10, 15 ], direction='forward', default='-') == [ 'a', 'a', '-' ]
+    assert index.get([ 8, 13 ], tolerance=2, default='-') == [ 'a', '-' ]
+    assert AsOfIndex({}).get([ 1, 2 ], default='-') == [ '-', '-' ]
+    with pytest.raises(ValueError):
+        index.lookup([ 1 ], direction='sideways')
+
+
+#
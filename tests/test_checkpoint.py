@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of checkpointed conversion results resumed by later runs (--checkpoint, --resume)
+"""
+
+import os
+import re
+import shutil
+
+from mba2mfii.checkpoint import Checkpoint
+
+from conftest import ROOT, run_cli, write_exports
+
+
+def get_resumed(log):
+    """
+    Returns number of input files resumed from checkpoint logged by a run
+    """
+    return int(re.search(r'(\d+) input files resumed', log).group(1))
+
+
+def test_resume_from_other_folder(tmp_path):
+    """
+    Input files given by relative paths are resumed from another working directory, and output is identical
+    """
+    write_exports(tmp_path / 'data', legacy=5, modern=5)
+    (tmp_path / 'data' / 'run').mkdir()
+    checkpoint = str(tmp_path / 'state')
+
+    status, log = run_cli([ 'legacy', 'modern', tmp_path / 'first.csv', '--checkpoint', checkpoint ], tmp_path / 'data')
+    assert status == 0, log
+
+    status, log = run_cli([ os.path.join('..', 'legacy'), os.path.join('..', 'modern'), tmp_path / 'second.csv',
+                            '--checkpoint', checkpoint, '--resume' ], tmp_path / 'data' / 'run')
+    assert status == 0, log
+    assert get_resumed(log) == 10
+    assert (tmp_path / 'second.csv').read_bytes() == (tmp_path / 'first.csv').read_bytes()
+
+
+def test_reference_data_changed(tmp_path):
+    """
+    A checkpoint made with other reference data (e.g. another --reference-dir) is not resumed
+    """
+    folders     =   write_exports(tmp_path / 'data', legacy=3, modern=3)
+    checkpoint  =   str(tmp_path / 'state')
+    args        =   folders + [ tmp_path / 'out.csv', '--clobber', '--checkpoint', checkpoint, '--resume' ]
+
+    status, log = run_cli(args, tmp_path)
+    assert status == 0, log
+    status, log = run_cli(args, tmp_path)
+    assert get_resumed(log) == 6
+
+    references = tmp_path / 'references'
+    references.mkdir()
+    shutil.copy(os.path.join(ROOT, 'mba2mfii', 'pkg_data', 'handsets-10oct2018.csv'), str(references / 'handsets-01jan2019.csv'))
+    status, log = run_cli(args + [ '--reference-dir', references ], tmp_path)
+    assert status == 0, log
+    assert 'made with different version or conversion arguments' in log
+    assert get_resumed(log) == 0
+
+    # Same folder, changed file
+    status, log = run_cli(args + [ '--reference-dir', references ], tmp_path)
+    assert get_resumed(log) == 6
+    with open(str(references / 'handsets-01jan2019.csv'), 'a') as fp:
+        fp.write('999,4,Maker,M1,Phone,"Code1,1"\n')
+    status, log = run_cli(args + [ '--reference-dir', references ], tmp_path)
+    assert 'different mba2mfii version:' in log
+    assert get_resumed(log) == 0
+
+
+def test_package_version_changed(tmp_path):
+    """
+    A checkpoint saved by another mba2mfii version is not resumed
+    """
+    filename = str(tmp_path / 'export.json')
+    with open(filename, 'w') as fp:
+        fp.write('{}')
+
+    checkpoint = Checkpoint(str(tmp_path / 'state'), references='abc')
+    checkpoint.add(filename, 'result')
+    checkpoint.save()
+
+    assert Checkpoint(str(tmp_path / 'state'), references='abc', resume=True).is_completed(filename)
+    assert not Checkpoint(str(tmp_path / 'state'), references='def', resume=True).is_completed(filename)
+
+    checkpoint.package = '0.0.1'
+    checkpoint.save()
+    assert not Checkpoint(str(tmp_path / 'state'), references='abc', resume=True).is_completed(filename)
+
+
+#
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of JSON parsing backends and post-parse conversion against json.load(fp, object_hook=json_decode)
+"""
+
+import os
+import json
+import random
+
+import pytest
+
+from mba2mfii.api import SKFileExport
+from mba2mfii.tools import get_json_backend, json_coerce, json_decode, json_parse_text
+
+from conftest import write_exports
+
+
+def get_backends():
+    """
+    Returns list of installed JSON backends, skipping others
+    """
+    backends = []
+    for name in [ 'json', 'orjson' ]:
+        try:
+            get_json_backend(name)
+        except ValueError:
+            backends.append(pytest.param(name, marks=pytest.mark.skip(reason='{0} not installed'.format(name))))
+        else:
+            backends.append(name)
+    return backends
+
+
+def make_value(rng, depth=0):
+    """
+    Returns random JSON value nested up to 4 levels, with strings converted by json_decode (numeric,
+    boolean) and not converted
+    """
+    kind = rng.randrange(6 if depth < 4 else 4)
+    if kind == 0:
+        return rng.choice([ '1', '2.0', '-3.50', '1e3', '0.1', '007', 'NaN', '1_000', ' 4 ', '2.5e-3', '' ])
+    elif kind == 1:
+        return rng.choice([ 'true', 'False', 'yes', 'off', 'y', 'n', '1', 'on', 'text', 'N/A', 'iPhone9,1' ])
+    elif kind == 2:
+        return rng.choice([ 0, 1, -7, 2.0, 2.5, -0.0, 1e20, 123456789012, 0.1 ])
+    elif kind == 3:
+        return rng.choice([ None, True, False ])
+    elif kind == 4:
+        return [ make_value(rng, depth + 1) for _ in range(rng.randrange(4)) ]
+    return { 'k{0}'.format(i): make_value(rng, depth + 1) for i in range(rng.randrange(4)) }
+
+
+def typed(obj):
+    """
+    Returns obj with every scalar paired with its type, so 2 and 2.0 (or Decimal) compare unequal
+    """
+    if isinstance(obj, dict):
+        return { k: typed(v) for k, v in obj.items() }
+    elif isinstance(obj, list):
+        return [ typed(v) for v in obj ]
+    return ( type(obj).__name__, repr(obj) )
+
+
+def outcome(decode, text):
+    """
+    Returns typed values decoded from text, else type of exception raised (e.g. by nested 'NaN' strings)
+    """
+    try:
+        return typed(decode(text))
+    except Exception as e:
+        return type(e).__name__
+
+
+@pytest.mark.parametrize('backend', get_backends())
+def test_json_coerce_matches_object_hook(backend):
+    """
+    Parsing with any backend then json_coerce() gives the same values and types as the object_hook
+    decoding (or raises the same error), including values nested several dicts deep
+    """
+    rng = random.Random(1)
+    for _ in range(5000):
+        text = json.dumps(make_value(rng) if rng.random() < 0.2 else
+                            { 'k{0}'.format(i): make_value(rng, 1) for i in range(rng.randrange(1, 5)) })
+        assert outcome(lambda text: json_coerce(json_parse_text(text, backend=backend)), text) == \
+                outcome(lambda text: json.loads(text, object_hook=json_decode), text), text
+
+
+@pytest.mark.parametrize('backend', get_backends())
+def test_project_fields_matches_full_decode(tmp_path, backend):
+    """
+    Exports converted from projected fields (or default conversion of export fields only) give the same
+    rows as exports fully decoded by the object_hook
+    """
+    folders = write_exports(tmp_path / 'exports', legacy=10, modern=10)
+    for folder in folders:
+        for name in sorted(os.listdir(folder)):
+            filename = os.path.join(folder, name)
+            with open(filename, 'r') as fp:
+                data = json.load(fp, object_hook=json_decode)
+
+            full        =   SKFileExport(filename, json_backend=backend)
+            full.export =   type(full.export)(data=data[0] if isinstance(data, list) else data)
+            expected    =   full.to_dataframe()
+
+            for project in [ True, False ]:
+                df = SKFileExport(filename, json_backend=backend, project_fields=project).to_dataframe()
+                assert df.astype(str).equals(expected.astype(str)), (filename, project)
+                assert list(df.dtypes.astype(str)) == list(expected.dtypes.astype(str)), (filename, project)
+
+
+#
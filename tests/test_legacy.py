@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of conversion of legacy app exports
+"""
+
+import json
+import random
+
+from mba2mfii.api import SKFileExport
+
+from conftest import make_legacy_export
+
+
+def test_falsy_values_replaced_by_default(tmp_path):
+    """
+    Falsy values joined onto test events are replaced by the column default, as before the as-of
+    engine, e.g. a download of 0 bytes/sec is written as 0 (not 0.0) and an empty target as 'N/A'
+    """
+    data = make_legacy_export(0, random.Random(1))
+    for test in data[0]['tests']:
+        if test['type'] == 'JHTTPGETMT':
+            test['bytes_sec'], test['target'] = '0', ''
+            del test['target_ipaddress']
+        elif test['type'] == 'JUDPLATENCY':
+            test['lost_packets'] = '0'
+
+    filename = str(tmp_path / 'export.json')
+    with open(filename, 'w') as fp:
+        json.dump(data, fp)
+
+    df = SKFileExport(filename).to_dataframe()
+    assert len(df) == 2
+    assert df.download_speed.to_csv(index=False, header=False).split() == [ '0', '0' ]
+    assert list(df.measurement_server_location) == [ 'N/A', 'N/A' ]
+
+    # Extended columns keep falsy values, e.g. 0% packet loss
+    extended = SKFileExport(filename).to_dataframe(extended=True)
+    assert extended[df.columns].equals(df)
+    assert list(extended.packet_loss) == [ 0.0, 0.0 ]
+
+
+#
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of provider and device detection of modern app exports
+"""
+
+from mba2mfii.benchmarks import make_export, make_runtime
+
+
+def test_apple_device_code_detected(tmp_path):
+    """
+    Apple device codes as reported by modern exports (e.g. 'iPhone9,1') match the handsets device_code
+    column whatever their case
+    """
+    runtime, device_ids = make_runtime(100, str(tmp_path))
+    for code in [ 'iPhone9,1', 'iphone9,1', 'IPHONE9,1' ]:
+        export = make_export('modern', 'apple', runtime)
+        export.data['device_environment']['model'] = code
+        assert export.get_device_id() == device_ids['apple']
+
+
+#
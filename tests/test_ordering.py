@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ordering output chunks by timestamp with per-chunk sorted runs
+"""
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.tools.ordering import get_sort_keys, order_chunks
+
+
+def test_descending_missing_last():
+    """
+    Chunks ordered by descending sort keys match a stable pandas sort_values(), with missing timestamps
+    last in their original order
+    """
+    rng = np.random.RandomState(1)
+    for _ in range(200):
+        chunks = []
+        for size in rng.randint(0, 12, rng.randint(1, 6)):
+            chunk = pd.Series([ None if rng.rand() < 0.2 else int(value) for value in rng.randint(0, 8, size) ], dtype='Int64')
+            # Some chunks already in order, as from time-ordered input files
+            if rng.rand() < 0.5:
+                chunk = chunk.sort_values(ascending=False, kind='mergesort', na_position='last')
+            chunks.append(chunk)
+
+        epoch       =   pd.concat(chunks, ignore_index=True)
+        order       =   order_chunks([ get_sort_keys(chunk.values, ascending=False) for chunk in chunks ])
+        result      =   epoch if order is None else epoch.take(order)
+        expected    =   epoch.sort_values(ascending=False, kind='mergesort', na_position='last')
+
+        assert list(result.index) == list(expected.index)
+
+
+def test_sort_keys():
+    """
+    Sort keys negate epoch seconds if descending and place missing values last either way
+    """
+    epoch = pd.array([ 5, None, -3, 0 ], dtype='Int64')
+    assert list(np.argsort(get_sort_keys(epoch, ascending=True), kind='stable')) == [ 2, 3, 0, 1 ]
+    assert list(np.argsort(get_sort_keys(epoch, ascending=False), kind='stable')) == [ 0, 3, 2, 1 ]
+
+
+#
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of pipelined conversion stages
+"""
+
+import random
+import threading
+import time
+
+import pytest
+
+from mba2mfii.pipeline import Pipeline, Stage
+
+
+def test_in_order_with_errors():
+    """
+    The sink receives every key in input order, with the exception of the stage that failed on it,
+    later stages skipping failed items
+    """
+    rng     =   random.Random(1)
+    later   =   []
+
+    def decode(key, value):
+        time.sleep(rng.random() * 0.002)
+        if key % 7 == 3:
+            raise ValueError('cannot decode:%s' % key)
+        return key * 2
+
+    def convert(key, value):
+        time.sleep(rng.random() * 0.002)
+        later.append(key)
+        if key % 11 == 5:
+            raise KeyError(key)
+        return value + 1
+
+    received    =   []
+    pipeline    =   Pipeline([ Stage('decode', decode, workers=3), Stage('convert', convert, workers=4) ], capacity=4)
+    pipeline.run(range(100), lambda key, value, e: received.append((key, value, e)))
+
+    assert [ key for key, _, _ in received ] == list(range(100))
+    for key, value, e in received:
+        if key % 7 == 3:
+            assert isinstance(e, ValueError) and value is None and key not in later
+        elif key % 11 == 5:
+            assert isinstance(e, KeyError) and value is None
+        else:
+            assert e is None and value == key * 2 + 1
+
+    stats = dict((stats['stage'], stats['items']) for stats in pipeline.get_stats())
+    assert stats == { 'decode': 100, 'convert': 100, 'sink': 100 }
+
+
+def test_sink_error_stops_workers():
+    """
+    An exception raised by the sink stops the pipeline, with no worker threads left running
+    """
+    def sink(key, value, e):
+        if key == 10:
+            raise RuntimeError('sink failed')
+
+    before      =   threading.active_count()
+    pipeline    =   Pipeline([ Stage('decode', lambda key, value: key, workers=2) ], capacity=2)
+    with pytest.raises(RuntimeError):
+        pipeline.run(range(1000), sink)
+    assert threading.active_count() == before
+
+
+#
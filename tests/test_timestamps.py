@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of vectorized parsing of measurement timestamps
+"""
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.tools.timestamps import parse_fixed, parse_timestamps, to_epoch_array
+
+
+values  =   [   '2018-10-20T12:19:00Z', '1970-01-01T00:00:00Z', '2016-02-29T23:59:59Z', '2099-12-31T00:00:01Z',
+                # Valid ISO 8601 variants parsed by pandas only
+                '2018-10-20T12:19:00.500Z', '2018-10-20T08:19:00-04:00', '2018-10-20T14:19:00+02:00', '2018-10-20T12:19:00',
+                # Malformed
+                '2017-02-29T00:00:00Z', '2018-13-01T00:00:00Z', '2018-10-20T24:00:00Z', '2018-10-20 12:19:00Z',
+                '2018-10-20T12:19:00ZZ', '2018-1O-20T12:19:00Z', '', 'N/A', None, np.nan   ]
+
+
+def to_datetime(values):
+    """
+    Returns list of epoch seconds (None if unparsable) of values parsed individually by pandas
+    """
+    epoch = []
+    for value in values:
+        try:
+            parsed = pd.to_datetime(value, format='ISO8601', utc=True) if isinstance(value, str) else None
+        except (TypeError, ValueError):
+            parsed = None
+        epoch.append(None if parsed is None or parsed is pd.NaT else int(parsed.value // 10 ** 9))
+    return epoch
+
+
+def test_parse_fixed_matches_pandas():
+    """
+    Fixed-width parsing accepts only timestamp_format values, with the epoch seconds pandas gives
+    """
+    epoch, valid = parse_fixed(values)
+    assert list(valid) == [ True ] * 4 + [ False ] * (len(values) - 4)
+    assert list(epoch[valid]) == to_datetime(values[:4])
+    assert not epoch[~valid].any()
+
+    # Values not encodable as fixed-width bytes leave every value to pandas
+    assert not parse_fixed(values[:4] + [ u'2018-10-20T12:19:00\u00e9' ])[1].any()
+
+
+def test_parse_timestamps_mixed_offsets():
+    """
+    Values in other ISO 8601 variants (e.g. UTC offsets) fall back to pandas, malformed values are not parsed
+    """
+    epoch, valid    =   parse_timestamps(values)
+    expected        =   to_datetime(values)
+    assert [ int(e) if v else None for e, v in zip(epoch, valid) ] == expected
+    assert expected[5] == expected[6] == expected[0]
+    assert list(to_epoch_array(values).isna()) == [ value is None for value in expected ]
+
+    epoch, valid    =   parse_timestamps(values[:8] + [ u'2018-10-20T12:19:00\u00e9' ])
+    assert list(valid) == [ True ] * 8 + [ False ]
+    assert [ int(e) for e in epoch[:8] ] == expected[:8]
+
+
+#
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of vectorized pre-write validation of output rows
+"""
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.validation import Validator
+
+
+def make_rows():
+    """
+    Returns pandas DataFrame of output rows, the first valid and each other failing known checks
+    """
+    return pd.DataFrame({   'latitude':                     [ 40.5, 95.0, 0.0, 40.5, np.nan, 40.5 ],
+                            'longitude':                    [ -75.5, -75.5, 0.0, -75.5, -75.5, -75.5 ],
+                            'timestamp':                    [ '2018-10-01T12:00:00Z' ] * 5 + [ None ],
+                            'provider_id':                  [ 4, 4, 4, None, 4, 4 ],
+                            'device_id':                    [ 26, 26, 26, 26, 26, 26 ],
+                            'download_speed':               [ 12.5, 12.5, 12.5, 0.0, 12.5, None ],
+                            'latency':                      [ 30, 30, 30, 30, 20000, 30 ],
+                            'signal_strength':              [ -90, -90, -90, -90, -90, -10 ],
+                            'measurement_server_location':  [ 'n1-dallas', 'n1-dallas', 'N/A', 'n1-dallas', None, 'n1-dallas' ],
+                            'device_imei':                  [ '123456789012345', None, '123456789012345', '12345', None, None ]     })
+
+
+def test_rejected_reasons():
+    """
+    Rejected rows list every check they fail, in check order, and valid rows keep their order
+    """
+    valid, rejected, masks = Validator().split(make_rows())
+
+    assert list(valid.index) == [ 0 ]
+    assert list(rejected.index) == [ 1, 2, 3, 4, 5 ]
+    assert list(rejected.reasons) == [
+        'invalid_latitude',
+        'null_island_coordinates;missing_measurement_server_location',
+        'missing_provider_id;invalid_download_speed;invalid_device_imei',
+        'missing_latitude;invalid_latency;missing_measurement_server_location',
+        'missing_timestamp;missing_download_speed;invalid_signal_strength' ]
+    assert len(masks) == len(set(reason for reason, _ in masks))
+
+
+def test_require_imei():
+    """
+    Rows without Device IMEI are rejected only if required, and counts match rejected rows
+    """
+    df                  =   make_rows().iloc[:2].assign(latitude=40.5)
+    valid, rejected     =   Validator().validate(df)
+    assert len(valid) == 2 and rejected.empty and list(rejected.columns) == list(df.columns) + [ 'reasons' ]
+
+    valid, rejected, masks = Validator(require_imei=True).split(df)
+    assert list(valid.index) == [ 0 ]
+    assert list(rejected.reasons) == [ 'missing_device_imei' ]
+    assert dict((reason, int(mask.sum())) for reason, mask in masks)['missing_device_imei'] == 1
+
+
+#
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of batch mode with several local worker processes sharing a work queue folder (--queue)
+"""
+
+import os
+import shutil
+import time
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.accumulator import SpillStore, concat_frames, write_blocks
+from mba2mfii.workqueue import WorkQueue
+
+from conftest import run_cli, start_cli, write_exports
+
+
+def test_workers_match_single_process(tmp_path, exports):
+    """
+    Output merged from chunks converted by several concurrent workers is identical to a single-process run
+    """
+    status, log = run_cli(exports + [ tmp_path / 'single.csv', '--clobber', '--validate' ], tmp_path)
+    assert status == 0, log
+
+    output      =   tmp_path / 'queued.csv'
+    workers     =   [ start_cli(exports + [ output, '--clobber', '--validate', '--queue', tmp_path / 'queue', '--queue-chunk', 3 ],
+                                tmp_path) for _ in range(4) ]
+    logs        =   [ worker.communicate()[0].decode('utf-8', 'replace') for worker in workers ]
+    assert [ worker.returncode for worker in workers ] == [ 0 ] * len(workers), logs
+
+    # Every chunk was converted exactly once, and one worker merged
+    completed = [ line for log in logs for line in log.splitlines() if 'completed chunk:' in line ]
+    assert len(completed) == len(os.listdir(str(tmp_path / 'queue' / 'done'))) == 14
+    assert sum('rows from partial outputs' in log for log in logs) == 1
+
+    assert output.read_bytes() == (tmp_path / 'single.csv').read_bytes()
+    assert (tmp_path / 'queued.rejected.csv').read_bytes() == (tmp_path / 'single.rejected.csv').read_bytes()
+
+
+def test_dedup_across_chunks(tmp_path):
+    """
+    With --dedup, duplicates converted in different chunks are dropped while merging, as in a single-process run
+    """
+    folders = write_exports(tmp_path / 'exports', legacy=6, modern=6)
+    shutil.copytree(folders[0], str(tmp_path / 'exports' / 'copy'))
+    inputs  =   folders + [ tmp_path / 'exports' / 'copy' ]
+
+    status, log = run_cli(inputs + [ tmp_path / 'single.csv', '--dedup', 'hash' ], tmp_path)
+    assert status == 0, log
+    status, log = run_cli(inputs + [ tmp_path / 'queued.csv', '--dedup', 'hash', '--queue', tmp_path / 'queue', '--queue-chunk', 4 ], tmp_path)
+    assert status == 0, log
+    assert 'dropped 0 duplicate rows' not in log
+
+    assert (tmp_path / 'queued.csv').read_bytes() == (tmp_path / 'single.csv').read_bytes()
+    assert len((tmp_path / 'single.csv').read_bytes().splitlines()) == 1 + 6 * 2 + 6
+
+
+def test_failed_chunk_exit_status(tmp_path):
+    """
+    Workers exit with non-zero status when a chunk fails, and merge once it is fixed and converted again
+    """
+    folders = write_exports(tmp_path / 'exports', legacy=4, modern=4)
+    broken  =   os.path.join(folders[1], 'm002.json')
+    with open(broken, 'r') as fp:
+        text = fp.read()
+    with open(broken, 'w') as fp:
+        fp.write(text[:10])
+
+    args            =   folders + [ tmp_path / 'out.csv', '--queue', tmp_path / 'queue', '--queue-chunk', 2 ]
+    status, log     =   run_cli(args, tmp_path)
+    assert status != 0, log
+    assert not (tmp_path / 'out.csv').exists()
+
+    status, log     =   run_cli(args + [ '--queue-mode', 'merge' ], tmp_path)
+    assert status != 0, log
+
+    with open(broken, 'w') as fp:
+        fp.write(text)
+    os.remove(str(tmp_path / 'queue' / 'failed' / 'chunk-000003.json'))
+    status, log     =   run_cli(args, tmp_path)
+    assert status == 0, log
+    assert len((tmp_path / 'out.csv').read_bytes().splitlines()) == 1 + 4 * 2 + 4
+
+
+def test_portable_parts(tmp_path):
+    """
+    Partial outputs are written as JSON blocks with .npy keys (not pickles), read back with the same
+    values and dtypes
+    """
+    df = pd.DataFrame({ 'latitude':         pd.Series([ Decimal('38.12345678'), 1.5, None ], dtype=object),
+                        'download_speed':   [ 0.1 + 0.2, np.nan, 3.0 ],
+                        'latency':          [ 1, 2, 3 ],
+                        'device_id':        pd.Series([ 75, None, 2 ], dtype='Int32'),
+                        'provider_name':    pd.Categorical([ 'b', None, 'a' ]),
+                        'timestamp':        [ '2018-10-01T00:00:00Z', None, 'x' ]  })
+    keys = np.array([ -3, -2, np.iinfo(np.int64).max ], dtype=np.int64)
+
+    blocks = write_blocks(df, keys, str(tmp_path), block_rows=2, portable=True)
+    assert sorted(os.listdir(str(tmp_path))) == [ 'run-000000-000000.json', 'run-000000-000000.npy',
+                                                  'run-000000-000001.json', 'run-000000-000001.npy' ]
+
+    store = SpillStore(None)
+    store.attach(str(tmp_path), rows=len(df))
+    assert store.runs == [ blocks ]
+    frames, read = zip(*store.iter_run(blocks))
+    read_df = concat_frames(list(frames))
+    assert list(read_df.dtypes) == list(df.dtypes)
+    assert read_df.astype(object).where(read_df.notnull(), None).values.tolist() == \
+            df.astype(object).where(df.notnull(), None).values.tolist()
+    assert read_df.latitude[0] == Decimal('38.12345678')
+    assert np.concatenate(read).tolist() == keys.tolist()
+
+
+def test_claim_heartbeat(tmp_path):
+    """
+    Claims refreshed by their worker are not taken over as stale, unrefreshed claims are
+    """
+    files   =   [ 'a.json', 'b.json' ]
+    first   =   WorkQueue(str(tmp_path), chunk_files=1, stale=60, worker='first')
+    second  =   WorkQueue(str(tmp_path), chunk_files=1, stale=60, worker='second')
+    first.create(files)
+    second.create(files)
+
+    assert first.claim() == 0
+    assert first.claim() == 1
+
+    # Both claims look idle for two minutes, then the first worker refreshes chunk 0 only
+    claims = [ first.get_path('claims', chunk, '.lock') for chunk in range(2) ]
+    for path in claims:
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    first.touch(0)
+
+    assert second.claim() == 1
+    assert second.claim() is None
+
+
+def test_crashed_worker_taken_over(tmp_path):
+    """
+    Chunks left claimed by crashed workers are taken over once stale (by default, or after --queue-stale
+    seconds), workers with nothing left to claim waiting for them, and output is merged
+    """
+    folders = write_exports(tmp_path / 'exports', legacy=3, modern=3)
+    for name, age, args in [ ('old', 120, []), ('fresh', 0, [ '--queue-stale', 2 ]) ]:
+        claims = tmp_path / name / 'claims'
+        claims.mkdir(parents=True)
+        (claims / 'chunk-000000.lock').write_text(u'{"worker": "crashed"}')
+        os.utime(str(claims / 'chunk-000000.lock'), (time.time() - age, time.time() - age))
+
+        output      =   tmp_path / '{0}.csv'.format(name)
+        status, log =   run_cli(folders + [ output, '--queue', tmp_path / name, '--queue-chunk', 2 ] + args, tmp_path)
+        assert status == 0, log
+        assert 'took over claim of chunk:1' in log
+        assert ('waiting for 1 chunks claimed by other workers' in log) == (age == 0)
+        assert len(output.read_bytes().splitlines()) == 1 + 3 * 2 + 3
+
+
+#
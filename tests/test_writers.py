@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of output writers
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from mba2mfii.writers import ShardWriter, SQLiteWriter
+
+from conftest import run_cli
+
+
+def make_frame(rows=50, seed=1):
+    """
+    Returns pandas DataFrame of output-like rows of three providers
+    """
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({   'provider_id':      rng.choice([ 4, 70, 71 ], rows),
+                            'device_id':        rng.randint(1, 100, rows),
+                            'timestamp':        [ '2018-10-01T12:{0:02d}:00Z'.format(i % 60) for i in range(rows) ],
+                            'download_speed':   rng.uniform(1, 100, rows).round(6)  })
+
+
+def read_shards(path, manifest):
+    """
+    Returns list of (shard dict, file bytes) of shards listed in manifest
+    """
+    shards = []
+    for shard in manifest['shards']:
+        with open(os.path.join(path, shard['file']), 'rb') as fp:
+            shards.append((shard, fp.read()))
+    return shards
+
+
+def test_shard_limits_and_manifest(tmp_path):
+    """
+    Shards split by provider hold at most max_rows rows and max_bytes bytes, in row order, and the
+    manifest lists their rows, sizes and SHA-256 checksums
+    """
+    df          =   make_frame()
+    header      =   df.iloc[:0].to_csv(index=False).encode('utf-8')
+    manifest    =   ShardWriter(shard_by='provider_id', max_rows=7, max_bytes=250).write(df, str(tmp_path / 'out.csv'))
+
+    with open(str(tmp_path / 'out.manifest.json'), 'r') as fp:
+        assert json.load(fp) == manifest
+    assert manifest['rows'] == len(df)
+
+    for provider_id, group in df.groupby('provider_id'):
+        shards  =   [ (shard, data) for shard, data in read_shards(str(tmp_path), manifest)
+                        if shard['key'] == 'provider_id-{0}'.format(provider_id) ]
+        assert [ shard['file'] for shard, _ in shards ] == [ 'out.provider_id-{0}.{1:04d}.csv'.format(provider_id, i + 1)
+                                                                for i in range(len(shards)) ]
+        assert b''.join(data[len(header):] for _, data in shards) == group.to_csv(index=False, header=False).encode('utf-8')
+
+        for shard, data in shards:
+            assert data.startswith(header)
+            assert 0 < shard['rows'] <= 7
+            assert shard['bytes'] == shard['size'] == len(data) <= 250
+            assert shard['sha256'] == hashlib.sha256(data).hexdigest()
+
+
+def test_shard_compressed_checksums(tmp_path):
+    """
+    Checksums and sizes of compressed shards are of the files on disk, bytes of the uncompressed text
+    """
+    import gzip
+
+    df          =   make_frame()
+    manifest    =   ShardWriter(max_rows=20).write(df, str(tmp_path / 'out.csv.gz'))
+
+    assert [ shard['file'] for shard in manifest['shards'] ] == [ 'out.0001.csv.gz', 'out.0002.csv.gz', 'out.0003.csv.gz' ]
+    assert [ shard['rows'] for shard in manifest['shards'] ] == [ 20, 20, 10 ]
+    for shard, data in read_shards(str(tmp_path), manifest):
+        assert shard['size'] == len(data)
+        assert shard['sha256'] == hashlib.sha256(data).hexdigest()
+        assert shard['bytes'] == len(gzip.decompress(data))
+
+
+def test_sqlite_rerun_does_not_duplicate(tmp_path, exports):
+    """
+    Converting the same exports again into a SQLite database replaces their rows, whatever the dtypes of
+    key columns in each run, e.g. Device ID 75 and 75.0
+    """
+    database = tmp_path / 'out.db'
+    for _ in range(2):
+        status, log = run_cli(exports + [ tmp_path / 'out.csv', '--clobber', '--sqlite', database ], tmp_path)
+        assert status == 0, log
+
+    rows = len((tmp_path / 'out.csv').read_bytes().splitlines()) - 1
+    with sqlite3.connect(str(database)) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0] == rows
+
+    writer  =   SQLiteWriter(str(tmp_path / 'ids.db'))
+    df      =   make_frame(rows=10)
+    writer.write([ df ])
+    writer.write([ df.assign(device_id=df.device_id.astype(float)) ])
+    with sqlite3.connect(str(tmp_path / 'ids.db')) as conn:
+        assert conn.execute('SELECT COUNT(*), SUM(typeof(device_id) = "integer") FROM measurements').fetchone() == (10, 10)
+
+
+def test_sqlite_types_not_from_first_chunk(tmp_path):
+    """
+    Values of columns without a compact dtype are stored as given, even if the first chunk held only
+    missing values or numbers
+    """
+    df  =   make_frame(rows=4)
+    first, second = df.iloc[:2].copy(), df.iloc[2:].copy()
+    first['signal_strength'], second['signal_strength']     =   [ None, None ], [ '-54', 'N/A' ]
+    first['network_type'], second['network_type']           =   [ 1, 2 ], [ 'LTE', '3' ]
+
+    SQLiteWriter(str(tmp_path / 'out.db')).write(iter([ first, second ]))
+    with sqlite3.connect(str(tmp_path / 'out.db')) as conn:
+        rows = conn.execute('SELECT signal_strength, network_type, typeof(download_speed) FROM measurements ORDER BY rowid').fetchall()
+    assert rows == [ (None, 1, 'real'), (None, 2, 'real'), ('-54', 'LTE', 'real'), ('N/A', '3', 'real') ]
+
+
+#